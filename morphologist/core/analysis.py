@@ -9,6 +9,7 @@ import sys
 import six
 
 from morphologist.core.utils import OrderedDict
+from morphologist.core.profiling import profiled
 # CAPSUL
 from capsul.pipeline import pipeline_tools
 from capsul.attributes.completion_engine import ProcessCompletionEngine
@@ -85,6 +86,66 @@ class Analysis(six.with_metaclass(AnalysisMetaClass, object)):
     def list_output_parameters_with_existing_files(self):
         raise NotImplementedError("Analysis is an Abstract class. list_output_parameters_with_existing_files must be redefined.")
 
+    def get_qc_thumbnail_parameter_names(self):
+        ''' role -> name of the parameter of the volumes displayed in QC
+        thumbnails (see morphologist.core.thumbnails)
+        '''
+        return {}
+
+    def get_qc_thumbnail_files(self):
+        ''' role -> filename of the QC thumbnail volumes '''
+        return self.get_state_files(self.get_qc_thumbnail_parameter_names())
+
+    def get_segmentation_statistics_parameter_names(self):
+        ''' role -> name of the parameter of the volumes reduced by the
+        segmentation statistics (see morphologist.core.segmentation_statistics)
+        '''
+        return {}
+
+    def get_segmentation_statistics_files(self):
+        ''' role -> filename of the segmentation statistics volumes '''
+        return self.get_state_files(
+            self.get_segmentation_statistics_parameter_names())
+
+    def get_qc_metrics_parameter_names(self):
+        ''' role -> name of the parameter of the files of the QC metrics
+        (see morphologist.core.qc_metrics)
+        '''
+        return {}
+
+    def get_qc_metrics_files(self):
+        ''' role -> filename of the QC metrics files '''
+        return self.get_state_files(self.get_qc_metrics_parameter_names())
+
+    def get_morphometry_parameter_name(self):
+        ''' name of the parameter of the morphometry table of the subject
+        (see morphologist.core.morphometry), or None
+        '''
+        return None
+
+    def get_morphometry_file(self):
+        ''' filename of the morphometry table of the subject, or None '''
+        parameter_name = self.get_morphometry_parameter_name()
+        if parameter_name is None:
+            return None
+        return self.get_state_files({None: parameter_name}).get(None)
+
+    def get_state_files(self, parameter_names):
+        ''' role -> filename of the parameters of parameter_names (role ->
+        parameter name) which have a file in the saved parameters of the
+        analysis. The pipeline is shared with other analyses: its current
+        values are not used.
+        '''
+        if not self.parameters:
+            return {}
+        state = self.parameters.get('state', {})
+        files = {}
+        for role, parameter_name in six.iteritems(parameter_names):
+            filename = state.get(parameter_name)
+            if isinstance(filename, six.string_types) and filename:
+                files[role] = filename
+        return files
+
     def has_some_results(self, step_ids=None):
         raise NotImplementedError("Analysis is an Abstract class. has_some_results must be redefined.")
 
@@ -239,6 +300,7 @@ class SharedPipelineAnalysis(Analysis):
     def set_parameters(self, subject):
         self.complete_parameters(subject)
 
+    @profiled('analysis.propagate_parameters')
     def propagate_parameters(self):
         if hasattr(self.pipeline, 'current_subject_id') \
                 and self.pipeline.current_subject_id \
@@ -252,6 +314,7 @@ class SharedPipelineAnalysis(Analysis):
     def get_attributes(self, subject):
         raise NotImplementedError("SharedPipelineAnalysis is an Abstract class. get_attributes must be redefined.")
 
+    @profiled('analysis.complete_parameters')
     def complete_parameters(self, subject):
         pipeline = self.pipeline
         if hasattr(pipeline, 'current_subject_id') \
@@ -278,6 +341,7 @@ class SharedPipelineAnalysis(Analysis):
         # mark this subject as the one witht the current parameters.
         pipeline.current_subject_id = subject.id()
 
+    @profiled('analysis.existing_results')
     def existing_results(self, step_ids=None):
         pipeline = self.pipeline
         self.propagate_parameters()
@@ -380,6 +444,15 @@ class SharedPipelineAnalysis(Analysis):
         # optional, but still useful in our context)
         raise NotImplementedError("SharedPipelineAnalysis is an Abstract class. get_output_file_parameter_names must be redefined.")
 
+    def get_output_files(self):
+        ''' parameter name -> filename of the expected output files (see
+        get_output_file_parameter_names), read from the saved parameters
+        '''
+        return self.get_state_files(
+            dict((parameter_name, parameter_name) for parameter_name
+                 in self.get_output_file_parameter_names()))
+
+    @profiled('analysis.has_all_results')
     def has_all_results(self, step_ids=None):
         # here we use the hard-coded outputs list in
         # IntraAnalysisParameterNames since we cannot determine automatically
@@ -44,6 +44,30 @@ class ObjectsManagerMixin(object):
 
     def load_object(self, filename):
         raise NotImplementedError("ObjectsLoaderMixin is an abstract class")
+
+    def load_object_async(self, filename, callback):
+        # backends without asynchronous loading: load now
+        try:
+            backend_object = self.load_object(filename)
+        except LoadObjectError:
+            backend_object = None
+        callback(backend_object, filename)
+
+    def create_volume_preview(self, filename, method='mean'):
+        ''' Write a downsampled version of a big volume, for a quick first
+        display, and return its filename. Returns None if the file is not a
+        big volume, if its preview cannot be built without reading the whole
+        volume, or if the backend does not support previews.
+        '''
+        return None
+
+    def create_mesh_lod(self, filename, max_vertices):
+        ''' Write a decimated version of a big mesh, for a faster display,
+        and return its filename. Returns None if the file is not a mesh of
+        more than max_vertices vertices or if the backend does not support
+        levels of detail.
+        '''
+        return None
     
     def create_point_object(self, coordinates):
         raise NotImplementedError("ObjectsLoaderMixin is an abstract class")
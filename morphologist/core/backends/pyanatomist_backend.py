@@ -1,6 +1,7 @@
 from __future__ import absolute_import
 import os
 import sys
+import numpy as np
 
 import anatomist.direct.api as ana
 from anatomist.cpp.simplecontrols import Simple2DControl, Simple3DControl, \
@@ -12,6 +13,10 @@ from morphologist.core.backends import Backend
 from morphologist.core.backends.mixins \
     import DisplayManagerMixin, ObjectsManagerMixin, LoadObjectError, \
         ColorMap, ViewType
+from morphologist.core import pyramid, meshes
+from morphologist.core.cache import is_derived_file_up_to_date
+from morphologist.core.nifti import is_nifti_filename, NiftiError
+from morphologist.core.volume_access import open_volume
 import six
 
 
@@ -161,6 +166,89 @@ class PyanatomistBackend(Backend, DisplayManagerMixin, ObjectsManagerMixin):
     def load_object_async(cls, filename, callback):
         cls.anatomist.loadObject(filename, asyncCallback=callback)
 
+    @classmethod
+    def create_volume_preview(cls, filename, method='mean'):
+        # called from loading threads: does not use anatomist
+        finder = aims.Finder()
+        if not finder.check(filename) or finder.objectType() != 'Volume':
+            return None
+        dimensions = finder.header()['volume_dimension'][:3]
+        factor = pyramid.downsampling_factor(dimensions)
+        if factor == 1:
+            return None
+        preview_filenames = pyramid.preview_filenames(filename, factor)
+        for preview_filename in preview_filenames:
+            if is_derived_file_up_to_date(preview_filename, filename):
+                return preview_filename
+        # the preview is built from a strided read of a memory mapped
+        # volume: reading a whole (or compressed) volume would take as long
+        # as the full resolution load, which runs meanwhile
+        if not is_nifti_filename(filename) or filename.endswith('.gz'):
+            return None
+        try:
+            nifti_header, data = open_volume(filename)
+        except (IOError, OSError, ValueError, NiftiError):
+            return None
+        array = pyramid.strided_downsample(data, factor, method)
+        slope = nifti_header['scl_slope']
+        if slope != 0 and (slope != 1 or nifti_header['scl_inter'] != 0):
+            array = (array * slope
+                     + nifti_header['scl_inter']).astype(np.float32)
+        preview = aims.Volume(np.asfortranarray(array))
+        header = finder.header()
+        for attribute in ('referentials', 'transformations',
+                          'referential'):
+            if attribute in header:
+                preview.header()[attribute] = header[attribute]
+        voxel_size = list(header['voxel_size'])
+        preview.header()['voxel_size'] \
+            = [size * factor for size in voxel_size[:3]] + voxel_size[3:]
+        for preview_filename in preview_filenames:
+            try:
+                directory = os.path.dirname(preview_filename)
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+                aims.write(preview, preview_filename)
+            except (IOError, OSError, RuntimeError):
+                continue
+            return preview_filename
+        return None
+
+    @classmethod
+    def create_mesh_lod(cls, filename, max_vertices):
+        # called from loading threads: only uses aims
+        finder = aims.Finder()
+        if not finder.check(filename) or finder.objectType() != 'Mesh':
+            return None
+        lod_filenames = meshes.lod_filenames(filename, max_vertices)
+        for lod_filename in lod_filenames:
+            if is_derived_file_up_to_date(lod_filename, filename):
+                return lod_filename
+        mesh = aims.read(filename)
+        vertices = np.asarray(mesh.vertex())
+        if len(vertices) <= max_vertices:
+            return None
+        vertices, polygons = meshes.decimate_mesh(
+            vertices, np.asarray(mesh.polygon()), max_vertices)
+        lod = aims.AimsTimeSurface_3()
+        lod.vertex().assign(vertices)
+        lod.polygon().assign(polygons)
+        lod.updateNormals()
+        for attribute in ('referentials', 'transformations',
+                          'referential'):
+            if attribute in mesh.header():
+                lod.header()[attribute] = mesh.header()[attribute]
+        for lod_filename in lod_filenames:
+            try:
+                directory = os.path.dirname(lod_filename)
+                if not os.path.isdir(directory):
+                    os.makedirs(directory)
+                aims.write(lod, lod_filename)
+            except (IOError, OSError, RuntimeError):
+                continue
+            return lod_filename
+        return None
+
     @classmethod
     def create_point_object(cls, coordinates):
         cross_name = os.path.join(cls.anatomist.anatomistSharedPath(),
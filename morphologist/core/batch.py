@@ -0,0 +1,186 @@
+from __future__ import absolute_import
+import os
+import json
+import multiprocessing
+from collections import OrderedDict
+import six
+
+from morphologist.core.cache import file_stamp
+
+
+def pool_map(function, jobs, processes=None):
+    ''' map function over jobs in a process pool.
+
+    Parameters
+    ----------
+    function: callable
+        module level function (it is pickled)
+    jobs: list
+    processes: int
+        size of the pool (default: number of CPUs). The jobs are run in the
+        current process when only one process is useful.
+    '''
+    jobs = list(jobs)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = min(processes, len(jobs))
+    if processes <= 1:
+        return [function(job) for job in jobs]
+    pool = multiprocessing.Pool(processes)
+    try:
+        # big chunks limit the inter process communication on large studies
+        chunksize = max(1, len(jobs) // (processes * 4))
+        return pool.map(function, jobs, chunksize)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def files_stamps(files):
+    ''' role -> file_stamp of role -> filename '''
+    return dict((role, file_stamp(filename))
+                for role, filename in six.iteritems(files))
+
+
+def stamps_from_json(stamps):
+    ''' files_stamps result from its JSON form (stamps are lists there) '''
+    return dict((role, tuple(stamp) if stamp is not None else None)
+                for role, stamp in six.iteritems(stamps))
+
+
+def existing_files(files, stamps):
+    ''' role -> filename of the files which have a stamp '''
+    return dict((role, filename) for role, filename in six.iteritems(files)
+                if stamps[role] is not None)
+
+
+class SubjectsResultsCache(object):
+    ''' Per subject results of a batch computation over the output files of
+    a study, saved as JSON.
+
+    A result is valid while the (mtime, size) stamps of the files it was
+    computed from are unchanged.
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._entries = None
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = {}
+            try:
+                with open(self.filename) as f:
+                    self._entries = json.load(f)
+            except (IOError, OSError, ValueError):
+                pass
+        return self._entries
+
+    def get(self, subject_id, stamps):
+        ''' Cached result of subject_id, or None if missing or computed from
+        other files
+        '''
+        entry = self._load().get(subject_id)
+        if entry is None or stamps_from_json(entry['stamps']) != stamps:
+            return None
+        return entry['result']
+
+    def put(self, subject_id, stamps, result):
+        self._load()[subject_id] = {'stamps': stamps, 'result': result}
+
+    def keep_only(self, subject_ids):
+        ''' Drop the results of the subjects removed from the study '''
+        entries = self._load()
+        subject_ids = set(subject_ids)
+        for subject_id in list(entries):
+            if subject_id not in subject_ids:
+                del entries[subject_id]
+
+    def save(self):
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'w') as f:
+            json.dump(self._load(), f)
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        os.rename(tmp_filename, self.filename)
+
+
+def _subject_job(job):
+    # process pool job: must stay a module level function
+    function, subject_id, files = job
+    return subject_id, function(files)
+
+
+class SubjectsBatch(object):
+    ''' Per subject results computed from the output files of the subjects
+    of a study, and exported as a table.
+
+    The subjects are processed in a process pool and their results are
+    cached: a subject is only processed again when one of its files has
+    changed. Subclasses define the table and cache filenames, the
+    subject_function (a module level function of role -> filename, wrapped
+    in staticmethod) and write_table.
+    '''
+    table_filename = None
+    cache_filename = None
+    subject_function = None
+
+    def __init__(self, directory):
+        '''
+        Parameters
+        ----------
+        directory: str
+            directory of the exported table and of the cache
+        '''
+        self.directory = directory
+        self._cache = SubjectsResultsCache(
+            os.path.join(directory, self.cache_filename))
+        self.table = OrderedDict()
+
+    @property
+    def table_filepath(self):
+        return os.path.join(self.directory, self.table_filename)
+
+    def update(self, subjects_files, processes=None):
+        ''' Compute the missing or out of date results and export the
+        table.
+
+        Parameters
+        ----------
+        subjects_files: OrderedDict
+            subject_id -> {role: filename}, in the table order
+        processes: int
+            size of the process pool (default: number of CPUs)
+
+        Returns
+        -------
+        computed: list
+            ids of the subjects processed again
+        '''
+        stamps = {}
+        jobs = []
+        for subject_id, files in six.iteritems(subjects_files):
+            stamps[subject_id] = files_stamps(files)
+            if self._cache.get(subject_id, stamps[subject_id]) is None:
+                jobs.append((self.subject_function, subject_id,
+                             existing_files(files, stamps[subject_id])))
+        for subject_id, result in pool_map(_subject_job, jobs, processes):
+            self._cache.put(subject_id, stamps[subject_id], result)
+        self._cache.keep_only(subjects_files)
+        self._cache.save()
+        self.table = OrderedDict(
+            (subject_id, self._cache.get(subject_id, stamps[subject_id]))
+            for subject_id in subjects_files)
+        self._table_updated()
+        self.write_table(self.table_filepath)
+        return [job[1] for job in jobs]
+
+    def _table_updated(self):
+        # hook run before the table is exported
+        pass
+
+    def write_table(self, filename):
+        raise NotImplementedError()
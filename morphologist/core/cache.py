@@ -0,0 +1,168 @@
+from __future__ import absolute_import
+import os
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+# decoded size / file size of gzipped images and meshes
+GZIP_EXPANSION_RATIO = 4
+
+
+def file_stamp(filename):
+    ''' (mtime, size) of a file, or None if it does not exist '''
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (stat.st_mtime, stat.st_size)
+
+
+def derived_filenames(filename, suffix):
+    ''' Candidate locations of a file derived from filename (preview, level
+    of detail...) and cached on disk, in order of preference: a hidden file
+    next to filename, then the temporary directory when the directory of
+    filename is not writable.
+    '''
+    dirname, basename = os.path.split(os.path.abspath(filename))
+    name = '.%s%s' % (basename, suffix)
+    path_hash = hashlib.sha1(
+        os.path.abspath(filename).encode('utf-8')).hexdigest()
+    return [os.path.join(dirname, name),
+            os.path.join(tempfile.gettempdir(), 'morphologist_previews',
+                         '%s_%s' % (path_hash[:16], name[1:]))]
+
+
+def is_derived_file_up_to_date(derived_filename, filename):
+    ''' A derived file is valid if it is newer than its source file '''
+    try:
+        return os.stat(derived_filename).st_mtime \
+            >= os.stat(filename).st_mtime
+    except OSError:
+        return False
+
+
+def estimate_loaded_size(filename, stamp):
+    ''' Rough memory size (in bytes) of an object loaded from filename.
+
+    The size on disk is used, expanded for gzipped files: the real size
+    depends on the display backend, but the order of magnitude is what
+    matters for a memory budget.
+    '''
+    size = stamp[1]
+    if filename.endswith('.gz'):
+        size *= GZIP_EXPANSION_RATIO
+    return max(size, 1)
+
+
+class LoadedObjectsCache(object):
+    ''' LRU cache of objects loaded from files, bounded by a memory budget.
+
+    Entries are keyed by (filename, mtime, size): an entry is only returned
+    while the file has not changed on disk. When the budget is exceeded,
+    the least recently used entries are evicted.
+    '''
+
+    def __init__(self, max_bytes, size_function=estimate_loaded_size):
+        '''
+        Parameters
+        ----------
+        max_bytes: int
+            memory budget of the cache (0 disables the cache)
+        size_function: callable
+            (filename, (mtime, size)) -> estimated memory size in bytes
+        '''
+        self.max_bytes = max_bytes
+        self._size_function = size_function
+        self._lock = threading.RLock()
+        # (filename, mtime, size) -> (object, bytes)
+        self._entries = OrderedDict()
+        self._keys = {}
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, filename):
+        with self._lock:
+            key = self._keys.get(filename)
+            return key is not None and key[1:] == file_stamp(filename)
+
+    def get(self, filename):
+        ''' Cached object of filename, or None if missing or out of date '''
+        stamp = file_stamp(filename)
+        with self._lock:
+            key = self._keys.get(filename)
+            if key is None or stamp is None or key[1:] != stamp:
+                if key is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            obj, size = self._entries.pop(key)
+            self._entries[key] = (obj, size)
+            self.hits += 1
+            return obj
+
+    def put(self, filename, obj, stamp=None):
+        ''' Cache obj as loaded from filename.
+
+        stamp should be the file_stamp() taken before loading, so that a
+        file modified during the load is not cached as up to date.
+        '''
+        if stamp is None:
+            stamp = file_stamp(filename)
+        if stamp is None or obj is None:
+            return
+        size = self._size_function(filename, stamp)
+        with self._lock:
+            self.discard(filename)
+            if size > self.max_bytes:
+                return
+            key = (filename,) + tuple(stamp)
+            self._entries[key] = (obj, size)
+            self._keys[filename] = key
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def discard(self, filename):
+        with self._lock:
+            key = self._keys.get(filename)
+            if key is not None:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys.clear()
+            self.current_bytes = 0
+
+    def set_max_bytes(self, max_bytes):
+        with self._lock:
+            self.max_bytes = max_bytes
+            while self._entries and self.current_bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def statistics(self):
+        with self._lock:
+            requests = self.hits + self.misses
+            return {'entries': len(self._entries),
+                    'bytes': self.current_bytes,
+                    'max_bytes': self.max_bytes,
+                    'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'hit_rate': (float(self.hits) / requests
+                                 if requests else 0.)}
+
+    def _remove(self, key):
+        _, size = self._entries.pop(key)
+        del self._keys[key[0]]
+        self.current_bytes -= size
@@ -0,0 +1,509 @@
+from __future__ import absolute_import
+import os
+import re
+import json
+import struct
+import zlib
+import threading
+import six
+import six.moves.urllib.request
+import six.moves.urllib.error
+
+
+class DownloadError(Exception):
+    pass
+
+
+class ZipStreamError(DownloadError):
+    pass
+
+
+class DownloadCancelled(DownloadError):
+    pass
+
+
+_LOCAL_HEADER_SIGNATURE = b'PK\x03\x04'
+_DATA_DESCRIPTOR_SIGNATURE = b'PK\x07\x08'
+_END_SIGNATURES = [b'PK\x01\x02', # central directory
+                   b'PK\x05\x06', # end of central directory
+                   b'PK\x06\x06', # zip64 end of central directory
+                   b'PK\x06\x07', # zip64 end of central directory locator
+                   b'PK\x05\x05'] # digital signature
+_LOCAL_HEADER_SIZE = 30
+_ZIP64_EXTRA_ID = 0x0001
+_STORED = 0
+_DEFLATED = 8
+_HAS_DATA_DESCRIPTOR = 0x08
+_UTF8_NAME = 0x800
+
+
+class ZipStreamExtractor(object):
+    ''' Extract the members of a zip archive while it is received, without
+    storing the archive.
+
+    The archive is parsed from its local file headers: members are written
+    as soon as their data is received. The central directory (at the end of
+    the archive) is not needed.
+    '''
+    _HEADER, _NAME, _DATA, _DESCRIPTOR, _DONE = range(5)
+
+    def __init__(self, destination, start_offset=0, member_extracted=None):
+        '''
+        Parameters
+        ----------
+        destination: callable
+            member name -> output filename, or None to skip the member
+        start_offset: int
+            offset of the first received byte in the archive: it must be
+            the beginning of a member (see committed_offset)
+        member_extracted: callable, optional
+            called with (member name, filename) when a member is complete
+        '''
+        self._destination = destination
+        self._member_extracted = member_extracted
+        self._buffer = bytearray()
+        self._buffer_offset = start_offset
+        self._state = self._HEADER
+        self._member = None
+        self.committed_offset = start_offset
+        self.current_member = None
+        self.current_member_bytes = 0
+
+    @property
+    def finished(self):
+        return self._state == self._DONE
+
+    def feed(self, data):
+        self._buffer += data
+        while self._state != self._DONE:
+            if self._state == self._HEADER:
+                progress = self._read_header()
+            elif self._state == self._NAME:
+                progress = self._read_name()
+            elif self._state == self._DATA:
+                progress = self._read_data()
+            else:
+                progress = self._read_descriptor()
+            if not progress:
+                break
+
+    def _consume(self, size):
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        self._buffer_offset += size
+        return data
+
+    def _read_header(self):
+        if len(self._buffer) < 4:
+            return False
+        signature = bytes(self._buffer[:4])
+        if signature in _END_SIGNATURES:
+            self._state = self._DONE
+            return False
+        if signature != _LOCAL_HEADER_SIGNATURE:
+            raise ZipStreamError("not a zip archive, or corrupted archive "
+                                 "(offset %d)" % self._buffer_offset)
+        if len(self._buffer) < _LOCAL_HEADER_SIZE:
+            return False
+        header = struct.unpack('<4sHHHHHIIIHH',
+                               self._consume(_LOCAL_HEADER_SIZE))
+        self._member = _ZipMember(flags=header[2], method=header[3],
+                                  crc=header[6], compressed_size=header[7],
+                                  size=header[8], name_length=header[9],
+                                  extra_length=header[10])
+        self._state = self._NAME
+        return True
+
+    def _read_name(self):
+        member = self._member
+        if len(self._buffer) < member.name_length + member.extra_length:
+            return False
+        name = self._consume(member.name_length)
+        extra = self._consume(member.extra_length)
+        if member.flags & _UTF8_NAME:
+            member.name = name.decode('utf-8')
+        else:
+            member.name = name.decode('cp437')
+        member.read_zip64_extra(extra)
+        if member.method not in (_STORED, _DEFLATED):
+            raise ZipStreamError("unsupported compression method %d for %s"
+                                 % (member.method, member.name))
+        filename = None
+        if not member.name.endswith('/'):
+            filename = self._destination(member.name)
+        member.open(filename)
+        self.current_member = member.name
+        self.current_member_bytes = 0
+        self._state = self._DATA
+        return True
+
+    def _read_data(self):
+        member = self._member
+        if not member.has_data_descriptor and member.remaining_bytes == 0:
+            # empty member
+            self._finish_member()
+            return True
+        if not self._buffer:
+            return False
+        if member.method == _STORED and member.has_data_descriptor:
+            return self._read_stored_data_of_unknown_size()
+        if member.has_data_descriptor:
+            # deflated data of unknown size: the end of the deflate stream
+            # gives the end of the member
+            data = self._consume(len(self._buffer))
+            remaining = member.decompress(data)
+            self.current_member_bytes += len(data) - len(remaining)
+            if member.decompression_finished:
+                self._buffer[0:0] = remaining
+                self._buffer_offset -= len(remaining)
+                self._state = self._DESCRIPTOR
+            return True
+        size = min(len(self._buffer), member.remaining_bytes)
+        member.decompress(self._consume(size))
+        self.current_member_bytes += size
+        if member.remaining_bytes == 0:
+            self._finish_member()
+        return True
+
+    def _read_stored_data_of_unknown_size(self):
+        # the end of the member is a data descriptor (with its signature)
+        # matching the CRC and the size of the data received so far
+        member = self._member
+        descriptor_length = 24 if member.zip64 else 16
+        index = self._buffer.find(_DATA_DESCRIPTOR_SIGNATURE)
+        while index != -1:
+            if len(self._buffer) < index + descriptor_length:
+                break
+            descriptor = bytes(self._buffer[index:index + descriptor_length])
+            crc = struct.unpack('<I', descriptor[4:8])[0]
+            if member.zip64:
+                size = struct.unpack('<Q', descriptor[8:16])[0]
+            else:
+                size = struct.unpack('<I', descriptor[8:12])[0]
+            data = bytes(self._buffer[:index])
+            if size == member.compressed_bytes + index \
+                    and crc == member.crc_with(data):
+                self._consume(index)
+                member.decompress(data)
+                self.current_member_bytes += index
+                self._state = self._DESCRIPTOR
+                return True
+            index = self._buffer.find(_DATA_DESCRIPTOR_SIGNATURE, index + 1)
+        if index == -1:
+            # the signature may be split over 2 chunks
+            index = max(0, len(self._buffer) - 3)
+        if index == 0:
+            return False
+        member.decompress(self._consume(index))
+        self.current_member_bytes += index
+        return True
+
+    def _read_descriptor(self):
+        member = self._member
+        sizes_length = 16 if member.zip64 else 8
+        if len(self._buffer) < 4:
+            return False
+        length = 4 + sizes_length
+        if bytes(self._buffer[:4]) == _DATA_DESCRIPTOR_SIGNATURE:
+            length += 4
+        if len(self._buffer) < length:
+            return False
+        descriptor = self._consume(length)
+        member.crc = struct.unpack('<I', descriptor[-sizes_length - 4:
+                                                   -sizes_length])[0]
+        self._finish_member()
+        return True
+
+    def _finish_member(self):
+        member = self._member
+        filename = member.close()
+        self._member = None
+        self._state = self._HEADER
+        self.committed_offset = self._buffer_offset
+        if filename is not None and self._member_extracted is not None:
+            self._member_extracted(member.name, filename)
+
+
+class _ZipMember(object):
+
+    def __init__(self, flags, method, crc, compressed_size, size,
+                 name_length, extra_length):
+        self.flags = flags
+        self.method = method
+        self.crc = crc
+        self.compressed_size = compressed_size
+        self.size = size
+        self.name_length = name_length
+        self.extra_length = extra_length
+        self.name = None
+        self.zip64 = False
+        self.remaining_bytes = compressed_size
+        self.compressed_bytes = 0
+        self.decompression_finished = False
+        self._filename = None
+        self._file = None
+        self._crc = 0
+        self._decompressor = None
+
+    @property
+    def has_data_descriptor(self):
+        return bool(self.flags & _HAS_DATA_DESCRIPTOR)
+
+    def read_zip64_extra(self, extra):
+        while len(extra) >= 4:
+            header_id, length = struct.unpack('<HH', extra[:4])
+            data = extra[4:4 + length]
+            extra = extra[4 + length:]
+            if header_id != _ZIP64_EXTRA_ID:
+                continue
+            self.zip64 = True
+            values = list(struct.unpack('<%dQ' % (len(data) // 8),
+                                        data[:len(data) // 8 * 8]))
+            if self.size == 0xffffffff and values:
+                self.size = values.pop(0)
+            if self.compressed_size == 0xffffffff and values:
+                self.compressed_size = values.pop(0)
+        self.remaining_bytes = self.compressed_size
+
+    def open(self, filename):
+        self._filename = filename
+        if filename is not None:
+            dirname = os.path.dirname(filename)
+            if dirname and not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            self._file = open(filename + '.part', 'wb')
+        if self.method == _DEFLATED:
+            self._decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+
+    def decompress(self, data):
+        ''' Returns the data which does not belong to the member (only
+        when its size is unknown)
+        '''
+        self.remaining_bytes -= len(data)
+        self.compressed_bytes += len(data)
+        if self._decompressor is not None:
+            uncompressed = self._decompressor.decompress(data)
+            remaining = self._decompressor.unused_data
+            if getattr(self._decompressor, 'eof', bool(remaining)):
+                self.decompression_finished = True
+        else:
+            uncompressed = data
+            remaining = b''
+        self._write(uncompressed)
+        return remaining
+
+    def crc_with(self, data):
+        return zlib.crc32(data, self._crc) & 0xffffffff
+
+    def _write(self, data):
+        if not data:
+            return
+        self._crc = zlib.crc32(data, self._crc)
+        if self._file is not None:
+            self._file.write(data)
+
+    def close(self):
+        if self._decompressor is not None:
+            self._write(self._decompressor.flush())
+        if self._file is not None:
+            self._file.close()
+        if (self._crc & 0xffffffff) != self.crc:
+            if self._file is not None:
+                os.unlink(self._filename + '.part')
+            raise ZipStreamError("bad CRC for member %s" % self.name)
+        if self._file is not None:
+            if os.path.exists(self._filename):
+                os.unlink(self._filename)
+            os.rename(self._filename + '.part', self._filename)
+        return self._filename
+
+
+class ZipDownloader(object):
+    ''' Download a zip archive and extract its members while it is
+    received. The download can run in a background thread: progress is
+    available from the attributes of the downloader, and cancel() can be
+    called from another thread.
+
+    The state of the download (extracted members and offset in the archive)
+    is saved in state_filepath after each member, so that an interrupted
+    download is resumed with an HTTP range request on the next run().
+    '''
+
+    def __init__(self, url, destination, state_filepath=None,
+                 chunk_size=64 * 1024, timeout=60):
+        '''
+        Parameters
+        ----------
+        url: str
+        destination: callable
+            member name -> output filename, or None to skip the member
+        state_filepath: str, optional
+            json file storing the state of an interrupted download
+        '''
+        self.url = url
+        self.destination = destination
+        self.state_filepath = state_filepath
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self._cancel_event = threading.Event()
+        self._init_progress()
+
+    def _init_progress(self):
+        self.downloaded_bytes = 0
+        self.total_bytes = None
+        self.resumed_from = 0
+        self.extracted = [] # (member name, filename)
+        self._extractor = None
+
+    @property
+    def current_member(self):
+        if self._extractor is None:
+            return None
+        return self._extractor.current_member
+
+    @property
+    def current_member_bytes(self):
+        if self._extractor is None:
+            return 0
+        return self._extractor.current_member_bytes
+
+    def cancel(self):
+        ''' Stop the download before the next chunk. A cancelled downloader
+        stays cancelled, even if run() has not started yet.
+        '''
+        self._cancel_event.set()
+
+    def run(self):
+        ''' Download and extract the archive.
+
+        Returns
+        -------
+        filenames: list
+            extracted files, in the archive order
+        '''
+        self._init_progress()
+        if self._cancel_event.is_set():
+            raise DownloadCancelled("download cancelled")
+        state = self._load_state()
+        headers = {}
+        if state['offset']:
+            headers['Range'] = 'bytes=%d-' % state['offset']
+            if state['etag']:
+                headers['If-Range'] = state['etag']
+        request = six.moves.urllib.request.Request(self.url,
+                                                   headers=headers)
+        try:
+            response = six.moves.urllib.request.urlopen(
+                request, timeout=self.timeout)
+        except (IOError, six.moves.urllib.error.URLError) as e:
+            raise DownloadError("cannot connect to %s: %s" % (self.url, e))
+        try:
+            offset = self._response_offset(response, state)
+            self.extracted = [tuple(item) for item in state['extracted']]
+            if offset == 0:
+                # full archive: members already extracted are skipped
+                extracted = dict(self.extracted)
+                destination = lambda name: None if name in extracted \
+                    else self.destination(name)
+            else:
+                destination = self.destination
+            self.resumed_from = offset
+            state['offset'] = offset
+            state['etag'] = response.info().get('ETag')
+            self._extractor = ZipStreamExtractor(
+                destination, start_offset=offset,
+                member_extracted=lambda name, filename:
+                    self._on_member_extracted(state, name, filename))
+            self._read_response(response)
+        finally:
+            response.close()
+        if not self._extractor.finished:
+            raise DownloadError("truncated archive (%d bytes received)"
+                                % self.downloaded_bytes)
+        self._remove_state()
+        return [filename for _, filename in self.extracted]
+
+    def _response_offset(self, response, state):
+        length = response.info().get('Content-Length')
+        if response.getcode() != 206:
+            if length is not None:
+                self.total_bytes = int(length)
+            return 0
+        content_range = response.info().get('Content-Range', '')
+        match = re.match(r'bytes\s+(\d+)-(\d+)/(\d+|\*)', content_range)
+        if match is None or int(match.group(1)) != state['offset']:
+            raise DownloadError("bad range in server response: %s"
+                                % content_range)
+        if match.group(3) != '*':
+            self.total_bytes = int(match.group(3))
+        return state['offset']
+
+    def _read_response(self, response):
+        while True:
+            if self._cancel_event.is_set():
+                raise DownloadCancelled("download cancelled")
+            try:
+                data = response.read(self.chunk_size)
+            except (IOError, six.moves.http_client.HTTPException) as e:
+                raise DownloadError("connection lost: %s" % e)
+            if not data:
+                break
+            self.downloaded_bytes += len(data)
+            self._extractor.feed(data)
+            if self._extractor.finished:
+                break
+
+    def _on_member_extracted(self, state, name, filename):
+        self.extracted.append((name, filename))
+        state['offset'] = self._extractor.committed_offset
+        state['extracted'] = self.extracted
+        self._save_state(state)
+
+    def _load_state(self):
+        state = {'url': self.url, 'offset': 0, 'etag': None, 'extracted': []}
+        if self.state_filepath is None \
+                or not os.path.exists(self.state_filepath):
+            return state
+        try:
+            with open(self.state_filepath) as f:
+                saved_state = json.load(f)
+        except ValueError:
+            return state
+        if saved_state.get('url') != self.url:
+            return state
+        extracted = [(name, filename)
+                     for name, filename in saved_state.get('extracted', [])
+                     if os.path.exists(filename)]
+        if len(extracted) == len(saved_state.get('extracted', [])):
+            state['offset'] = saved_state.get('offset', 0)
+            state['etag'] = saved_state.get('etag')
+        state['extracted'] = extracted
+        return state
+
+    def _save_state(self, state):
+        if self.state_filepath is None:
+            return
+        with open(self.state_filepath + '.tmp', 'w') as f:
+            json.dump(state, f)
+        if os.path.exists(self.state_filepath):
+            os.unlink(self.state_filepath)
+        os.rename(self.state_filepath + '.tmp', self.state_filepath)
+
+    def _remove_state(self):
+        if self.state_filepath is not None \
+                and os.path.exists(self.state_filepath):
+            os.unlink(self.state_filepath)
+
+
+def brainomics_t1_destination(directory):
+    ''' Destination of the T1 images of a Brainomics (CubicWeb) data-zip
+    archive: brainomics_data/<subject>/raw_T1_raw_anat.nii.gz is extracted
+    as <directory>/<subject>.nii.gz, other members are skipped.
+    '''
+    def destination(member_name):
+        parts = member_name.split('/')
+        if len(parts) == 3 and parts[0] == 'brainomics_data' \
+                and parts[2] == 'raw_T1_raw_anat.nii.gz':
+            return os.path.join(directory, parts[1] + '.nii.gz')
+        return None
+    return destination
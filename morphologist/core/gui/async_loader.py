@@ -0,0 +1,74 @@
+from __future__ import absolute_import
+import threading
+import traceback
+from six.moves import queue, range
+
+from morphologist.core.gui.qt_backend import QtCore
+
+
+class AsyncLoader(QtCore.QObject):
+    ''' Pool of worker threads loading files out of the GUI thread.
+
+    Loading functions run in a worker thread; their completion callbacks
+    are called in the thread of the loader (the GUI thread), through a
+    queued Qt signal. Loading functions must not create display backend
+    objects: this is the job of the callbacks.
+    '''
+    _loaded = QtCore.pyqtSignal(object)
+    _instance = None
+
+    def __init__(self, workers_number=2, parent=None):
+        super(AsyncLoader, self).__init__(parent)
+        self._tasks = queue.Queue()
+        self._loaded.connect(self._on_loaded, QtCore.Qt.QueuedConnection)
+        self._workers = []
+        for _ in range(workers_number):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    @classmethod
+    def instance(cls):
+        ''' Loader shared by the viewport models '''
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def load(self, load_function, args, callback, error_callback=None):
+        ''' Call load_function(*args) in a worker thread.
+
+        Parameters
+        ----------
+        load_function: callable
+            called in a worker thread
+        args: tuple
+            arguments of load_function
+        callback: callable
+            called in the GUI thread with the result of load_function
+        error_callback: callable, optional
+            called in the GUI thread with the exception raised by
+            load_function. By default, callback(None) is called.
+        '''
+        self._tasks.put((load_function, args, callback, error_callback))
+
+    def _work(self):
+        while True:
+            load_function, args, callback, error_callback = self._tasks.get()
+            try:
+                result = load_function(*args)
+            except Exception as e:
+                traceback.print_exc()
+                self._loaded.emit((callback, error_callback, e, True))
+            else:
+                self._loaded.emit((callback, error_callback, result, False))
+
+    @QtCore.Slot(object)
+    def _on_loaded(self, completion):
+        callback, error_callback, value, failed = completion
+        if not failed:
+            callback(value)
+        elif error_callback is not None:
+            error_callback(value)
+        else:
+            callback(None)
@@ -1,5 +1,7 @@
 from __future__ import absolute_import
+from collections import OrderedDict
 from morphologist.core.backends import Backend
+from morphologist.core.gui.async_loader import AsyncLoader
 from morphologist.core.utils.design_patterns import Visitable
 
 
@@ -8,6 +10,8 @@ class AbstractObject3D(Visitable):
     def __init__(self):
         self._backend = Backend.objects_loader_backend()
         self._friend_backend_object = None
+        # incremented on each reload
+        self.revision = 0
         
     def reload(self):
         raise NotImplementedError("AbstractObject3D is an abstract class")
@@ -46,12 +50,42 @@ class Object3D(AbstractObject3D):
         object3d._load_callback = callback
         object3d._backend.load_object_async(filename, object3d._object_loaded)
 
+    @classmethod
+    def from_filename_progressive(cls, filename, callback, preview_callback,
+                                  method='mean'):
+        ''' Asynchronous load of a volume, first calling preview_callback
+        with a downsampled version of big volumes.
+
+        The full resolution volume is loaded while the preview is built (or
+        read from its cache) in a loading thread; the preview is dropped if
+        the volume is loaded first. method is the downsampling method, see
+        pyramid.downsample.
+        '''
+        backend = Backend.objects_loader_backend()
+        loaded = []
+        def object_loaded(object3d):
+            loaded.append(object3d)
+            callback(object3d)
+        def preview_loaded(aobject, preview_filename):
+            if aobject and not loaded:
+                preview = cls(_enable_init=True)
+                preview._friend_backend_object = aobject
+                preview_callback(preview)
+        def preview_created(preview_filename):
+            if preview_filename is not None and not loaded:
+                backend.load_object_async(preview_filename, preview_loaded)
+        AsyncLoader.instance().load(backend.create_volume_preview,
+                                    (filename, method), preview_created)
+        cls.from_filename_async(filename, object_loaded)
+
     def _object_loaded(self, aobject, filename):
-        if not aobject:
-          raise LoadObjectError(str(filename))
-        self._friend_backend_object = aobject
         callback = self._load_callback
         self._load_callback = None
+        if not aobject:
+            # load error
+            callback(None)
+            return
+        self._friend_backend_object = aobject
         callback(self)
 
     @classmethod
@@ -72,6 +106,7 @@ class Object3D(AbstractObject3D):
         
     def reload(self):
         self._backend.reload_object(self._friend_backend_object)
+        self.revision += 1
     
     def shallow_copy(self):
         object_copy = Object3D(_enable_init=True)
@@ -82,6 +117,73 @@ class Object3D(AbstractObject3D):
         return self._backend.get_object_center_position(self._friend_backend_object)
 
 
+class FusionCache(object):
+    ''' Fusion objects of a view, reused while their source objects are the
+    same and have not been reloaded.
+
+    Views call get_fusion() on each update instead of creating new fusions,
+    so that repeated updates do not create display backend objects. An
+    update between mark() and sweep() releases the fusions it did not use:
+    their sources have been replaced (a changed file is loaded again as a
+    new object), and the entries would keep them alive.
+    '''
+
+    def __init__(self, max_size=16):
+        self.max_size = max_size
+        # key -> (source objects, revisions, fusion)
+        self._fusions = OrderedDict()
+        # keys used since mark(), None out of an update
+        self._used_keys = None
+
+    def get_fusion(self, object1, object2=None, mode=None, rate=None,
+                   method=None, color=None):
+        ''' Same parameters as Object3D.from_fusion; color, if given, is
+        set when the fusion is created.
+        '''
+        if isinstance(object1, tuple) or isinstance(object1, list):
+            objects = list(object1)
+        else:
+            objects = [object1]
+        if object2 is not None:
+            objects.append(object2)
+        # the entry references the source objects: their ids stay unique
+        # while it is cached
+        key = tuple(id(o) for o in objects) \
+            + (mode, rate, method, tuple(color) if color else None)
+        revisions = [o.revision for o in objects]
+        entry = self._fusions.pop(key, None)
+        if entry is not None and entry[1] == revisions:
+            fusion = entry[2]
+        else:
+            fusion = Object3D.from_fusion(object1, object2, mode=mode,
+                                          rate=rate, method=method)
+            if color is not None:
+                fusion.set_color(color)
+        self._fusions[key] = (objects, revisions, fusion)
+        if self._used_keys is not None:
+            self._used_keys.add(key)
+        while len(self._fusions) > self.max_size:
+            self._fusions.popitem(last=False)
+        return fusion
+
+    def mark(self):
+        ''' Start recording the fusions used by an update '''
+        self._used_keys = set()
+
+    def sweep(self):
+        ''' Release the fusions not used since mark() '''
+        if self._used_keys is None:
+            return
+        for key in list(self._fusions):
+            if key not in self._used_keys:
+                del self._fusions[key]
+        self._used_keys = None
+
+    def clear(self):
+        self._fusions.clear()
+        self._used_keys = None
+
+
 class PointObject(AbstractObject3D):
     
     def __init__(self, coordinates):
@@ -91,6 +193,7 @@ class PointObject(AbstractObject3D):
     
     def reload(self):
         self._friend_backend_object = self._backend.create_point_object(self._coordinates)
+        self.revision += 1
         
     def get_center_position(self):
         return self._coordinates
@@ -105,6 +208,7 @@ class GroupObject(AbstractObject3D):
     def reload(self):
         for object in self._objects:
             object.reload()
+        self.revision += 1
             
     def get_center_position(self):
         if len(self._objects) > 0:
@@ -126,36 +230,65 @@ class GroupObject(AbstractObject3D):
             visitor._friend_visit(object)
 
            
+def read_apc_coordinates(filename):
+    ''' Read the AC, PC and IH coordinates (in mm) of a commissure
+    coordinates (.APC) file.
+
+    Returns
+    -------
+    coordinates: dict
+        'AC', 'PC' and 'IH' coordinates
+    '''
+    coordinates = {}
+    with open(filename, "r") as apcfile:
+        for l in apcfile:
+            if l[:5] in ('ACmm:', 'PCmm:', 'IHmm:'):
+                coordinates[l[:2]] = [float(x) for x in l.split()[1:4]]
+    return coordinates
+
+
 class APCObject(GroupObject):
     
-    def __init__(self, filename):
+    def __init__(self, filename, coordinates=None):
+        '''
+        Parameters
+        ----------
+        filename: str
+            commissure coordinates (.APC) file
+        coordinates: dict, optional
+            coordinates already read by read_apc_coordinates()
+        '''
         super(APCObject, self).__init__([])
         self._filename = filename
-        self._init_apc_object()
+        self._init_apc_object(coordinates)
+
+    @classmethod
+    def from_filename_async(cls, filename, callback):
+        # the file is read in a worker thread, the points are created in
+        # the GUI thread
+        def coordinates_loaded(coordinates):
+            if coordinates is None:
+                # load error
+                callback(None)
+                return
+            callback(cls(filename, coordinates))
+        AsyncLoader.instance().load(read_apc_coordinates, (filename,),
+                                    coordinates_loaded)
         
-    def _init_apc_object(self):
-        self._init_coordinates()
+    def _init_apc_object(self, coordinates=None):
+        if coordinates is None:
+            coordinates = read_apc_coordinates(self._filename)
+        self._ac_coordinates = coordinates['AC']
+        self._pc_coordinates = coordinates['PC']
+        self._ih_coordinates = coordinates['IH']
         self._ac_object = PointObject(self._ac_coordinates)
         self._pc_object = PointObject(self._pc_coordinates)
         self._ih_object = PointObject(self._ih_coordinates)
         self._objects = [self._ac_object, self._pc_object, self._ih_object]
         
-    def _init_coordinates(self):
-        apcfile = open(self._filename, "r")
-        lines = apcfile.readlines()
-        for l in lines:
-            if l[:5] == 'ACmm:':
-                self._ac_coordinates \
-                    = [float(x) for x in l.split()[1:4]]
-            elif l[:5] == 'PCmm:':
-                self._pc_coordinates \
-                    = [float(x) for x in l.split()[1:4]]
-            elif l[:5] == 'IHmm:':
-                self._ih_coordinates \
-                    = [float(x) for x in l.split()[1:4]]
-
     def reload(self):
         self._init_apc_object()
+        self.revision += 1
         
     def get_center_position(self):
         return self._ac_coordinates
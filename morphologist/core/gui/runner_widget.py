@@ -25,6 +25,7 @@ class RunnerView(QtGui.QWidget):
         self._runner_model.runner_status_changed.connect(self.on_runner_status_changed)
         self._runner_model.changed.connect(self.on_model_changed)
         self._runner_model.subject_selection_changed.connect(self.on_subject_selection_changed)
+        self._runner_model.progress_changed.connect(self.on_progress_changed)
         self.on_model_changed()
 
     @QtCore.Slot()
@@ -39,6 +40,11 @@ class RunnerView(QtGui.QWidget):
         else:
             self._set_not_running_state()
 
+    @QtCore.Slot()
+    def on_progress_changed(self):
+        self.ui.progress_label.setText(
+            self._runner_model.get_progress_summary_text())
+
     @QtCore.Slot(int)
     def on_subject_selection_changed(self, index):
         if self._runner_model.get_selected_subject_ids():
@@ -138,6 +144,7 @@ class RunnerView(QtGui.QWidget):
         self._set_erase_button_if_needed()
         self._running_movie.stop()
         self.ui.status_label.setVisible(False)
+        self.ui.progress_label.setText('')
 
     def _set_run_button_if_needed(self):
         selected_subject_ids = self._runner_model.get_selected_subject_ids()
@@ -1,7 +1,5 @@
 from __future__ import absolute_import
 import os
-import six.moves.urllib.request, six.moves.urllib.parse, six.moves.urllib.error
-import zipfile
 import shutil
 import tempfile
 import numpy
@@ -15,6 +13,9 @@ from morphologist.core.analysis import AnalysisFactory
 from morphologist.core.gui.study_editor import StudyEditor, StudyPropertiesEditor
 from morphologist.core.gui.study_properties_widget import StudyPropertiesEditorWidget
 from morphologist.core.study import Study
+from morphologist.core.download import ZipDownloader, DownloadError, \
+    ZipStreamError, DownloadCancelled, brainomics_t1_destination
+from morphologist.core.utils import FuncQThread
 import six
 from six.moves import range
 
@@ -485,36 +486,102 @@ class SubjectsFromDatabaseDialog(QtGui.QDialog):
         
         self._filenames = []
         self._groupname = None
+        self._downloader = None
+        self._download_thread = None
+        self._download_error = None
+        self._cancelled = False
    
         tmp_directory = tempfile.gettempdir()
-        self._zip_filename = os.path.join(tmp_directory, "cubic_web_tmp_data.zip")
-        self._unzipped_dirname = os.path.join(tmp_directory, "cubic_web_unzipped_dir")
         self._files_directory = os.path.join(tmp_directory, "morphologist_tmp_files")
-        if os.path.isdir(self._files_directory):
+        # an interrupted download is resumed: keep its files
+        self._state_filepath = os.path.join(self._files_directory,
+                                            "download_state.json")
+        if os.path.isdir(self._files_directory) \
+                and not os.path.exists(self._state_filepath):
             shutil.rmtree(self._files_directory)
-        os.mkdir(self._files_directory)
+        if not os.path.isdir(self._files_directory):
+            os.mkdir(self._files_directory)
+
+        self._progress_timer = QtCore.QTimer(self)
+        self._progress_timer.setInterval(200)
+        self._progress_timer.timeout.connect(self._update_progress)
+        self.ui.progress_bar.setVisible(False)
 
     # this slot is automagically connected 
     @QtCore.Slot()
     def on_load_button_clicked(self):
         self.ui.load_button.setEnabled(False)
-        QtGui.QApplication.processEvents()
-        QtGui.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
-        error = None
+        self._group = self.ui.group_lineEdit.text()
+        self._download_error = None
+        self._cancelled = False
+        self._downloader = None
+        self._download_thread = FuncQThread(
+            self._load_in_thread, (self.ui.server_url_field.text(),
+                                   self.ui.rql_request_lineEdit.text()))
+        self._download_thread.finished.connect(self.on_download_finished)
+        self.ui.progress_bar.setVisible(True)
+        self._download_thread.start()
+        self._progress_timer.start()
+
+    def _load_in_thread(self, server_url, rql_request):
         try:
-            self.load(self.ui.server_url_field.text(), 
-                      self.ui.rql_request_lineEdit.text())
+            self.load(server_url, rql_request)
+        except DownloadCancelled:
+            pass
         except LoadSubjectsFromDatabaseError as e:
-            error = "Cannot load files from the database: \n%s" % six.text_type(e)
-        finally:
-            QtGui.QApplication.restoreOverrideCursor()
-            self.ui.load_button.setEnabled(True)
-        self._group = self.ui.group_lineEdit.text()
-        if error:
+            self._download_error = e
+
+    @QtCore.Slot()
+    def on_download_finished(self):
+        self._progress_timer.stop()
+        self._download_thread = None
+        # a new download can start once the previous thread has ended
+        self.ui.load_button.setEnabled(True)
+        if self._cancelled:
+            # the dialog has been closed meanwhile
+            return
+        self._update_progress()
+        if self._download_error is not None:
+            error = "Cannot load files from the database: \n%s" \
+                % six.text_type(self._download_error)
             QtGui.QMessageBox.critical(self, "Load error", error)
         else:
             self.accept()
 
+    def _update_progress(self):
+        downloader = self._downloader
+        if downloader is None:
+            return
+        subjects_n = len(downloader.extracted)
+        text = "%d subject(s) loaded" % subjects_n
+        member = downloader.current_member
+        if member is not None:
+            text += " - %s: %.1f MB" % (member,
+                downloader.current_member_bytes / (1024. * 1024))
+        self.ui.progress_label.setText(text)
+        if downloader.total_bytes:
+            self.ui.progress_bar.setRange(0, 1000)
+            self.ui.progress_bar.setValue(int(1000. * (
+                downloader.resumed_from + downloader.downloaded_bytes)
+                / downloader.total_bytes))
+        else:
+            # unknown size
+            self.ui.progress_bar.setRange(0, 0)
+
+    # overrided Qt method
+    def reject(self):
+        self._cancelled = True
+        if self._download_thread is not None:
+            # the downloader is created by the thread: it may not exist yet
+            downloader = self._downloader
+            if downloader is not None:
+                downloader.cancel()
+            # the thread notices the cancel between two chunks, which may
+            # take the download timeout on a stalled server: the dialog is
+            # closed meanwhile and on_download_finished cleans up
+            self._progress_timer.stop()
+        super(SubjectsFromDatabaseDialog, self).reject()
+
     def set_server_url(self, server_url):
         self.ui.server_url_field.setText(server_url)
 
@@ -531,28 +598,24 @@ class SubjectsFromDatabaseDialog(QtGui.QDialog):
         return self._group
 
     def load(self, server_url, rql_request):
+        ''' Download the T1 images of the subjects: members of the archive
+        are extracted while it is received, and an interrupted download is
+        resumed on the next call.
+        '''
         url = server_url + '''/view?rql=''' + rql_request + '''&vid=data-zip'''
+        self._downloader = ZipDownloader(
+            url, brainomics_t1_destination(self._files_directory),
+            state_filepath=self._state_filepath)
+        if self._cancelled:
+            raise DownloadCancelled('download cancelled')
         try:
-            six.moves.urllib.request.urlretrieve(url, self._zip_filename)
-        except IOError:
-            raise LoadSubjectsFromDatabaseError("Cannot connect to the database server.")
-
-        try:
-            zip_file = zipfile.ZipFile(self._zip_filename)
-            zip_file.extractall(self._unzipped_dirname)
-        except zipfile.BadZipfile:
+            self._filenames = self._downloader.run()
+        except DownloadCancelled:
+            raise
+        except ZipStreamError:
             raise LoadSubjectsFromDatabaseError("The request is incorrect or has no results.")
-        
-        self._filenames = []
-        dirname = os.path.join(self._unzipped_dirname, "brainomics_data")
-        subject_dirs = os.listdir(dirname)
-        for subject_name in subject_dirs:
-            filename = os.path.join(self._files_directory, subject_name + ".nii.gz")
-            shutil.move(os.path.join(dirname, subject_name, "raw_T1_raw_anat.nii.gz"), filename)
-            self._filenames.append(filename)
-    
-        if os.path.isdir(self._unzipped_dirname):
-            shutil.rmtree(self._unzipped_dirname)
+        except DownloadError as e:
+            raise LoadSubjectsFromDatabaseError("Cannot connect to the database server.\n%s" % six.text_type(e))
  
 
 class LoadSubjectsFromDatabaseError(Exception):
@@ -1,8 +1,17 @@
 from __future__ import print_function
 
 from __future__ import absolute_import
+import os
 from morphologist.core.gui.qt_backend import QtCore
 from morphologist.core.constants import ALL_SUBJECTS
+from morphologist.core.progress import format_duration
+from morphologist.core.qc_metrics import QCMetrics, study_qc_files
+from morphologist.core.outputs_snapshot import OutputsSnapshot, \
+    stale_subjects, outputs_stamps
+from morphologist.core import outputs_snapshot
+from morphologist.core.gui.async_loader import AsyncLoader
+from morphologist.core.utils import FuncQThread
+from morphologist.core.profiling import profiled
 import six
 
 
@@ -20,12 +29,24 @@ class LazyStudyModel(QtCore.QObject):
     changed = QtCore.pyqtSignal()
     status_changed = QtCore.pyqtSignal()
     runner_status_changed = QtCore.pyqtSignal(bool)
+    progress_changed = QtCore.pyqtSignal()
     current_subject_changed = QtCore.pyqtSignal()
     subject_selection_changed = QtCore.pyqtSignal(int)
+    qc_changed = QtCore.pyqtSignal()
+    _snapshot_to_status = {outputs_snapshot.NO_RESULTS : NO_RESULTS,
+                           outputs_snapshot.SOME_RESULTS : SOME_RESULTS,
+                           outputs_snapshot.ALL_RESULTS : ALL_RESULTS}
+    _status_to_snapshot = dict((status, snapshot_status) for snapshot_status,
+                               status in six.iteritems(_snapshot_to_status))
+    # subjects checked at once against the outputs snapshot
+    _snapshot_validation_batch_size = 200
 
 
     def __init__(self, study, runner, parent=None):
         super(LazyStudyModel, self).__init__(parent)
+        self._qc_update_running = False
+        self._qc_update_needed = False
+        self._qc_thread = None
         self._init_study_and_runner(study, runner)
         self._update_interval = 2 # in seconds
         self._timer = QtCore.QTimer(self)
@@ -33,6 +54,7 @@ class LazyStudyModel(QtCore.QObject):
         self._timer.timeout.connect(self._update_all_status)
         self._timer.start()
 
+    @profiled('gui.load_study', operation=True)
     def _init_study_and_runner(self, study, runner):
         self.runner = runner
         self.study = study
@@ -40,13 +62,19 @@ class LazyStudyModel(QtCore.QObject):
         self._status = []                   # row index -> (status, step_id)
         self._are_selected_subjects = []    # row index -> is_selected
         self._current_subject_index = None
+        self._qc_metrics = None
+        self._qc_outliers = {}              # subject id -> {metric: score}
         for subject_id, _ in six.iteritems(self.study.subjects):
             self._subjects_row_index_to_id.append(subject_id)
             self._status.append((self.DEFAULT_STATUS, None))
             self._are_selected_subjects.append(False)
+        self._unvalidated_rows = set() # rows with a status of the snapshot
+        self._outputs_snapshot = self._load_outputs_snapshot()
         self.set_current_subject_index(0)
         self._runner_is_running = False
         self._update_all_status()
+        self._validate_outputs_snapshot()
+        self.update_qc_metrics()
     
     def set_study_and_runner(self, study, runner):
         self._init_study_and_runner(study, runner)
@@ -88,6 +116,77 @@ class LazyStudyModel(QtCore.QObject):
                 tooltip = "%s" % description
         return tooltip
     
+    def get_remaining_time_text(self, row_index):
+        if not self._runner_is_running:
+            return ''
+        subject_id = self._subjects_row_index_to_id[row_index]
+        eta = self.runner.get_eta(subject_id)
+        if not eta:
+            return ''
+        return format_duration(eta)
+
+    def get_progress_summary_text(self):
+        if not self._runner_is_running:
+            return ''
+        throughput = self.runner.get_throughput()
+        eta = self.runner.get_eta()
+        summary = '%.1f subjects/h' % throughput
+        if eta is not None:
+            summary += ', remaining: %s' % format_duration(eta)
+        return summary
+
+    def get_qc_text(self, row_index):
+        subject_id = self._subjects_row_index_to_id[row_index]
+        outliers = self._qc_outliers.get(subject_id)
+        if not outliers:
+            return ''
+        return 'outlier: %s' % ', '.join(outliers)
+
+    def get_qc_tooltip(self, row_index):
+        subject_id = self._subjects_row_index_to_id[row_index]
+        outliers = self._qc_outliers.get(subject_id)
+        if not outliers:
+            return ''
+        return '\n'.join(['%s: robust z-score %.1f' % (metric, score)
+                          for metric, score in six.iteritems(outliers)])
+
+    def update_qc_metrics(self):
+        ''' Update the QC metrics of the study in background: only the
+        subjects whose output files changed are processed again.
+        '''
+        if not self.study.subjects or not self.study.output_directory \
+                or not os.path.isdir(self.study.output_directory):
+            return
+        if self._qc_update_running:
+            self._qc_update_needed = True
+            return
+        if self._qc_metrics is None:
+            self._qc_metrics = QCMetrics.from_study(self.study)
+        self._qc_update_running = True
+        self._qc_update_needed = False
+        # outputs are looked up here, the files are read in a thread of
+        # its own (without process pool): on a large study, the update must
+        # not hold the shared loader workers of the viewports
+        qc_metrics = self._qc_metrics
+        self._qc_thread = FuncQThread(
+            qc_metrics.update, (study_qc_files(self.study), 1))
+        self._qc_thread.finished.connect(
+            lambda: self._qc_metrics_updated(qc_metrics))
+        self._qc_thread.start()
+
+    def _qc_metrics_updated(self, qc_metrics):
+        self._qc_update_running = False
+        self._qc_thread = None
+        if qc_metrics is not self._qc_metrics:
+            # the study has changed meanwhile
+            self.update_qc_metrics()
+            return
+        if qc_metrics.outliers != self._qc_outliers:
+            self._qc_outliers = qc_metrics.outliers
+            self.qc_changed.emit()
+        if self._qc_update_needed:
+            self.update_qc_metrics()
+
     def get_subject(self, row_index):
         subject_id = self._subjects_row_index_to_id[row_index]
         subject = self.study.subjects.get(subject_id)
@@ -125,17 +224,42 @@ class LazyStudyModel(QtCore.QObject):
     def subject_count(self):
         return len(self._subjects_row_index_to_id)
 
+    def get_neighbour_subject_ids(self, distance=1):
+        ''' Ids of the subjects around the current one in the table, nearest
+        first: next, previous, second next...
+        '''
+        subject_ids = []
+        index = self._current_subject_index
+        if index is None:
+            return subject_ids
+        for offset in range(1, distance + 1):
+            for row_index in (index + offset, index - offset):
+                if 0 <= row_index < len(self._subjects_row_index_to_id):
+                    subject_ids.append(
+                        self._subjects_row_index_to_id[row_index])
+        return subject_ids
+
     @QtCore.Slot()
+    @profiled('gui.update_all_status')
     def _update_all_status(self):
         has_changed = False
         new_runner_status = self.runner.is_running()
+        runner_has_stopped = False
         if new_runner_status != self._runner_is_running:
             self._runner_is_running = new_runner_status
+            runner_has_stopped = not new_runner_status
             self.runner_status_changed.emit(self._runner_is_running)
         for row_index, _ in enumerate(self._subjects_row_index_to_id):
             has_changed |= self._update_subject_status(row_index) 
-        if has_changed:
+        if runner_has_stopped or (has_changed
+                                  and not self._runner_is_running):
+            self.update_qc_metrics()
+        if has_changed or self._runner_is_running:
+            # remaining times change even if status do not
             self.status_changed.emit()
+        if has_changed and not self._unvalidated_rows:
+            self._save_outputs_snapshot()
+        self.progress_changed.emit()
 
     def _update_subject_status(self, row_index):
         has_changed = False
@@ -157,6 +281,9 @@ class LazyStudyModel(QtCore.QObject):
         return has_changed
 
     def _update_subject_output_files_status_if_needed(self, row_index):
+        if row_index in self._unvalidated_rows:
+            # keep the status of the snapshot until it is validated
+            return False
         subject_id = self._subjects_row_index_to_id[row_index]
         analysis = self.study.analyses[subject_id]
         if not analysis.has_some_results():
@@ -166,8 +293,104 @@ class LazyStudyModel(QtCore.QObject):
         else:
             status = (self.SOME_RESULTS, None)
         has_changed = self._update_subject_status_if_needed(row_index, status)
+        if self._outputs_snapshot is not None and (
+                has_changed
+                or self._outputs_snapshot.get_status(subject_id) is None):
+            self._record_output_files_status(subject_id, status[0])
         return has_changed
 
+    def _load_outputs_snapshot(self):
+        ''' Output files status of the subjects saved with the study: they
+        are displayed at once, and checked against the files in background
+        (see _validate_outputs_snapshot).
+        '''
+        if not self.study.output_directory \
+                or not os.path.isdir(self.study.output_directory):
+            return None
+        snapshot = OutputsSnapshot.from_study(self.study)
+        for row_index, subject_id in enumerate(
+                self._subjects_row_index_to_id):
+            status = self._snapshot_to_status.get(
+                snapshot.get_status(subject_id))
+            if status is not None:
+                self._status[row_index] = (status, None)
+                self._unvalidated_rows.add(row_index)
+        return snapshot
+
+    def _record_output_files_status(self, subject_id, status, stamps=None):
+        analysis = self.study.analyses[subject_id]
+        if stamps is None:
+            stamps = outputs_stamps(analysis.get_output_files().values())
+        self._outputs_snapshot.put(subject_id,
+                                   self._status_to_snapshot[status], stamps)
+
+    def _save_outputs_snapshot(self):
+        snapshot = self._outputs_snapshot
+        if snapshot is not None and snapshot.modified:
+            try:
+                snapshot.save()
+            except (IOError, OSError) as e:
+                print('Warning: cannot save the outputs snapshot: %s' % e)
+
+    def _validate_outputs_snapshot(self):
+        ''' Check the output files of the subjects having a status of the
+        snapshot, by batches, in a worker thread: only the subjects whose
+        files changed are looked up again.
+        '''
+        snapshot = self._outputs_snapshot
+        if snapshot is None:
+            return
+        snapshot.keep_only(self.study.subjects)
+        rows = sorted(self._unvalidated_rows)
+        size = self._snapshot_validation_batch_size
+        batches = [rows[index:index + size]
+                   for index in range(0, len(rows), size)]
+        self._validate_outputs_snapshot_batches(snapshot, batches)
+
+    def _validate_outputs_snapshot_batches(self, snapshot, batches):
+        if snapshot is not self._outputs_snapshot:
+            # the study has changed meanwhile
+            return
+        if not batches:
+            self._save_outputs_snapshot()
+            return
+        rows = batches[0]
+        batch = []
+        for row_index in rows:
+            subject_id = self._subjects_row_index_to_id[row_index]
+            analysis = self.study.analyses[subject_id]
+            batch.append((subject_id,
+                          list(analysis.get_output_files().values()),
+                          snapshot.get_stamps(subject_id)))
+        AsyncLoader.instance().load(
+            stale_subjects, (batch,),
+            lambda stale: self._outputs_snapshot_batch_validated(
+                snapshot, rows, stale, batches[1:]))
+
+    def _outputs_snapshot_batch_validated(self, snapshot, rows, stale,
+                                          batches):
+        if snapshot is not self._outputs_snapshot:
+            return
+        if stale is None:
+            # the files could not be checked: look them all up
+            stale = [(self._subjects_row_index_to_id[row_index], None)
+                     for row_index in rows]
+        stale = dict(stale)
+        has_changed = False
+        for row_index in rows:
+            self._unvalidated_rows.discard(row_index)
+            subject_id = self._subjects_row_index_to_id[row_index]
+            if subject_id not in stale:
+                continue
+            has_changed |= self._update_subject_status(row_index)
+            status = self._status[row_index][0]
+            if status in self._status_to_snapshot:
+                self._record_output_files_status(subject_id, status,
+                                                 stale[subject_id])
+        if has_changed:
+            self.status_changed.emit()
+        self._validate_outputs_snapshot_batches(snapshot, batches)
+
     def _update_subject_status_if_needed(self, row_index, status):
         has_changed = False 
         if self._status[row_index] != status:
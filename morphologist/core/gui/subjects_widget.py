@@ -5,6 +5,7 @@ import os
 
 from morphologist.core.gui.qt_backend import QtCore, QtGui, loadUi 
 from morphologist.core.gui import ui_directory
+from morphologist.core.profiling import profiled
 from soma.qt_gui import qt_backend
 
  
@@ -95,7 +96,9 @@ class SubjectsTableModel(QtCore.QAbstractTableModel):
     GROUPNAME_COL = 1
     SUBJECTNAME_COL = 2 
     SUBJECTSTATUS_COL = 3
-    header = ['', 'group', 'name', 'status']
+    REMAINING_TIME_COL = 4
+    QC_COL = 5
+    header = ['', 'group', 'name', 'status', 'remaining', 'QC']
 
     def __init__(self, study_model, parent=None):
         super(SubjectsTableModel, self).__init__(parent)
@@ -108,6 +111,7 @@ class SubjectsTableModel(QtCore.QAbstractTableModel):
         self._study_model.changed.connect(self.on_study_model_changed)
         self._study_model.current_subject_changed.connect(self.on_current_subject_changed)
         self._study_model.subject_selection_changed.connect(self.on_subject_changed)
+        self._study_model.qc_changed.connect(self.on_study_model_qc_changed)
 
     def subject_from_row_index(self, index):
         return self._study_model.get_subject(index)
@@ -118,7 +122,7 @@ class SubjectsTableModel(QtCore.QAbstractTableModel):
 
     # overrided Qt method
     def columnCount(self, parent=QtCore.QModelIndex()):
-        return 4
+        return len(self.header)
     
     # overrided Qt method
     def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
@@ -139,9 +143,15 @@ class SubjectsTableModel(QtCore.QAbstractTableModel):
                 return subject.name
             if column == SubjectsTableModel.SUBJECTSTATUS_COL:
                 return self._study_model.get_status_text(row)
+            if column == SubjectsTableModel.REMAINING_TIME_COL:
+                return self._study_model.get_remaining_time_text(row)
+            if column == SubjectsTableModel.QC_COL:
+                return self._study_model.get_qc_text(row)
         elif role == QtCore.Qt.ToolTipRole:
             if column == SubjectsTableModel.SUBJECTSTATUS_COL:
                 return self._study_model.get_status_tooltip(row)
+            if column == SubjectsTableModel.QC_COL:
+                return self._study_model.get_qc_tooltip(row)
         elif role == QtCore.Qt.BackgroundRole:
             if row == self._study_model.get_current_subject_index():
                 return QtGui.QApplication.palette().highlight()
@@ -165,15 +175,25 @@ class SubjectsTableModel(QtCore.QAbstractTableModel):
     def on_study_model_status_changed(self):
         self._update_subject_status_column()
 
+    @profiled('gui.update_subject_status_column')
     def _update_subject_status_column(self):
         top_left = self.index(0, SubjectsTableModel.SUBJECTSTATUS_COL,
                               QtCore.QModelIndex())
         bottom_right = self.index(self.rowCount(),
-                                  SubjectsTableModel.SUBJECTSTATUS_COL, 
+                                  SubjectsTableModel.REMAINING_TIME_COL,
                                   QtCore.QModelIndex())
         self.dataChanged.emit(top_left, bottom_right)
 
-    @QtCore.Slot()                
+    @QtCore.Slot()
+    def on_study_model_qc_changed(self):
+        top_left = self.index(0, SubjectsTableModel.QC_COL,
+                              QtCore.QModelIndex())
+        bottom_right = self.index(self.rowCount(), SubjectsTableModel.QC_COL,
+                                  QtCore.QModelIndex())
+        self.dataChanged.emit(top_left, bottom_right)
+
+    @QtCore.Slot()
+    @profiled('gui.subjects_model_reset')
     def on_study_model_changed(self):
         #self.reset()
         self.beginResetModel()
@@ -2,6 +2,7 @@ from __future__ import print_function
 
 from __future__ import absolute_import
 from morphologist.core.backends import Backend
+from morphologist.core.gui.async_loader import AsyncLoader
 from morphologist.core.utils.design_patterns import Visitable
 
 
@@ -29,11 +30,23 @@ class Histogram(VectorObject):
             = vector_graphic._backend.load_histogram(filename)
         return vector_graphic
 
+    @classmethod
+    def from_filename_async(cls, filename, callback):
+        vector_graphic = cls(_enable_init=True)
+        def data_loaded(histo_data):
+            if histo_data is None:
+                # load error
+                callback(None)
+                return
+            vector_graphic._friend_backend_object = histo_data
+            callback(vector_graphic)
+        AsyncLoader.instance().load(vector_graphic._backend.load_histogram,
+                                    (filename,), data_loaded)
+
     def reload(self):
         print('reload histo:', self._friend_backend_object.han_filename)
-        _friend_backend_object \
-            = self.__class__.from_filename(
-                self._friend_backend_object.han_filename)
+        self._friend_backend_object = self._backend.load_histogram(
+            self._friend_backend_object.han_filename)
 
 
 class VectorView(object):
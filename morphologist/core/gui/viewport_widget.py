@@ -1,9 +1,14 @@
 from __future__ import absolute_import
 import os
+from collections import deque
 import six
 
 from morphologist.core.backends.mixins import LoadObjectError, ViewType
-from morphologist.core.gui.object3d import Object3D, View
+from morphologist.core.cache import LoadedObjectsCache, file_stamp
+from morphologist.core.settings import settings
+from morphologist.core.gui.object3d import Object3D, View, FusionCache
+from morphologist.core.gui.async_loader import AsyncLoader
+from morphologist.core.backends import Backend
 from morphologist.core.gui.vector_graphics import VectorView
 from morphologist.core.gui.qt_backend import QtCore, QtGui, loadUi
 from morphologist.core.gui import ui_directory 
@@ -13,21 +18,58 @@ class AnalysisViewportModel(QtCore.QObject):
     changed = QtCore.pyqtSignal()
     parameter_changed = QtCore.pyqtSignal(list)
     use_async_load = False
+    # delay between two prefetched objects, leaving the event loop free to
+    # process user events
+    prefetch_interval = 50 # in ms
+    # parameter changes notified within this delay are sent to the views
+    # at once, so that each view is redrawn once per batch
+    coalescing_interval = 150 # in ms
+    # meshes also available as a decimated level of detail
+    lod_parameters = ()
 
     class LoadCallback(object):
-        def __init__(self, viewport_model, parameter_name):
+        def __init__(self, viewport_model, parameter_name, filename):
             self._viewport_model = viewport_model
-            self._parameter_name = parameter_name
+            self.parameter_name = parameter_name
+            self.filename = filename
+            self.stamp = file_stamp(filename)
 
         def object_loaded(self, object3d):
-            self._viewport_model._observed_object_loaded(self._parameter_name,
+            self._viewport_model._observed_object_loaded(self.parameter_name,
                 object3d, self)
 
+        def preview_loaded(self, object3d):
+            self._viewport_model._observed_object_preview_loaded(
+                self.parameter_name, object3d, self)
+
     def __init__(self, model):
         super(AnalysisViewportModel, self).__init__()
+        self._load_callbacks = set()
+        # parameters displaying a preview while their object loads
+        self._preview_parameters = set()
+        # decimated meshes of lod_parameters
+        self.lod_objects = {}
+        self._lod_requests = {}
+        # objects of previously displayed subjects, reused when the same
+        # unchanged files are displayed again
+        self.objects_cache = LoadedObjectsCache(
+            settings.viewport.cache_MB * 1024 * 1024)
+        self._prefetch_queue = deque()
+        self._prefetch_generation = 0
+        self._prefetch_timer = QtCore.QTimer(self)
+        self._prefetch_timer.setSingleShot(True)
+        self._prefetch_timer.setInterval(self.prefetch_interval)
+        self._prefetch_timer.timeout.connect(self._prefetch_next)
+        self._pending_parameters = set()
+        self.notifications_count = 0
+        self.batches_count = 0
+        self._coalescing_timer = QtCore.QTimer(self)
+        self._coalescing_timer.setSingleShot(True)
+        self._coalescing_timer.setInterval(self.coalescing_interval)
+        self._coalescing_timer.timeout.connect(
+            self._emit_pending_parameters)
         self._init_model(model)
         self._init_3d_objects()
-        self._load_callbacks = set()
 
     def _init_model(self, model):
         self._analysis_model = model
@@ -41,7 +83,14 @@ class AnalysisViewportModel(QtCore.QObject):
 
     @QtCore.Slot()
     def on_analysis_model_changed(self):
-        # XXX : may need a cache ?
+        # objects still loading belong to the previous analysis: they will
+        # only be cached
+        self._load_callbacks.clear()
+        self._preview_parameters.clear()
+        self._pending_parameters.clear()
+        self._coalescing_timer.stop()
+        self.lod_objects = {}
+        self._lod_requests = {}
         self._init_3d_objects()
         self.changed.emit()
 
@@ -55,35 +104,196 @@ class AnalysisViewportModel(QtCore.QObject):
                 if not self.use_async_load:
                     updated_parameters.append(parameter_name)
         if not self.use_async_load:
-            self.parameter_changed.emit(updated_parameters)
+            self._notify_parameters_changed(updated_parameters)
 
     def _update_observed_objects(self, parameter_name, filename):
         object3d = self.observed_objects[parameter_name]
-        if object3d is not None:
-            if os.path.exists(filename):
-                object3d.reload()
+        if parameter_name in self._preview_parameters:
+            # the file changed again while loading: start a new load
+            self._preview_parameters.discard(parameter_name)
+            object3d = None
+        if object3d is None:
+            object3d = self.objects_cache.get(filename)
+            if object3d is not None:
+                self._set_observed_object(parameter_name, object3d, filename)
+                return
+        if object3d is not None and not os.path.exists(filename):
+            self.objects_cache.discard(filename)
+            object3d = None
+        elif object3d is not None and not self.use_async_load:
+            stamp = file_stamp(filename)
+            object3d.reload()
+            self.objects_cache.put(filename, object3d, stamp)
+        elif self.use_async_load:
+            callback = AnalysisViewportModel.LoadCallback(self,
+                parameter_name, filename)
+            # a previous load of this parameter is out of date
+            self._load_callbacks = set(
+                load_callback for load_callback in self._load_callbacks
+                if load_callback.parameter_name != parameter_name)
+            self._load_callbacks.add( callback )
+            if object3d is None:
+                preview_callback = callback.preview_loaded
             else:
+                # a changed file is loaded again as a new object: the
+                # current one stays displayed until the callback swaps them
+                preview_callback = None
+            try:
+                # the callback sets the observed object
+                self.load_object_async(parameter_name, filename,
+                    callback.object_loaded, preview_callback)
+                return
+            except LoadObjectError:
+                self._load_callbacks.discard(callback)
                 object3d = None
         else:
             try:
-                if self.use_async_load:
-                    callback = AnalysisViewportModel.LoadCallback(self,
-                        parameter_name)
-                    self._load_callbacks.add( callback )
-                    self.load_object_async(parameter_name, filename,
-                        callback.object_loaded)
-                else:
-                    # sync load, no callback
-                    object3d = self.load_object(parameter_name, filename)
+                # sync load, no callback
+                stamp = file_stamp(filename)
+                object3d = self.load_object(parameter_name, filename)
+                self.objects_cache.put(filename, object3d, stamp)
             except LoadObjectError:
                 object3d = None
-        if not self.use_async_load:
+        self._set_observed_object(parameter_name, object3d, filename)
+
+    def _set_observed_object(self, parameter_name, object3d, filename):
+        self.observed_objects[parameter_name] = object3d
+        self._update_lod_object(parameter_name, object3d, filename)
+        if self.use_async_load:
+            # the caller does not emit parameter_changed in async mode
+            self._notify_parameters_changed([parameter_name])
+
+    def _observed_object_preview_loaded(self, parameter_name, object3d,
+                                        callback):
+        # displayed until the full object is loaded, never cached
+        if callback in self._load_callbacks:
             self.observed_objects[parameter_name] = object3d
+            self._preview_parameters.add(parameter_name)
+            self._notify_parameters_changed([parameter_name])
 
     def _observed_object_loaded(self, parameter_name, object3d, callback):
+        self.objects_cache.put(callback.filename, object3d, callback.stamp)
+        if callback not in self._load_callbacks:
+            # loaded for a previous analysis
+            return
         self.observed_objects[parameter_name] = object3d
+        self._preview_parameters.discard(parameter_name)
         self._load_callbacks.remove(callback)
-        self.parameter_changed.emit([parameter_name])
+        self._update_lod_object(parameter_name, object3d, callback.filename)
+        self._notify_parameters_changed([parameter_name])
+
+    def _notify_parameters_changed(self, parameter_names):
+        if not parameter_names:
+            return
+        self.notifications_count += 1
+        self._pending_parameters.update(parameter_names)
+        if not self._coalescing_timer.isActive():
+            self._coalescing_timer.start()
+
+    def _emit_pending_parameters(self):
+        parameter_names = sorted(self._pending_parameters)
+        self._pending_parameters.clear()
+        if parameter_names:
+            self.batches_count += 1
+            self.parameter_changed.emit(parameter_names)
+
+    def coalescing_statistics(self):
+        ''' Number of parameter change notifications, of batches sent to
+        the views, and of view redraws saved by batching (at most).
+        '''
+        return {'notifications': self.notifications_count,
+                'batches': self.batches_count,
+                'saved': self.notifications_count - self.batches_count}
+
+    def get_lod_object(self, parameter_name):
+        ''' Decimated version of an observed mesh, or the observed object
+        itself if it has no level of detail (yet).
+        '''
+        lod_object = self.lod_objects.get(parameter_name)
+        if lod_object is None:
+            return self.observed_objects[parameter_name]
+        return lod_object
+
+    def _update_lod_object(self, parameter_name, object3d, filename):
+        # the level of detail is built (or read from its disk cache) in a
+        # loading thread, then loaded by the display backend
+        if parameter_name not in self.lod_parameters:
+            return
+        self.lod_objects.pop(parameter_name, None)
+        self._lod_requests.pop(parameter_name, None)
+        max_vertices = settings.viewport.mesh_lod_vertices
+        if object3d is None or max_vertices == 0:
+            return
+        request = object()
+        self._lod_requests[parameter_name] = request
+        def lod_loaded(lod_object):
+            if lod_object is not None \
+                    and self._lod_requests.get(parameter_name) is request:
+                del self._lod_requests[parameter_name]
+                self.lod_objects[parameter_name] = lod_object
+                self._notify_parameters_changed([parameter_name])
+        def lod_created(lod_filename):
+            if lod_filename is not None \
+                    and self._lod_requests.get(parameter_name) is request:
+                Object3D.from_filename_async(lod_filename, lod_loaded)
+        backend = Backend.objects_loader_backend()
+        AsyncLoader.instance().load(backend.create_mesh_lod,
+                                    (filename, max_vertices), lod_created)
+
+    def prefetch(self, analyses):
+        ''' Load in background the objects of analyses which are likely to
+        be displayed next (neighbouring subjects).
+
+        Objects are loaded one at a time, after the objects of the current
+        analysis, and only go to the objects cache. A new call cancels the
+        previous prefetch.
+        '''
+        self._prefetch_generation += 1
+        self._prefetch_queue.clear()
+        if self.objects_cache.max_bytes == 0:
+            return
+        for analysis in analyses:
+            self._prefetch_queue.extend(
+                six.iteritems(self._analysis_observed_files(analysis)))
+        if self._prefetch_queue:
+            self._prefetch_timer.start()
+        else:
+            self._prefetch_timer.stop()
+
+    def _analysis_observed_files(self, analysis):
+        # files are read from the saved parameters of the analysis: the
+        # pipeline is shared with the current analysis and must not change
+        filenames = analysis.get_state_files(
+            dict((name, name) for name in self.observed_objects))
+        self._remove_useless_parameters(filenames)
+        return filenames
+
+    def _prefetch_next(self):
+        if self._load_callbacks:
+            # the current analysis is still loading
+            self._prefetch_timer.start()
+            return
+        while self._prefetch_queue:
+            parameter_name, filename = self._prefetch_queue.popleft()
+            if not os.path.isfile(filename) \
+                    or filename in self.objects_cache:
+                continue
+            generation = self._prefetch_generation
+            stamp = file_stamp(filename)
+            def object_prefetched(object3d):
+                self.objects_cache.put(filename, object3d, stamp)
+                if generation == self._prefetch_generation:
+                    self._prefetch_timer.start()
+            try:
+                if self.use_async_load:
+                    self.load_object_async(parameter_name, filename,
+                                           object_prefetched)
+                else:
+                    object_prefetched(self.load_object(parameter_name,
+                                                       filename))
+            except LoadObjectError:
+                self._prefetch_timer.start()
+            return
 
     @staticmethod
     def load_object(parameter_name, filename):
@@ -91,7 +301,11 @@ class AnalysisViewportModel(QtCore.QObject):
         return Object3D.from_filename(filename)
 
     @staticmethod
-    def load_object_async(parameter_name, filename, callback):
+    def load_object_async(parameter_name, filename, callback,
+                          preview_callback=None):
+        ''' preview_callback, if given, may be called before callback with
+        a quickly loaded, lower quality, object
+        '''
         _ = parameter_name
         Object3D.from_filename_async(filename, callback)
 
@@ -219,8 +433,11 @@ class ViewportView(QtGui.QFrame):
     def on_parameter_changed(self, changed_parameter_names):
         for parameter_name in self._observed_parameters:
             if parameter_name in changed_parameter_names:
-                self.update()
+                self._update_view()
                 break
+
+    def _update_view(self):
+        self.update()
     
     def update(self):
         try:
@@ -261,13 +478,27 @@ class Object3DViewportView(ViewportView):
         # XXX The view update method might need to create new object (eg. fusion)
         # Such object is stored in temp_object to prevent its deletion (due to Anatomist backend).
         self._temp_object = None
+        # fusions of the observed objects, reused across updates
+        self._fusions = FusionCache()
+        # small views display decimated meshes, extended views full ones
+        self._use_lod = restricted_controls
 
     def on_model_changed(self):
         super(Object3DViewportView, self).on_model_changed()
         self._temp_object = None
+        self._fusions.clear()
         if self._view.view_type != ViewType.THREE_D:
             self._view.reset_camera()
 
+    def _update_view(self):
+        # fusions the update does not use again are made of replaced
+        # objects: release them
+        self._fusions.mark()
+        try:
+            self.update()
+        finally:
+            self._fusions.sweep()
+
     def create_extended_view(self):
         window = ExtendedObject3DViewportView(self._viewport_model, 
                                               view_class=self.__class__,
@@ -278,6 +509,11 @@ class Object3DViewportView(ViewportView):
     def set_view_type(self, view_type):
         if self._view.view_type != ViewType.THREE_D:
             self._view.view_type = view_type
+
+    def _observed_mesh(self, parameter_name):
+        if self._use_lod:
+            return self._viewport_model.get_lod_object(parameter_name)
+        return self._viewport_model.observed_objects[parameter_name]
           
           
 class ExtendedObject3DViewportView(AnalysisViewportWidget):
@@ -0,0 +1,78 @@
+from __future__ import absolute_import
+from __future__ import division
+import numpy as np
+
+from morphologist.core.cache import derived_filenames
+
+
+def triangles_area(vertices, polygons):
+    ''' Total area of a triangles mesh '''
+    v0, v1, v2 = [vertices[polygons[:, i]] for i in range(3)]
+    return 0.5 * np.sqrt((np.cross(v1 - v0, v2 - v0) ** 2).sum(axis=1)).sum()
+
+
+def decimate_mesh(vertices, polygons, max_vertices):
+    ''' Simplify a triangles mesh by vertex clustering.
+
+    Vertices are grouped in the cells of a regular grid, each group is
+    replaced by its mean vertex, and the triangles which collapse are
+    removed. The grid step is the smallest one giving at most max_vertices
+    vertices. The result is meant for display only: it is not guaranteed to
+    be a manifold.
+
+    Parameters
+    ----------
+    vertices: numpy array
+        (n, 3) vertices coordinates
+    polygons: numpy array
+        (m, 3) vertices indices of the triangles
+    max_vertices: int
+
+    Returns
+    -------
+    vertices, polygons: numpy arrays
+        the simplified mesh
+    '''
+    vertices = np.asarray(vertices, dtype=np.float64)
+    polygons = np.asarray(polygons)
+    if len(vertices) <= max_vertices:
+        return vertices, polygons
+    origin = vertices.min(axis=0)
+    # on a surface, occupied cells ~ area / step ** 2
+    step = max(np.sqrt(triangles_area(vertices, polygons) / max_vertices),
+               1e-6)
+    while True:
+        cells = np.floor((vertices - origin) / step).astype(np.int64)
+        _, clusters = np.unique(
+            cells.view([('', cells.dtype)] * 3).ravel(), return_inverse=True)
+        clusters = clusters.ravel()
+        clusters_number = clusters.max() + 1
+        if clusters_number <= max_vertices:
+            break
+        step *= 1.1
+    counts = np.bincount(clusters, minlength=clusters_number)
+    new_vertices = np.empty((clusters_number, 3))
+    for axis in range(3):
+        new_vertices[:, axis] = np.bincount(
+            clusters, weights=vertices[:, axis],
+            minlength=clusters_number) / counts
+    new_polygons = clusters[polygons]
+    collapsed = (new_polygons[:, 0] == new_polygons[:, 1]) \
+        | (new_polygons[:, 1] == new_polygons[:, 2]) \
+        | (new_polygons[:, 0] == new_polygons[:, 2])
+    new_polygons = new_polygons[~collapsed]
+    # several triangles may collapse on the same one: keep the first one,
+    # with its orientation
+    sorted_polygons = np.sort(new_polygons, axis=1)
+    _, first = np.unique(
+        sorted_polygons.view([('', sorted_polygons.dtype)] * 3).ravel(),
+        return_index=True)
+    new_polygons = new_polygons[np.sort(first)]
+    return new_vertices.astype(np.float32), new_polygons.astype(np.uint32)
+
+
+def lod_filenames(filename, max_vertices):
+    ''' Candidate locations of the cached level of detail of a mesh, see
+    cache.derived_filenames
+    '''
+    return derived_filenames(filename, '.lod%d.gii' % max_vertices)
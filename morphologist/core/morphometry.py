@@ -0,0 +1,422 @@
+from __future__ import absolute_import
+import os
+import io
+import csv
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+import numpy as np
+import six
+
+from morphologist.core.cache import file_stamp
+
+
+# candidate delimiters of the morphometry tables, in order of preference
+DELIMITERS = ';,\t '
+# columns of the morphometry tables which are not measures
+NON_MEASURE_COLUMNS = ['subject', 'label', 'side', 'name']
+
+
+class MorphometrySchemaError(Exception):
+    pass
+
+
+def sniff_delimiter(line):
+    ''' Delimiter of a table, guessed from its header line '''
+    for delimiter in DELIMITERS:
+        if delimiter in line:
+            return delimiter
+    return DELIMITERS[0]
+
+
+def read_morphometry_table(filename):
+    ''' Read a morphometry table (a CSV file of any delimiter of DELIMITERS,
+    as written by siMorpho or the sulcal morphometry step).
+
+    Returns
+    -------
+    header: list
+        column names
+    rows: list
+        rows of string values
+    delimiter: str
+    '''
+    with io.open(filename, 'r', newline='') as f:
+        header_line = f.readline()
+        delimiter = sniff_delimiter(header_line)
+        skip_spaces = delimiter == ' '
+        header = next(csv.reader([header_line], delimiter=delimiter,
+                                 skipinitialspace=skip_spaces), [])
+        rows = [row for row in csv.reader(f, delimiter=delimiter,
+                                          skipinitialspace=skip_spaces)
+                if row]
+    if skip_spaces:
+        # siMorpho aligns columns with several spaces
+        header = [name for name in header if name]
+        rows = [[value for value in row if value] for row in rows]
+    return header, rows, delimiter
+
+
+def _read_job(job):
+    # reader pool job
+    subject_values, filename = job
+    try:
+        header, rows, delimiter = read_morphometry_table(filename)
+    except (IOError, OSError, csv.Error) as e:
+        return subject_values, filename, None, None, None, e
+    return subject_values, filename, header, rows, delimiter, None
+
+
+class AggregationReport(object):
+    ''' What aggregate_morphometry did with each input '''
+
+    def __init__(self):
+        self.columns = None
+        self.written = []       # filenames
+        self.rows_count = 0
+        self.unreadable = []    # (filename, error message)
+        self.mismatched = []    # (filename, missing columns, extra columns)
+
+    def __repr__(self):
+        return '<AggregationReport: %d files, %d rows, %d unreadable, ' \
+            '%d mismatched>' % (len(self.written), self.rows_count,
+                                len(self.unreadable), len(self.mismatched))
+
+
+def aggregate_morphometry(inputs, output_filename, readers=4,
+                          strict=False, delimiter=None, columnar=False):
+    ''' Concatenate the morphometry tables of several subjects.
+
+    Inputs are read by a pool of threads and written in their order as soon
+    as they are read, so that only a few tables are held in memory. The
+    columns of each table are checked against the columns of the first
+    one.
+
+    Parameters
+    ----------
+    inputs: list
+        (subject_values, filename) items. subject_values is an OrderedDict
+        of the values prepended to each row of filename (subject name...):
+        its keys become the first columns of the output.
+    output_filename: str
+    readers: int
+        number of reading threads
+    strict: bool
+        if True, raise MorphometrySchemaError when the columns of a table
+        differ from the ones of the first table. Otherwise, the table is
+        aligned on the first table columns (missing values are empty,
+        extra columns are dropped) and reported.
+    delimiter: str
+        delimiter of the output (default: the one of the first table)
+    columnar: bool
+        write a numpy .npz file with one array per column instead of a
+        CSV file. Numerical columns are stored as floats (NaN for missing
+        values).
+
+    Returns
+    -------
+    report: AggregationReport
+    '''
+    report = AggregationReport()
+    columns = None
+    columns_data = None
+    writer = None
+    output_file = None
+    pool = ThreadPool(max(1, readers))
+    try:
+        for subject_values, filename, header, rows, file_delimiter, error \
+                in pool.imap(_read_job, inputs):
+            if error is not None:
+                report.unreadable.append((filename, str(error)))
+                continue
+            extra_names = list(subject_values)
+            if columns is None:
+                # columns of the subject values are not duplicated
+                header_columns = [name for name in header
+                                  if name not in subject_values]
+                columns = extra_names + header_columns
+                report.columns = columns
+                if columnar:
+                    columns_data = OrderedDict((name, [])
+                                               for name in columns)
+                else:
+                    output_file = _open_output(output_filename)
+                    writer = csv.writer(
+                        output_file, lineterminator='\n',
+                        delimiter=delimiter or file_delimiter)
+                    writer.writerow(columns)
+            indices = _columns_indices(header, columns[len(extra_names):])
+            missing = [name for name, index
+                       in zip(columns[len(extra_names):], indices)
+                       if index is None]
+            extra = [name for name in header
+                     if name not in columns]
+            if missing or extra:
+                if strict:
+                    raise MorphometrySchemaError(
+                        '%s: missing columns: %s, unexpected columns: %s'
+                        % (filename, ', '.join(missing), ', '.join(extra)))
+                report.mismatched.append((filename, missing, extra))
+            prefix = [six.text_type(subject_values[name])
+                      for name in extra_names]
+            for row in rows:
+                values = prefix + [row[index]
+                                   if index is not None and index < len(row)
+                                   else '' for index in indices]
+                if columnar:
+                    for name, value in zip(columns, values):
+                        columns_data[name].append(value)
+                else:
+                    writer.writerow(values)
+            report.written.append(filename)
+            report.rows_count += len(rows)
+    finally:
+        pool.close()
+        pool.join()
+        if output_file is not None:
+            output_file.close()
+    if columnar and columns_data is not None:
+        np.savez_compressed(output_filename, **dict(
+            (name, _column_array(values))
+            for name, values in six.iteritems(columns_data)))
+    return report
+
+
+def _open_output(filename):
+    if six.PY2:
+        return open(filename, 'wb')
+    return open(filename, 'w', newline='')
+
+
+def _columns_indices(header, columns):
+    positions = dict((name, index) for index, name in enumerate(header))
+    return [positions.get(name) for name in columns]
+
+
+def _column_array(values):
+    try:
+        return np.array([float(value) if value != '' else np.nan
+                         for value in values])
+    except ValueError:
+        return np.array(values, dtype=six.text_type)
+
+
+def read_morphometry_measures(filename):
+    ''' Measures of a long format morphometry table (one row per label).
+
+    The label is the "label" column (or the first one), measures are the
+    other columns but NON_MEASURE_COLUMNS. Values which are not numbers are
+    NaN.
+
+    Returns
+    -------
+    measures: list
+        measure names
+    values: OrderedDict
+        label -> list of values of the measures
+    '''
+    header, rows, _ = read_morphometry_table(filename)
+    label_index = header.index('label') if 'label' in header else 0
+    measures_indices = [index for index, name in enumerate(header)
+                        if index != label_index
+                        and name not in NON_MEASURE_COLUMNS]
+    values = OrderedDict()
+    for row in rows:
+        if label_index >= len(row):
+            continue
+        label_values = []
+        for index in measures_indices:
+            try:
+                label_values.append(float(row[index]))
+            except (IndexError, ValueError):
+                label_values.append(np.nan)
+        values[row[label_index]] = label_values
+    return [header[index] for index in measures_indices], values
+
+
+def _read_measures_job(job):
+    # reader pool job
+    subject_id, filename = job
+    try:
+        return subject_id, read_morphometry_measures(filename)
+    except (IOError, OSError, csv.Error):
+        return subject_id, None
+
+
+class MorphometryStore(object):
+    ''' Morphometry of the subjects of a study as a dense
+    subjects x labels x measures float32 array (NaN for missing values),
+    saved in a single uncompressed .npz file.
+
+    subjects, labels and measures are the lists indexing the array. Labels
+    and measures are only appended: the array of a subject is still valid
+    when other subjects add new labels. The table of a subject is only read
+    again when its (mtime, size) stamp changes.
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.subjects = []
+        self.labels = []
+        self.measures = []
+        self.data = np.zeros((0, 0, 0), dtype=np.float32)
+        # subject_id -> (filename, mtime, size)
+        self._sources = {}
+        self._loaded = False
+
+    def load(self):
+        ''' Load the saved store, if any. Called by the accessors. '''
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            store = np.load(self.filename)
+        except (IOError, OSError, ValueError):
+            return
+        with store:
+            self.subjects = [six.text_type(s) for s in store['subjects']]
+            self.labels = [six.text_type(l) for l in store['labels']]
+            self.measures = [six.text_type(m) for m in store['measures']]
+            self.data = store['data']
+            # subjects without table are saved with an empty filename: they
+            # have no source, as in update()
+            self._sources = dict(
+                (subject_id, (six.text_type(filename), float(mtime),
+                              int(size)))
+                for subject_id, filename, (mtime, size)
+                in zip(self.subjects, store['filenames'], store['stamps'])
+                if filename)
+
+    @property
+    def subject_index(self):
+        return dict((s, i) for i, s in enumerate(self.subjects))
+
+    @property
+    def label_index(self):
+        return dict((l, i) for i, l in enumerate(self.labels))
+
+    def measure(self, name):
+        ''' subjects x labels array of a measure '''
+        self.load()
+        return self.data[:, :, self.measures.index(name)]
+
+    def subject_measures(self, subject_id):
+        ''' labels x measures array of a subject '''
+        self.load()
+        return self.data[self.subjects.index(subject_id)]
+
+    def update(self, subjects_files, readers=4):
+        ''' Read the new or changed tables and save the store.
+
+        Parameters
+        ----------
+        subjects_files: OrderedDict
+            subject_id -> morphometry table filename, in the store order.
+            Subjects without existing table are kept with NaN values.
+        readers: int
+            number of reading threads
+
+        Returns
+        -------
+        updated: list
+            ids of the subjects whose table was read again
+        '''
+        self.load()
+        sources = {}
+        jobs = []
+        for subject_id, filename in six.iteritems(subjects_files):
+            stamp = file_stamp(filename)
+            sources[subject_id] = (filename,) + tuple(stamp) \
+                if stamp is not None else None
+            if sources[subject_id] != self._sources.get(subject_id):
+                jobs.append((subject_id, filename))
+        pool = ThreadPool(max(1, min(readers, len(jobs))))
+        try:
+            results = pool.map(_read_measures_job, jobs)
+        finally:
+            pool.close()
+            pool.join()
+        labels = list(self.labels)
+        measures = list(self.measures)
+        known_labels = set(labels)
+        known_measures = set(measures)
+        for _, result in results:
+            if result is None:
+                continue
+            for measure in result[0]:
+                if measure not in known_measures:
+                    known_measures.add(measure)
+                    measures.append(measure)
+            for label in result[1]:
+                if label not in known_labels:
+                    known_labels.add(label)
+                    labels.append(label)
+        subjects = list(subjects_files)
+        data = np.empty((len(subjects), len(labels), len(measures)),
+                        dtype=np.float32)
+        data.fill(np.nan)
+        # unchanged subjects: copy their values in one go
+        old_index = self.subject_index
+        changed = set(subject_id for subject_id, _ in jobs)
+        kept = [(i, old_index[subject_id])
+                for i, subject_id in enumerate(subjects)
+                if subject_id not in changed and subject_id in old_index]
+        if kept:
+            new_rows, old_rows = [np.array(rows) for rows in zip(*kept)]
+            data[new_rows, :len(self.labels), :len(self.measures)] = \
+                self.data[old_rows]
+        label_index = dict((l, i) for i, l in enumerate(labels))
+        measure_index = dict((m, i) for i, m in enumerate(measures))
+        subject_index = dict((s, i) for i, s in enumerate(subjects))
+        for subject_id, result in results:
+            if result is None:
+                continue
+            subject_measures, values = result
+            columns = [measure_index[m] for m in subject_measures]
+            rows = [label_index[l] for l in values]
+            if rows and columns:
+                data[subject_index[subject_id], np.array(rows)[:, None],
+                     np.array(columns)] = np.array(list(values.values()))
+        self.subjects = subjects
+        self.labels = labels
+        self.measures = measures
+        self.data = data
+        self._sources = dict((subject_id, source)
+                             for subject_id, source in six.iteritems(sources)
+                             if source is not None)
+        self.save()
+        return [subject_id for subject_id, _ in jobs]
+
+    def save(self):
+        directory = os.path.dirname(self.filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        stamps = np.array([self._sources.get(subject_id, ('', 0., 0))[1:]
+                           for subject_id in self.subjects],
+                          dtype=np.float64).reshape((-1, 2))
+        filenames = [self._sources.get(subject_id, ('',))[0]
+                     for subject_id in self.subjects]
+        tmp_filename = self.filename + '.tmp'
+        with open(tmp_filename, 'wb') as f:
+            np.savez(f, data=self.data,
+                     subjects=np.array(self.subjects, dtype=six.text_type),
+                     labels=np.array(self.labels, dtype=six.text_type),
+                     measures=np.array(self.measures, dtype=six.text_type),
+                     filenames=np.array(filenames, dtype=six.text_type),
+                     stamps=stamps)
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        os.rename(tmp_filename, self.filename)
+
+
+def study_morphometry_store(study, readers=4):
+    ''' Update the morphometry store of a study, saved as
+    statistics/morphometry.npz in its output directory.
+    '''
+    subjects_files = OrderedDict()
+    for subject_id in study.subjects:
+        filename = study.analyses[subject_id].get_morphometry_file()
+        subjects_files[subject_id] = filename or ''
+    store = MorphometryStore(os.path.join(study.output_directory,
+                                          'statistics', 'morphometry.npz'))
+    store.update(subjects_files, readers=readers)
+    return store
@@ -0,0 +1,104 @@
+from __future__ import absolute_import
+import gzip
+import struct
+import numpy as np
+
+
+class NiftiError(Exception):
+    pass
+
+
+# NIfTI-1 datatype codes
+_DATATYPES = {
+    2: np.uint8,
+    4: np.int16,
+    8: np.int32,
+    16: np.float32,
+    64: np.float64,
+    256: np.int8,
+    512: np.uint16,
+    768: np.uint32,
+    1024: np.int64,
+    1280: np.uint64,
+}
+
+NIFTI1_HEADER_SIZE = 348
+
+
+def is_nifti_filename(filename):
+    return filename.endswith('.nii') or filename.endswith('.nii.gz')
+
+
+def _open(filename):
+    if filename.endswith('.gz'):
+        return gzip.open(filename, 'rb')
+    return open(filename, 'rb')
+
+
+def parse_nifti_header(data):
+    ''' Parse a NIfTI-1 header.
+
+    Parameters
+    ----------
+    data: bytes
+        at least the 348 first bytes of the file
+
+    Returns
+    -------
+    header: dict
+        shape (tuple), dtype (numpy dtype with the file endianness),
+        voxel_size (tuple), vox_offset (int), scl_slope and scl_inter
+        (floats, slope 0 means no scaling)
+    '''
+    if len(data) < NIFTI1_HEADER_SIZE:
+        raise NiftiError('truncated NIfTI header')
+    for endianness in ('<', '>'):
+        if struct.unpack(endianness + 'i', data[:4])[0] \
+                == NIFTI1_HEADER_SIZE:
+            break
+    else:
+        raise NiftiError('not a NIfTI-1 file')
+    if data[344:347] not in (b'n+1', b'ni1'):
+        raise NiftiError('not a NIfTI-1 file')
+    dim = struct.unpack(endianness + '8h', data[40:56])
+    datatype = struct.unpack(endianness + 'h', data[70:72])[0]
+    pixdim = struct.unpack(endianness + '8f', data[76:108])
+    vox_offset = struct.unpack(endianness + 'f', data[108:112])[0]
+    scl_slope, scl_inter = struct.unpack(endianness + '2f', data[112:120])
+    if datatype not in _DATATYPES:
+        raise NiftiError('unsupported NIfTI datatype: %d' % datatype)
+    ndim = dim[0]
+    if not 1 <= ndim <= 7:
+        raise NiftiError('bad NIfTI dimensions: %s' % (dim,))
+    if data[344:347] == b'ni1':
+        raise NiftiError('NIfTI header/image pairs are not supported')
+    return {'shape': tuple(int(d) for d in dim[1:ndim + 1]),
+            'dtype': np.dtype(_DATATYPES[datatype]).newbyteorder(endianness),
+            'voxel_size': tuple(float(p) for p in pixdim[1:ndim + 1]),
+            'vox_offset': int(vox_offset),
+            'scl_slope': float(scl_slope),
+            'scl_inter': float(scl_inter)}
+
+
+def read_nifti_header(filename):
+    with _open(filename) as f:
+        return parse_nifti_header(f.read(NIFTI1_HEADER_SIZE))
+
+
+def read_nifti(filename):
+    ''' Read a NIfTI-1 volume (.nii or .nii.gz) in memory.
+
+    Returns
+    -------
+    header: dict
+        see parse_nifti_header
+    data: numpy array
+        array indexed (x, y, z, ...), without intensity scaling
+    '''
+    with _open(filename) as f:
+        content = f.read()
+    header = parse_nifti_header(content)
+    count = int(np.prod(header['shape']))
+    data = np.frombuffer(content, dtype=header['dtype'], count=count,
+                         offset=header['vox_offset'])
+    return header, data.reshape(header['shape'], order='F')
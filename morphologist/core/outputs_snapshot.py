@@ -0,0 +1,140 @@
+from __future__ import absolute_import
+import os
+import json
+import six
+
+
+NO_RESULTS = 'none'
+SOME_RESULTS = 'some'
+ALL_RESULTS = 'all'
+
+SNAPSHOT_FORMAT_VERSION = '1.0'
+
+
+def file_mtime(filename):
+    ''' mtime of a file, or None if it does not exist '''
+    try:
+        return os.stat(filename).st_mtime
+    except OSError:
+        return None
+
+
+def outputs_stamps(filenames):
+    ''' filename -> mtime (None for missing files) '''
+    return dict((filename, file_mtime(filename)) for filename in filenames)
+
+
+def stale_subjects(batch):
+    ''' Subjects whose output files changed since their snapshot entry.
+
+    Parameters
+    ----------
+    batch: list
+        (subject_id, filenames, recorded stamps or None) items
+
+    Returns
+    -------
+    stale: list
+        (subject_id, current stamps) items
+    '''
+    stale = []
+    for subject_id, filenames, recorded_stamps in batch:
+        stamps = outputs_stamps(filenames)
+        if stamps != recorded_stamps:
+            stale.append((subject_id, stamps))
+    return stale
+
+
+class OutputsSnapshot(object):
+    ''' Output files status of the subjects of a study (no, some or all
+    results), with the mtimes of the expected output files it was computed
+    from, saved as JSON next to the study file.
+
+    It lets the study be displayed without looking up the outputs of every
+    subject first: the recorded status is used until the recorded mtimes
+    are found different from the files ones. Paths are stored relative to
+    the study directory, so that a moved study keeps its snapshot.
+    '''
+    filename = 'study_outputs_snapshot.json'
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._entries = None
+        self.modified = False
+
+    @classmethod
+    def from_study(cls, study):
+        return cls(os.path.dirname(study.backup_filepath))
+
+    @property
+    def filepath(self):
+        return os.path.join(self.directory, self.filename)
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = {}
+            try:
+                with open(self.filepath) as f:
+                    content = json.load(f)
+                if content.get('snapshot_format_version') \
+                        == SNAPSHOT_FORMAT_VERSION:
+                    self._entries = content['subjects']
+            except (IOError, OSError, ValueError, KeyError, AttributeError):
+                pass
+        return self._entries
+
+    def get_status(self, subject_id):
+        ''' Recorded status of subject_id (NO_RESULTS, SOME_RESULTS or
+        ALL_RESULTS), or None
+        '''
+        entry = self._load().get(subject_id)
+        if entry is None:
+            return None
+        return entry['status']
+
+    def get_stamps(self, subject_id):
+        ''' Recorded filename -> mtime of subject_id, or None '''
+        entry = self._load().get(subject_id)
+        if entry is None:
+            return None
+        return dict((self._absolute_path(path), mtime)
+                    for path, mtime in six.iteritems(entry['files']))
+
+    def put(self, subject_id, status, stamps):
+        files = dict((self._relative_path(filename), mtime)
+                     for filename, mtime in six.iteritems(stamps))
+        entry = {'status': status, 'files': files}
+        entries = self._load()
+        if entries.get(subject_id) != entry:
+            entries[subject_id] = entry
+            self.modified = True
+
+    def keep_only(self, subject_ids):
+        ''' Drop the entries of the subjects removed from the study '''
+        entries = self._load()
+        subject_ids = set(subject_ids)
+        for subject_id in list(entries):
+            if subject_id not in subject_ids:
+                del entries[subject_id]
+                self.modified = True
+
+    def save(self):
+        tmp_filepath = self.filepath + '.tmp'
+        with open(tmp_filepath, 'w') as f:
+            json.dump({'snapshot_format_version': SNAPSHOT_FORMAT_VERSION,
+                       'subjects': self._load()}, f)
+        if os.path.exists(self.filepath):
+            os.remove(self.filepath)
+        os.rename(tmp_filepath, self.filepath)
+        self.modified = False
+
+    def _relative_path(self, filename):
+        directory = os.path.join(self.directory, '')
+        if filename.startswith(directory):
+            return filename[len(directory):]
+        return filename
+
+    def _absolute_path(self, path):
+        if os.path.isabs(path):
+            return path
+        return os.path.join(self.directory, path)
@@ -0,0 +1,331 @@
+from __future__ import print_function
+from __future__ import absolute_import
+import os
+import sys
+import time
+import atexit
+import functools
+import threading
+import six
+
+from morphologist.core.settings import settings
+
+
+NO_CAPTURE = 'none'
+CPROFILE_CAPTURE = 'cProfile'
+PYINSTRUMENT_CAPTURE = 'pyinstrument'
+
+# number of functions listed in printed cProfile captures
+CPROFILE_PRINTED_FUNCTIONS = 30
+
+
+class PhaseStats(object):
+    ''' Calls number, total and max durations (in seconds) of a phase '''
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.
+        self.max = 0.
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+
+class OperationStats(object):
+    ''' Timers and counters recorded during an operation (or a session) '''
+
+    def __init__(self, name):
+        self.name = name
+        self.start_time = time.time()
+        self.duration = None
+        self.phases = {}    # name -> PhaseStats
+        self.counters = {}  # name -> int
+
+    def add_phase(self, name, duration):
+        stats = self.phases.get(name)
+        if stats is None:
+            stats = self.phases[name] = PhaseStats()
+        stats.add(duration)
+
+    def count(self, name, number):
+        self.counters[name] = self.counters.get(name, 0) + number
+
+    def breakdown(self):
+        ''' Per-phase breakdown as text, the longest phases first. Phases may
+        be nested, so their shares may add up to more than 100%.
+        '''
+        duration = self.duration
+        if duration is None:
+            duration = time.time() - self.start_time
+        lines = ['%s: %.3fs' % (self.name, duration)]
+        if self.phases:
+            width = max(len(name) for name in self.phases)
+            lines.append('  %-*s %8s %10s %10s %10s %6s'
+                         % (width, 'phase', 'calls', 'total (s)', 'mean (s)',
+                            'max (s)', '%'))
+            for name, stats in sorted(six.iteritems(self.phases),
+                                      key=lambda item: -item[1].total):
+                share = 100. * stats.total / duration if duration else 0.
+                lines.append('  %-*s %8d %10.3f %10.4f %10.4f %6.1f'
+                             % (width, name, stats.count, stats.total,
+                                stats.total / stats.count, stats.max,
+                                share))
+        if self.counters:
+            lines.append('  counters:')
+            for name, value in sorted(six.iteritems(self.counters)):
+                lines.append('    %s: %d' % (name, value))
+        return '\n'.join(lines)
+
+
+class _NullContext(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+class _Phase(object):
+
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+
+    def __enter__(self):
+        self._start_time = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._profiler._add_phase(self._name, time.time() - self._start_time)
+        return False
+
+
+class _Operation(object):
+
+    def __init__(self, profiler, name):
+        self._profiler = profiler
+        self._name = name
+        self._phase = None
+
+    def __enter__(self):
+        if not self._profiler._start_operation(self._name):
+            # nested in another operation: only a phase of it
+            self._phase = _Phase(self._profiler, self._name)
+            self._phase.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._phase is not None:
+            return self._phase.__exit__(*exc_info)
+        self._profiler._end_operation()
+        return False
+
+
+class Profiler(object):
+    ''' Lightweight instrumentation of the study, runner and GUI operations.
+
+    An operation (loading a study, running it...) is made of named phases,
+    which are timed, and of counters. When an operation ends, its per-phase
+    breakdown is printed, or written in the profiling directory, optionally
+    with a cProfile or pyinstrument capture of the operation thread. Phases
+    out of any operation (status polls...) are only accumulated in the
+    session statistics, reported at exit.
+
+    When disabled, phases and operations cost a function call.
+    '''
+
+    def __init__(self, enabled=False, capture=NO_CAPTURE, directory=None):
+        self._lock = threading.RLock()
+        self._operation = None
+        self._capture = None
+        self._atexit_registered = False
+        self.session = OperationStats('session')
+        self.last_operation = None
+        self.configure(enabled, capture, directory)
+
+    @classmethod
+    def from_settings(cls, profiling_settings):
+        return cls(profiling_settings.enabled,
+                   profiling_settings.capture,
+                   profiling_settings.directory or None)
+
+    def configure(self, enabled, capture=NO_CAPTURE, directory=None):
+        '''
+        Parameters
+        ----------
+        enabled: bool
+        capture: str
+            NO_CAPTURE, CPROFILE_CAPTURE or PYINSTRUMENT_CAPTURE
+        directory: str
+            directory of the reports (default: printed on stdout)
+        '''
+        self.enabled = enabled
+        self.capture = capture or NO_CAPTURE
+        self.directory = directory
+        if enabled and not self._atexit_registered:
+            atexit.register(self._report_session)
+            self._atexit_registered = True
+
+    def phase(self, name):
+        ''' Context manager timing a phase of the current operation '''
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return _Phase(self, name)
+
+    def operation(self, name):
+        ''' Context manager of an operation, reported when it ends. An
+        operation started while another one is running is one of its phases.
+        '''
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return _Operation(self, name)
+
+    def count(self, name, number=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.session.count(name, number)
+            if self._operation is not None:
+                self._operation.count(name, number)
+
+    def reset(self):
+        with self._lock:
+            self.session = OperationStats('session')
+            self.last_operation = None
+
+    def _add_phase(self, name, duration):
+        with self._lock:
+            self.session.add_phase(name, duration)
+            if self._operation is not None:
+                self._operation.add_phase(name, duration)
+
+    def _start_operation(self, name):
+        with self._lock:
+            if self._operation is not None:
+                return False
+            self._operation = OperationStats(name)
+        self._capture = self._start_capture()
+        return True
+
+    def _end_operation(self):
+        capture = self._capture
+        self._capture = None
+        if capture is not None:
+            capture.disable()
+        with self._lock:
+            operation = self._operation
+            self._operation = None
+            operation.duration = time.time() - operation.start_time
+            self.session.add_phase(operation.name, operation.duration)
+            self.last_operation = operation
+        self._report(operation, capture)
+
+    def _start_capture(self):
+        if self.capture == CPROFILE_CAPTURE:
+            capture = _CProfileCapture()
+        elif self.capture == PYINSTRUMENT_CAPTURE:
+            try:
+                capture = _PyinstrumentCapture()
+            except ImportError:
+                print('Warning: pyinstrument is not installed, operations '
+                      'are not captured')
+                self.capture = NO_CAPTURE
+                return None
+        else:
+            return None
+        capture.enable()
+        return capture
+
+    def _report(self, operation, capture=None):
+        text = operation.breakdown()
+        if self.directory is None:
+            print(text)
+            if capture is not None:
+                capture.print_report()
+            sys.stdout.flush()
+            return
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        basename = os.path.join(
+            self.directory,
+            '%s_%s' % (time.strftime('%Y%m%d-%H%M%S',
+                                     time.localtime(operation.start_time)),
+                       operation.name))
+        with open(basename + '.txt', 'w') as f:
+            f.write(text + '\n')
+        if capture is not None:
+            capture.save(basename)
+
+    def _report_session(self):
+        if self.enabled and self.session.phases:
+            self.session.duration = time.time() - self.session.start_time
+            self._report(self.session)
+
+
+class _CProfileCapture(object):
+
+    def __init__(self):
+        import cProfile
+        self._profile = cProfile.Profile()
+
+    def enable(self):
+        self._profile.enable()
+
+    def disable(self):
+        self._profile.disable()
+
+    def print_report(self):
+        import pstats
+        stats = pstats.Stats(self._profile, stream=sys.stdout)
+        stats.sort_stats('cumulative').print_stats(CPROFILE_PRINTED_FUNCTIONS)
+
+    def save(self, basename):
+        self._profile.dump_stats(basename + '.prof')
+
+
+class _PyinstrumentCapture(object):
+
+    def __init__(self):
+        import pyinstrument
+        self._profiler = pyinstrument.Profiler()
+
+    def enable(self):
+        self._profiler.start()
+
+    def disable(self):
+        self._profiler.stop()
+
+    def print_report(self):
+        print(self._profiler.output_text(unicode=False, color=False))
+
+    def save(self, basename):
+        with open(basename + '.html', 'w') as f:
+            f.write(self._profiler.output_html())
+
+
+profiler = Profiler.from_settings(settings.profiling)
+
+
+def profiled(name, operation=False):
+    ''' Decorator timing the calls of a function as a phase (or as an
+    operation) of the profiler
+    '''
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not profiler.enabled:
+                return function(*args, **kwargs)
+            if operation:
+                context = profiler.operation(name)
+            else:
+                context = profiler.phase(name)
+            with context:
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,179 @@
+from __future__ import absolute_import
+from __future__ import division
+import time
+import collections
+import six
+
+
+class ProgressEstimator(object):
+    ''' Throughput and remaining time estimation of a running workflow.
+
+    The estimator is fed with job completion timestamps. The throughput is
+    computed over a rolling time window; before any subject is finished, the
+    remaining time is estimated from the expected duration of each step
+    (see RuntimeHistory.estimated_duration) and the number of jobs which can
+    run in parallel.
+    '''
+
+    def __init__(self, window=3600., step_duration=None, parallel_jobs=1,
+                 clock=time.time):
+        '''
+        Parameters
+        ----------
+        window: float
+            rolling window (in seconds) used to compute the throughput
+        step_duration: callable, optional
+            step_id -> expected duration in seconds, or None if unknown
+        parallel_jobs: int
+            number of jobs which can run at the same time
+        clock: callable
+            returns the current time, in seconds
+        '''
+        self.window = window
+        self.step_duration = step_duration
+        self.parallel_jobs = max(1, parallel_jobs)
+        self._clock = clock
+        self.start({})
+
+    def start(self, subject_jobs, start_time=None):
+        '''
+        Parameters
+        ----------
+        subject_jobs: dict
+            subject_id -> {job_id: step_id} for all the jobs of the workflow
+        '''
+        if start_time is None:
+            start_time = self._clock()
+        self._start_time = start_time
+        self._subject_jobs = dict(
+            [(subject_id, dict(jobs))
+             for subject_id, jobs in six.iteritems(subject_jobs)])
+        self._finished_jobs = dict([(subject_id, set())
+                                    for subject_id in self._subject_jobs])
+        self._observed_durations = {} # step_id -> [durations]
+        self._jobs_completion = collections.deque()
+        self._subjects_completion = collections.deque()
+
+    def add_subjects(self, subject_jobs):
+        ''' Add subjects to a started workflow. Subjects which are already
+        known are replaced (they are run again).
+        '''
+        for subject_id, jobs in six.iteritems(subject_jobs):
+            self._subject_jobs[subject_id] = dict(jobs)
+            self._finished_jobs[subject_id] = set()
+
+    def jobs_restarted(self, subject_id, job_ids):
+        finished_jobs = self._finished_jobs.get(subject_id)
+        if finished_jobs is not None:
+            finished_jobs.difference_update(job_ids)
+
+    def job_finished(self, subject_id, job_id, timestamp=None, duration=None,
+                     aborted=False):
+        ''' Notify the end of a job. Aborted jobs (which have not run) are
+        not taken into account in the throughput.
+        '''
+        finished_jobs = self._finished_jobs.get(subject_id)
+        if finished_jobs is None or job_id in finished_jobs:
+            return
+        if timestamp is None:
+            timestamp = self._clock()
+        finished_jobs.add(job_id)
+        if not aborted:
+            self._jobs_completion.append(timestamp)
+        if duration is not None:
+            step_id = self._subject_jobs[subject_id].get(job_id)
+            self._observed_durations.setdefault(step_id, []).append(duration)
+        if len(finished_jobs) == len(self._subject_jobs[subject_id]):
+            self._subjects_completion.append(timestamp)
+
+    def subjects_count(self):
+        return len(self._subject_jobs)
+
+    def finished_subjects_count(self):
+        return len([subject_id
+                    for subject_id, jobs in six.iteritems(self._subject_jobs)
+                    if len(self._finished_jobs[subject_id]) == len(jobs)])
+
+    def is_subject_finished(self, subject_id):
+        jobs = self._subject_jobs.get(subject_id)
+        if jobs is None:
+            return True
+        return len(self._finished_jobs[subject_id]) == len(jobs)
+
+    def throughput(self):
+        ''' Finished subjects per hour over the rolling window '''
+        return self._rate(self._subjects_completion) * 3600.
+
+    def jobs_throughput(self):
+        ''' Finished jobs per hour over the rolling window '''
+        return self._rate(self._jobs_completion) * 3600.
+
+    def _rate(self, completion_times):
+        now = self._clock()
+        while completion_times and completion_times[0] < now - self.window:
+            completion_times.popleft()
+        span = min(self.window, now - self._start_time)
+        if span <= 0 or not completion_times:
+            return 0.
+        return len(completion_times) / span
+
+    def eta(self, subject_id=None):
+        ''' Remaining time, in seconds, for the whole workflow or for a
+        single subject. Returns None when it cannot be estimated yet.
+        '''
+        if subject_id is not None:
+            return self._subject_remaining_time(subject_id)
+        remaining_subjects = self.subjects_count() \
+            - self.finished_subjects_count()
+        if remaining_subjects == 0:
+            return 0.
+        subjects_rate = self._rate(self._subjects_completion)
+        if subjects_rate > 0:
+            return remaining_subjects / subjects_rate
+        remaining_jobs = sum([len(jobs) - len(self._finished_jobs[subject_id])
+                              for subject_id, jobs
+                              in six.iteritems(self._subject_jobs)])
+        jobs_rate = self._rate(self._jobs_completion)
+        if jobs_rate > 0:
+            return remaining_jobs / jobs_rate
+        total = 0.
+        for subject_id in self._subject_jobs:
+            remaining = self._subject_remaining_time(subject_id)
+            if remaining is None:
+                return None
+            total += remaining
+        return total / self.parallel_jobs
+
+    def _subject_remaining_time(self, subject_id):
+        jobs = self._subject_jobs.get(subject_id)
+        if jobs is None:
+            return None
+        finished_jobs = self._finished_jobs[subject_id]
+        remaining = 0.
+        for job_id, step_id in six.iteritems(jobs):
+            if job_id in finished_jobs:
+                continue
+            duration = self._step_duration(step_id)
+            if duration is None:
+                return None
+            remaining += duration
+        return remaining
+
+    def _step_duration(self, step_id):
+        durations = self._observed_durations.get(step_id)
+        if durations:
+            return sum(durations) / len(durations)
+        if self.step_duration is not None:
+            return self.step_duration(step_id)
+        return None
+
+
+def format_duration(seconds):
+    if seconds is None:
+        return ''
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return '%d s' % seconds
+    if seconds < 3600:
+        return '%d min' % (seconds // 60)
+    return '%dh%02d' % (seconds // 3600, (seconds % 3600) // 60)
@@ -0,0 +1,95 @@
+from __future__ import absolute_import
+from __future__ import division
+import numpy as np
+
+from morphologist.core.cache import derived_filenames
+
+
+# volumes bigger than this are first displayed downsampled
+PREVIEW_MAX_VOXELS = 128 ** 3
+
+
+def downsampling_factor(shape, max_voxels=PREVIEW_MAX_VOXELS):
+    ''' Smallest integer factor bringing a volume of the given (3D) shape
+    under max_voxels voxels. 1 means that the volume is small enough.
+    '''
+    shape = [int(s) for s in shape[:3]]
+    factor = 1
+    while np.prod([-(-s // factor) for s in shape]) > max_voxels:
+        factor += 1
+    return factor
+
+
+def downsample(array, factor, method='mean'):
+    ''' Downsample the 3 first dimensions of a volume array by an integer
+    factor.
+
+    Borders are padded by replicating the last voxels, so that the shape of
+    the result is ceil(shape / factor).
+
+    Parameters
+    ----------
+    array: numpy array
+        at least 3D volume
+    factor: int
+    method: str
+        'mean': average of the factor**3 blocks, for intensity images.
+        'nearest': voxel at the center of each block, for label images.
+    '''
+    if factor == 1:
+        return array
+    shape = array.shape[:3]
+    padding = [(0, -s % factor) for s in shape] \
+        + [(0, 0)] * (array.ndim - 3)
+    if any(p[1] for p in padding):
+        array = np.pad(array, padding, mode='edge')
+    if method == 'nearest':
+        center = factor // 2
+        return np.ascontiguousarray(
+            array[center::factor, center::factor, center::factor])
+    if method != 'mean':
+        raise ValueError("unknown downsampling method: '%s'" % method)
+    blocks_shape = []
+    for s in array.shape[:3]:
+        blocks_shape += [s // factor, factor]
+    blocks = array.reshape(tuple(blocks_shape) + array.shape[3:])
+    result = blocks.mean(axis=(1, 3, 5))
+    if np.issubdtype(array.dtype, np.integer):
+        result = np.round(result)
+    return result.astype(array.dtype)
+
+
+def strided_downsample(data, factor, method='mean'):
+    ''' Downsample the 3 first dimensions of a volume array by an integer
+    factor, reading only one axial slice out of factor.
+
+    On a memory mapped volume, only about 1 / factor of the file is read,
+    so that a preview is built much faster than the volume is loaded. The
+    kept slices are downsampled as in downsample; the shape of the result
+    is ceil(shape / factor).
+    '''
+    if factor == 1:
+        return np.asarray(data)
+    slices = np.asarray(data[:, :, ::factor])
+    if method == 'nearest':
+        return np.ascontiguousarray(slices[::factor, ::factor])
+    if method != 'mean':
+        raise ValueError("unknown downsampling method: '%s'" % method)
+    padding = [(0, -s % factor) for s in slices.shape[:2]] \
+        + [(0, 0)] * (slices.ndim - 2)
+    if any(p[1] for p in padding):
+        slices = np.pad(slices, padding, mode='edge')
+    blocks = slices.reshape((slices.shape[0] // factor, factor,
+                             slices.shape[1] // factor, factor)
+                            + slices.shape[2:])
+    result = blocks.mean(axis=(1, 3))
+    if np.issubdtype(slices.dtype, np.integer):
+        result = np.round(result)
+    return result.astype(slices.dtype)
+
+
+def preview_filenames(filename, factor):
+    ''' Candidate locations of the cached preview of a volume, see
+    cache.derived_filenames
+    '''
+    return derived_filenames(filename, '.preview%d.nii' % factor)
@@ -0,0 +1,293 @@
+from __future__ import absolute_import
+from __future__ import division
+import os
+import re
+import csv
+from collections import OrderedDict
+import numpy as np
+import six
+
+from morphologist.core.batch import SubjectsBatch
+from morphologist.core.segmentation_statistics import \
+    SegmentationStatistics, ROLES as SEGMENTATION_ROLES
+
+
+# metrics of a subject, computed from the files of their roles
+MESH_ROLES = ['left_white_mesh', 'right_white_mesh',
+              'left_pial_mesh', 'right_pial_mesh']
+GRAPH_ROLES = ['left_sulci', 'right_sulci']
+FILES_METRICS = ['grey_mean', 'grey_sigma', 'white_mean', 'white_sigma'] \
+    + ['%s_vertices' % role for role in MESH_ROLES] \
+    + ['%s_nodes' % role for role in GRAPH_ROLES]
+# metrics taken from the segmentation statistics
+SEGMENTATION_METRICS = ['brain_volume']
+METRICS = SEGMENTATION_METRICS + FILES_METRICS
+
+# subjects with a robust z-score above this are outliers
+OUTLIER_THRESHOLD = 3.5
+# MAD of a normal distribution -> standard deviation
+MAD_TO_SIGMA = 1.4826
+
+_GIFTI_POINTSET = re.compile(
+    br'<DataArray\b[^>]*?Intent="NIFTI_INTENT_POINTSET"[^>]*>')
+_GIFTI_DIM0 = re.compile(br'\bDim0="(\d+)"')
+
+
+def read_histo_analysis(filename):
+    ''' Grey and white matter modes of a histogram analysis (.han) file:
+
+        gray: mean: 520 sigma: 45
+        white: mean: 700 sigma: 30
+
+    Returns
+    -------
+    modes: dict
+        grey_mean, grey_sigma, white_mean, white_sigma
+    '''
+    modes = {}
+    with open(filename) as f:
+        for line in f:
+            items = line.replace(':', ' ').split()
+            if len(items) != 5 or items[1] != 'mean' \
+                    or items[3] != 'sigma':
+                continue
+            tissue = {'gray': 'grey', 'grey': 'grey',
+                      'white': 'white'}.get(items[0])
+            if tissue is not None:
+                modes['%s_mean' % tissue] = float(items[2])
+                modes['%s_sigma' % tissue] = float(items[4])
+    return modes
+
+
+def gifti_vertex_count(filename, block_size=65536):
+    ''' Number of vertices of a GIfTI mesh, read from the XML header of its
+    coordinates array without decoding the data.
+    '''
+    content = b''
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            content += block
+            match = _GIFTI_POINTSET.search(content)
+            if match is not None:
+                dim0 = _GIFTI_DIM0.search(match.group(0))
+                if dim0 is None:
+                    raise ValueError('no vertices dimension in %s'
+                                     % filename)
+                return int(dim0.group(1))
+            if not block:
+                raise ValueError('no vertices array in %s' % filename)
+            # keep the end: a tag may be cut between two blocks
+            content = content[-1024:]
+
+
+def graph_nodes_count(filename):
+    ''' Number of nodes of a sulci graph (.arg) '''
+    count = 0
+    with open(filename, 'rb') as f:
+        for line in f:
+            if line.startswith(b'*BEGIN NODE'):
+                count += 1
+    return count
+
+
+def subject_qc_metrics(files):
+    ''' QC metrics of a subject computed from its files (the segmentation
+    metrics are not).
+
+    Parameters
+    ----------
+    files: dict
+        role -> filename, see Analysis.get_qc_metrics_parameter_names
+
+    Returns
+    -------
+    metrics: dict
+        metric of FILES_METRICS -> value, None when the file is missing or
+        cannot be read
+    '''
+    metrics = dict((metric, None) for metric in FILES_METRICS)
+    filename = files.get('histo_analysis')
+    if filename is not None:
+        try:
+            metrics.update(read_histo_analysis(filename))
+        except (IOError, OSError, ValueError):
+            pass
+    for role in MESH_ROLES:
+        filename = files.get(role)
+        if filename is not None and filename.endswith('.gii'):
+            try:
+                metrics['%s_vertices' % role] = gifti_vertex_count(filename)
+            except (IOError, OSError, ValueError):
+                pass
+    for role in GRAPH_ROLES:
+        filename = files.get(role)
+        if filename is not None:
+            try:
+                metrics['%s_nodes' % role] = graph_nodes_count(filename)
+            except (IOError, OSError):
+                pass
+    return metrics
+
+
+def robust_z_scores(values):
+    ''' (value - median) / (MAD_TO_SIGMA * median absolute deviation).
+
+    Missing values (None or NaN) get a NaN score. All scores are NaN with
+    less than 3 values, and 0 when the deviation is 0 and the value is the
+    median.
+    '''
+    values = np.array([np.nan if value is None else value
+                       for value in values], dtype=np.float64)
+    scores = np.empty(values.shape)
+    scores.fill(np.nan)
+    known = ~np.isnan(values)
+    if known.sum() < 3:
+        return scores
+    median = np.median(values[known])
+    deviation = MAD_TO_SIGMA * np.median(np.abs(values[known] - median))
+    differences = values[known] - median
+    if deviation == 0:
+        scores[known] = np.where(differences == 0, 0.,
+                                 np.sign(differences) * np.inf)
+    else:
+        scores[known] = differences / deviation
+    return scores
+
+
+def find_outliers(table, threshold=OUTLIER_THRESHOLD):
+    ''' Outlier metrics of each subject.
+
+    Parameters
+    ----------
+    table: OrderedDict
+        subject_id -> {metric: value}
+
+    Returns
+    -------
+    outliers: dict
+        subject_id -> OrderedDict(metric -> robust z-score), for the
+        subjects having at least one metric with a score above threshold
+    '''
+    subject_ids = list(table)
+    outliers = {}
+    for metric in METRICS:
+        scores = robust_z_scores([table[subject_id].get(metric)
+                                  for subject_id in subject_ids])
+        for subject_id, score in zip(subject_ids, scores):
+            if abs(score) > threshold:
+                outliers.setdefault(subject_id, OrderedDict())[metric] \
+                    = float(score)
+    return outliers
+
+
+class QCMetrics(SubjectsBatch):
+    ''' QC metrics of the subjects of a study, and their outliers.
+
+    Metrics are cheap features of the outputs (histogram analysis modes,
+    mesh and graph sizes) and the brain volume of the segmentation
+    statistics, updated together. They are computed in a process pool and
+    cached per subject: a subject is only processed again when one of its
+    files has changed.
+    '''
+    table_filename = 'qc_metrics.csv'
+    cache_filename = 'qc_metrics_cache.json'
+    study_subdirectory = SegmentationStatistics.study_subdirectory
+    subject_function = staticmethod(subject_qc_metrics)
+
+    def __init__(self, directory, threshold=OUTLIER_THRESHOLD):
+        '''
+        Parameters
+        ----------
+        directory: str
+            directory of the exported tables and of the caches
+        threshold: float
+            robust z-score above which a metric is an outlier
+        '''
+        super(QCMetrics, self).__init__(directory)
+        self.threshold = threshold
+        self.segmentation_statistics = SegmentationStatistics(directory)
+        self.outliers = {}
+
+    @classmethod
+    def from_study(cls, study, threshold=OUTLIER_THRESHOLD):
+        ''' QC metrics stored in the "statistics" directory of the output
+        directory of study, next to its segmentation statistics
+        '''
+        return cls(os.path.join(study.output_directory,
+                                cls.study_subdirectory), threshold)
+
+    def update(self, subjects_files, processes=None):
+        ''' Compute the missing or out of date metrics and segmentation
+        statistics, find the outliers and export the tables.
+
+        Parameters
+        ----------
+        subjects_files: OrderedDict
+            subject_id -> {role: filename}, in the table order. The roles
+            of the segmentation statistics go to them.
+        processes: int
+            size of the process pool (default: number of CPUs)
+
+        Returns
+        -------
+        computed: list
+            ids of the subjects processed again
+        '''
+        segmentation_files = OrderedDict()
+        files_metrics_files = OrderedDict()
+        for subject_id, files in six.iteritems(subjects_files):
+            segmentation_files[subject_id] = dict(
+                (role, filename) for role, filename in six.iteritems(files)
+                if role in SEGMENTATION_ROLES)
+            files_metrics_files[subject_id] = dict(
+                (role, filename) for role, filename in six.iteritems(files)
+                if role not in SEGMENTATION_ROLES)
+        computed = set(self.segmentation_statistics.update(
+            segmentation_files, processes))
+        computed.update(super(QCMetrics, self).update(files_metrics_files,
+                                                      processes))
+        return [subject_id for subject_id in subjects_files
+                if subject_id in computed]
+
+    def _table_updated(self):
+        statistics = self.segmentation_statistics.table
+        for subject_id in list(self.table):
+            # copy: the table rows are the cache entries
+            metrics = dict(self.table[subject_id])
+            for metric in SEGMENTATION_METRICS:
+                metrics[metric] = statistics[subject_id][metric]
+            self.table[subject_id] = metrics
+        self.outliers = find_outliers(self.table, self.threshold)
+
+    def write_table(self, filename):
+        ''' Export the metrics and the outlier metrics as CSV '''
+        with open(filename, 'w') as f:
+            writer = csv.writer(f)
+            writer.writerow(['subject'] + METRICS + ['outliers'])
+            for subject_id, metrics in six.iteritems(self.table):
+                writer.writerow(
+                    [subject_id]
+                    + ['' if metrics[metric] is None else metrics[metric]
+                       for metric in METRICS]
+                    + [' '.join(self.outliers.get(subject_id, ()))])
+
+
+def study_qc_files(study):
+    ''' subject_id -> {role: filename} of the QC metrics and segmentation
+    statistics of a study
+    '''
+    subjects_files = OrderedDict()
+    for subject_id in study.subjects:
+        analysis = study.analyses[subject_id]
+        files = analysis.get_segmentation_statistics_files()
+        files.update(analysis.get_qc_metrics_files())
+        subjects_files[subject_id] = files
+    return subjects_files
+
+
+def study_qc_metrics(study, processes=None):
+    ''' Update the QC metrics of a study, see QCMetrics.from_study '''
+    qc_metrics = QCMetrics.from_study(study)
+    qc_metrics.update(study_qc_files(study), processes=processes)
+    return qc_metrics
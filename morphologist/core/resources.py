@@ -0,0 +1,119 @@
+from __future__ import absolute_import
+from __future__ import division
+import os
+import fnmatch
+import math
+import six
+
+
+def total_memory_MB():
+    ''' Physical memory of the machine in MB, or None if it cannot be
+    determined on this platform.
+    '''
+    try:
+        page_size = os.sysconf('SC_PAGE_SIZE')
+        pages = os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        return None
+    if page_size <= 0 or pages <= 0:
+        return None
+    return page_size * pages // (1024 * 1024)
+
+
+def parse_steps_memory(items):
+    ''' Parse a list of "step:MB" items, as found in settings.
+
+    The step part may be a glob pattern matching step ids
+    (ex: "*Normalization*:4000").
+
+    Returns
+    -------
+    steps_memory: list
+        list of (step pattern, memory in MB), in the settings order
+    '''
+    steps_memory = []
+    for item in items:
+        step, sep, memory = item.rpartition(':')
+        if not sep or not step.strip():
+            raise ValueError("bad step memory setting: '%s' "
+                             "(expected 'step:MB')" % item)
+        steps_memory.append((step.strip(), int(memory)))
+    return steps_memory
+
+
+class MemoryAdmission(object):
+    ''' Translate per-step memory estimates into CPU slots for the local
+    scheduler.
+
+    The soma-workflow local scheduler only admits a job when enough
+    processing units are free. A job expected to use more memory than the
+    memory share of one processing unit (memory_MB / cpus_number) reserves
+    several units, so that running jobs never exceed both budgets.
+    Estimates come from the settings first, then from the maximum memory
+    recorded in the runtime history.
+    '''
+
+    def __init__(self, cpus_number, memory_MB, steps_memory=None,
+                 history=None):
+        '''
+        Parameters
+        ----------
+        cpus_number: int
+            number of processing units used by the scheduler
+        memory_MB: int
+            memory budget of the running jobs
+        steps_memory: list
+            list of (step pattern, memory in MB), see parse_steps_memory
+        history: RuntimeHistory, optional
+        '''
+        self.cpus_number = max(1, cpus_number)
+        self.memory_MB = memory_MB
+        self.steps_memory = steps_memory or []
+        self._history = history
+        self._history_memory = None
+
+    def step_memory_MB(self, step_id):
+        ''' Expected memory of a step, or None if unknown '''
+        for pattern, memory in self.steps_memory:
+            if fnmatch.fnmatchcase(step_id, pattern):
+                return memory
+        return self._recorded_memory().get(step_id)
+
+    def _recorded_memory(self):
+        if self._history_memory is None:
+            self._history_memory = {}
+            if self._history is not None:
+                for step_id, statistics \
+                        in six.iteritems(self._history.step_statistics()):
+                    if statistics.max_peak_rss:
+                        self._history_memory[step_id] \
+                            = int(math.ceil(statistics.max_peak_rss
+                                            / (1024. * 1024)))
+        return self._history_memory
+
+    def cpus_for_step(self, step_id):
+        ''' Number of processing units a job of this step must reserve '''
+        memory = self.step_memory_MB(step_id)
+        if not memory or not self.memory_MB:
+            return 1
+        memory_per_cpu = self.memory_MB / self.cpus_number
+        cpus = int(math.ceil(memory / memory_per_cpu))
+        # a job needing more than the whole budget will run alone
+        return max(1, min(cpus, self.cpus_number))
+
+    def apply(self, jobs, job_step_id):
+        ''' Set the CPU reservation of the given soma-workflow jobs.
+
+        Parameters
+        ----------
+        jobs: list
+            soma_workflow.client.Job instances
+        job_step_id: callable
+            job -> step_id
+        '''
+        for job in jobs:
+            cpus = self.cpus_for_step(job_step_id(job))
+            if cpus > 1:
+                job.parallel_job_info = {'config_name': 'native',
+                                         'nodes_number': 1,
+                                         'cpu_per_node': cpus}
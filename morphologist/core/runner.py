@@ -5,6 +5,7 @@ from __future__ import print_function
 from __future__ import absolute_import
 import os
 import time
+import socket
 import threading
 import multiprocessing
 import six
@@ -18,7 +19,13 @@ from capsul.pipeline import pipeline_tools
 
 from morphologist.core.settings import settings
 from morphologist.core.utils import BidiMap
+from morphologist.core.runtime_history import RuntimeHistory, JobRecord, \
+    parse_resource_usage, datetime_to_timestamp
+from morphologist.core.progress import ProgressEstimator
+from morphologist.core.resources import MemoryAdmission, parse_steps_memory
 from morphologist.core.constants import ALL_SUBJECTS
+from morphologist.core.profiling import profiler, profiled
+from morphologist.core.runner_metrics import RunnerMetrics, MetricsServer
 
 
 # XXX:
@@ -67,9 +74,23 @@ class Runner(object):
     def stop(self, subject_id=None, step_id=None):
         raise NotImplementedError("Runner is an abstract class.")
 
+    def restart(self, subject_id=None, step_id=None):
+        ''' Run again the failed, stopped or aborted steps '''
+        raise NotImplementedError("Runner is an abstract class.")
+
     def get_status(self, subject_id=None, step_id=None, update_status=True):
         raise NotImplementedError("Runner is an abstract class.")
 
+    def get_throughput(self):
+        ''' Finished subjects per hour '''
+        raise NotImplementedError("Runner is an abstract class.")
+
+    def get_eta(self, subject_id=None):
+        ''' Estimated remaining time (in seconds) of the whole run or of a
+        subject, None if unknown
+        '''
+        raise NotImplementedError("Runner is an abstract class.")
+
     def _check_input_files(self, subject_ids):
         subjects_with_missing_inputs = []
         for subject_id in subject_ids:
@@ -99,10 +120,18 @@ class MissingModelsError(MissingInputFileError):
 class  SomaWorkflowRunner(Runner):
     WORKFLOW_NAME_SUFFIX = "Morphologist user friendly analysis"
 
-    def __init__(self, study):
+    def __init__(self, study, workflow_controller=None):
+        ''' workflow_controller: an already setup controller (such as the
+        mock controller of the tests and benchmarks): it is used instead of
+        the one of the study computing resource.
+        '''
         super(SomaWorkflowRunner, self).__init__(study)
 
-        self._workflow_controller = None
+        self._workflow_controller = workflow_controller
+        self._external_controller = workflow_controller is not None
+        self._runtime_history = None
+        self._metrics = RunnerMetrics(study.study_name)
+        self._metrics_server = None
         self._init_internal_parameters()
 
     def get_soma_workflow_credentials(self):
@@ -122,9 +151,43 @@ class  SomaWorkflowRunner(Runner):
         return resource_id, login, password, rsa_key_pass
 
     def _init_internal_parameters(self):
-        self._workflow_id = None
+        self._workflow_ids = [] # workflows (shards) of the current run
+        self._subject_to_workflow = {} # subjectid -> workflow_id
+        self._submission_failed_subject_ids = set()
+        self._done_workflow_ids = set() # finished shards: status is cached
         self._jobid_to_step = {} # subjectid -> (job_id -> step)
+        self._jobid_to_subject = {} # job_id -> subjectid
+        self._detached_job_ids = set() # jobs of replaced subject groups
+        self._finished_job_ids = set()
         self._cached_jobs_status = None
+        self._progress = ProgressEstimator(
+            step_duration=self._estimated_step_duration)
+        self._estimated_step_durations = {} # step_id -> duration
+
+    @property
+    def _workflow_id(self):
+        ''' First workflow of the current run, None if not started '''
+        if not self._workflow_ids:
+            return None
+        return self._workflow_ids[0]
+
+    @property
+    def runtime_history(self):
+        ''' RuntimeHistory where finished jobs are recorded, or None if
+        disabled in settings
+        '''
+        if self._runtime_history is None and settings.runner.runtime_history:
+            self._runtime_history = RuntimeHistory()
+        return self._runtime_history
+
+    def _estimated_step_duration(self, step_id):
+        if self.runtime_history is None:
+            return None
+        if step_id not in self._estimated_step_durations:
+            self._estimated_step_durations[step_id] \
+                = self.runtime_history.estimated_duration(
+                    step_id, study=self._study.study_name)
+        return self._estimated_step_durations[step_id]
 
     def resource_id(self):
         if self._workflow_controller is None:
@@ -140,9 +203,83 @@ class  SomaWorkflowRunner(Runner):
 
     def set_study(self, study):
         super(SomaWorkflowRunner, self).set_study(study)
+        self._metrics.study_name = study.study_name
         self.update_controller()
 
+    @property
+    def metrics(self):
+        ''' RunnerMetrics of the runner health '''
+        return self._metrics
+
+    def start_metrics_server(self, port=None):
+        ''' Serve the metrics on a local HTTP endpoint, in Prometheus text
+        format. port defaults to the metrics_port setting, 0 picks a free
+        port. Returns the MetricsServer, or None if the port cannot be
+        listened to (used by another instance...): the runner keeps running
+        without endpoint.
+        '''
+        if self._metrics_server is None:
+            if port is None:
+                port = settings.runner.metrics_port
+            try:
+                self._metrics_server = MetricsServer(self._metrics, port)
+            except (socket.error, OSError) as e:
+                print('Warning: cannot serve the runner metrics on port %d: '
+                      '%s' % (port, e))
+                return None
+            self._metrics_server.start()
+            self.update_metrics()
+        return self._metrics_server
+
+    def stop_metrics_server(self):
+        if self._metrics_server is not None:
+            self._metrics_server.stop()
+            self._metrics_server = None
+
+    def _metrics_enabled(self):
+        return self._metrics_server is not None \
+            or bool(settings.runner.metrics_textfile)
+
+    def update_metrics(self):
+        ''' Update the jobs state of the metrics from the cached jobs
+        status, and write the textfile of the metrics_textfile setting
+        '''
+        jobs_status = self._cached_jobs_status or {}
+        jobs_states = {}
+        failed_subjects = set(self._submission_failed_subject_ids)
+        for subject_id, subject_jobs in six.iteritems(self._jobid_to_step):
+            for job_id in subject_jobs:
+                status = jobs_status.get(job_id, Runner.NOT_STARTED)
+                state = self._metrics_job_states.get(status, 'unknown')
+                jobs_states[state] = jobs_states.get(state, 0) + 1
+                if status & Runner.INTERRUPTED:
+                    failed_subjects.add(subject_id)
+        self._metrics.set_state(
+            jobs_states, len(failed_subjects),
+            len(self._subject_to_workflow) + len(
+                self._submission_failed_subject_ids),
+            len(self._workflow_ids))
+        textfile = settings.runner.metrics_textfile
+        if textfile:
+            try:
+                self._metrics.write_textfile(textfile)
+            except (IOError, OSError) as e:
+                print('Warning: cannot write metrics to %s: %s'
+                      % (textfile, e))
+
+    _metrics_job_states = {
+        Runner.NOT_STARTED: 'not_started',
+        Runner.RUNNING: 'running',
+        Runner.SUCCESS: 'success',
+        Runner.FAILED: 'failed',
+        Runner.STOPPED_BY_USER: 'stopped_by_user',
+        Runner.ABORTED_NOTRUN: 'aborted_notrun',
+        Runner.UNKNOWN: 'unknown',
+    }
+
     def _setup_soma_workflow_controller(self, create_new=False):
+        if self._external_controller:
+            return
         resource_id, login, password, rsa_key_pass \
             = self.get_soma_workflow_credentials()
         config_file_path = swconf.Configuration.search_config_path()
@@ -165,14 +302,37 @@ class  SomaWorkflowRunner(Runner):
                 self._workflow_controller.delete_workflow(workflow_id)
 
     def run(self, subject_ids=ALL_SUBJECTS):
-        self._setup_soma_workflow_controller()
-        self._init_internal_parameters()
+        ''' Run the given subjects. If the runner is running, the subjects
+        are added to the current run (subjects which are already running are
+        left untouched); otherwise a new run replaces the previous one.
+
+        Subjects are split into several workflows (shards) of at most
+        max_subjects_per_workflow subjects (see settings), each shard being
+        submitted while the next one is built.
+        '''
+        if settings.runner.metrics_port:
+            self.start_metrics_server()
+        with profiler.operation('runner.run'):
+            self._setup_soma_workflow_controller()
+            add_to_run = self._workflow_id is not None and self.is_running()
+            self._run(subject_ids, add_to_run)
+
+    def _run(self, subject_ids, add_to_run):
+        if not add_to_run:
+            self._init_internal_parameters()
+        if subject_ids == ALL_SUBJECTS:
+            subject_ids = self._study.subjects
+        subject_ids = list(subject_ids)
+        if add_to_run:
+            subject_ids = [subject_id for subject_id in subject_ids
+                           if not self.is_running(subject_id,
+                                                  update_status=False)]
+        cpus_number = None
         if self._workflow_controller.scheduler_config:
             # in local mode only
             cpus_number = self._cpus_number()
             self._workflow_controller.scheduler_config.set_proc_nb(cpus_number)
-        if subject_ids == ALL_SUBJECTS:
-            subject_ids = self._study.subjects
+            self._progress.parallel_jobs = cpus_number
         # setup shared path in study_config
         study_config = self._study
         swf_resource = study_config.somaworkflow_computing_resource
@@ -192,31 +352,166 @@ class  SomaWorkflowRunner(Runner):
                     ['brainvisa', 'de25977f-abf5-9f1c-4384-2585338cd7af'])
 
         #self._check_input_files(subject_ids)
-        workflow = self._create_workflow(subject_ids)
-        jobs = [j for j in workflow.jobs if isinstance(j, Job)]
-        if self._workflow_id is not None:
-            self._workflow_controller.delete_workflow(self._workflow_id)
-        if len(jobs) == 0:
-            # empty workflow: nothing to do
-            self._workflow_id = None
+        new_workflow_ids = self._submit_shards(subject_ids, cpus_number,
+                                               add_to_run)
+        if not new_workflow_ids:
             return
-        self._workflow_id = self._workflow_controller.submit_workflow(
-            workflow, name=workflow.name)
-        self._build_jobid_to_step()
-
-        # run transfers, if any
-        Helper.transfer_input_files(self._workflow_id,
-                                    self._workflow_controller)
         # the status does not change immediately after run,
         # so we wait for the status WORKFLOW_IN_PROGRESS or timeout
-        status = self._workflow_controller.workflow_status(self._workflow_id)
-        try_count = 8
-        while ((status != sw.constants.WORKFLOW_IN_PROGRESS) and \
-                                                (try_count > 0)):
-            time.sleep(0.25)
-            status = self._workflow_controller.workflow_status(
-                self._workflow_id)
-            try_count -= 1
+        workflow_id = new_workflow_ids[0]
+        with profiler.phase('runner.wait_in_progress'):
+            status = self._workflow_controller.workflow_status(workflow_id)
+            try_count = 8
+            while ((status != sw.constants.WORKFLOW_IN_PROGRESS) and \
+                                                    (try_count > 0)):
+                time.sleep(0.25)
+                status = self._workflow_controller.workflow_status(
+                    workflow_id)
+                try_count -= 1
+
+    def _split_in_shards(self, subject_ids, add_to_run):
+        ''' Returns a list of (workflow_id, subject_ids): workflow_id is the
+        running workflow the subjects are added to, or None for a new one.
+        '''
+        max_subjects = settings.runner.max_subjects_per_workflow
+        shards = []
+        if add_to_run and subject_ids and self._workflow_ids \
+                and hasattr(self._workflow_controller,
+                            'add_to_submitted_workflow'):
+            last_workflow_id = self._workflow_ids[-1]
+            if max_subjects:
+                room = max_subjects - list(
+                    self._subject_to_workflow.values()).count(
+                        last_workflow_id)
+            else:
+                room = len(subject_ids)
+            if room > 0 and self._workflow_controller.workflow_status(
+                    last_workflow_id) == sw.constants.WORKFLOW_IN_PROGRESS:
+                shards.append((last_workflow_id, subject_ids[:room]))
+                subject_ids = subject_ids[room:]
+        shard_size = max_subjects or len(subject_ids)
+        for index in range(0, len(subject_ids), max(1, shard_size)):
+            shards.append((None, subject_ids[index:index + shard_size]))
+        return shards
+
+    def _submit_shards(self, subject_ids, cpus_number, add_to_run):
+        ''' Build and submit the workflows of the given subjects, shard by
+        shard. Submission is done in a separate thread, so that a shard is
+        submitted while the next one is built. A shard which cannot be
+        submitted does not prevent the other ones to run: its subjects are
+        reported as failed.
+
+        Returns the ids of the new workflows.
+        '''
+        shards = self._split_in_shards(subject_ids, add_to_run)
+        submission_queue = six.moves.queue.Queue()
+        submitted = [] # (workflow_id, subject_ids, job steps, error)
+        submitter = threading.Thread(target=self._shards_submitter,
+                                     args=(submission_queue, submitted))
+        submitter.start()
+        priority = (len(subject_ids) - 1) * 100
+        try:
+            for index, (workflow_id, shard_subject_ids) in enumerate(shards):
+                workflow = self._create_workflow(shard_subject_ids, priority)
+                priority -= len(shard_subject_ids) * 100
+                jobs = [j for j in workflow.jobs if isinstance(j, Job)]
+                if len(jobs) == 0:
+                    # empty workflow: nothing to do
+                    continue
+                if len(shards) > 1:
+                    workflow.name += ' (%d/%d)' % (index + 1, len(shards))
+                if cpus_number is not None:
+                    with profiler.phase('runner.memory_admission'):
+                        self._set_jobs_memory_admission(jobs, cpus_number)
+                submission_queue.put(
+                    (workflow_id, workflow, shard_subject_ids))
+        except Exception:
+            submission_queue.put(None)
+            submitter.join()
+            # do not leave half of a run behind
+            for workflow_id, _, _, error in submitted:
+                if error is None and workflow_id not in self._workflow_ids:
+                    self._workflow_controller.delete_workflow(workflow_id)
+            submitted = [item for item in submitted
+                         if item[0] in self._workflow_ids]
+            self._register_shards(submitted)
+            raise
+        submission_queue.put(None)
+        submitter.join()
+        errors = [item[3] for item in submitted if item[3] is not None]
+        new_workflow_ids = self._register_shards(submitted)
+        if errors and len(errors) == len(submitted):
+            raise errors[0]
+        return new_workflow_ids
+
+    def _shards_submitter(self, submission_queue, submitted):
+        while True:
+            item = submission_queue.get()
+            if item is None:
+                break
+            workflow_id, workflow, subject_ids = item
+            try:
+                start_time = time.time()
+                with profiler.phase('runner.submit_workflow'):
+                    if workflow_id is None:
+                        workflow_id \
+                            = self._workflow_controller.submit_workflow(
+                                workflow, name=workflow.name)
+                    else:
+                        self._workflow_controller.add_to_submitted_workflow(
+                            workflow_id, workflow)
+                    # run transfers, if any
+                    Helper.transfer_input_files(workflow_id,
+                                                self._workflow_controller)
+                self._metrics.observe_submission(time.time() - start_time)
+                job_steps = self._get_workflow_job_steps(workflow_id,
+                                                         subject_ids)
+            except Exception as e:
+                print('Error: cannot submit workflow %s: %s'
+                      % (workflow.name, e))
+                submitted.append((None, subject_ids, None, e))
+            else:
+                submitted.append((workflow_id, subject_ids, job_steps, None))
+
+    def _register_shards(self, submitted):
+        new_workflow_ids = []
+        for workflow_id, subject_ids, job_steps, error in submitted:
+            if error is not None:
+                for subject_id in subject_ids:
+                    self._detach_subject(subject_id)
+                self._submission_failed_subject_ids.update(subject_ids)
+                continue
+            if workflow_id not in self._workflow_ids:
+                self._workflow_ids.append(workflow_id)
+                new_workflow_ids.append(workflow_id)
+            self._done_workflow_ids.discard(workflow_id)
+            for subject_id in subject_ids:
+                self._detach_subject(subject_id)
+                self._submission_failed_subject_ids.discard(subject_id)
+                self._subject_to_workflow[subject_id] = workflow_id
+            with profiler.phase('runner.build_jobid_to_step'):
+                self._build_jobid_to_step(job_steps)
+            self._progress.add_subjects(
+                dict([(subject_id, self._jobid_to_step[subject_id])
+                      for subject_id in subject_ids
+                      if subject_id in self._jobid_to_step]))
+        if submitted and self._cached_jobs_status is not None:
+            # jobs added to a polled run: the cached status must know them
+            self._update_jobs_status()
+        elif self._metrics_enabled():
+            self.update_metrics()
+        return new_workflow_ids
+
+    def _detach_subject(self, subject_id):
+        ''' Forget the jobs of a previous run of a subject: they are
+        replaced by a new group of jobs.
+        '''
+        subject_jobs = self._jobid_to_step.pop(subject_id, {})
+        for job_id in subject_jobs:
+            self._detached_job_ids.add(job_id)
+            self._jobid_to_subject.pop(job_id, None)
+            self._finished_job_ids.discard(job_id)
+        self._subject_to_workflow.pop(subject_id, None)
 
     def _cpus_number(self):
         cpus_count = multiprocessing.cpu_count()
@@ -230,7 +525,24 @@ class  SomaWorkflowRunner(Runner):
             cpus_number = cpus_settings
         return cpus_number
 
-    def _create_workflow(self, subject_ids):
+    def _memory_admission(self, cpus_number):
+        if not settings.runner.memory_admission:
+            return None
+        memory_MB = settings.runner.selected_memory_MB
+        if memory_MB <= 0:
+            return None
+        steps_memory = parse_steps_memory(settings.runner.steps_memory_MB)
+        return MemoryAdmission(cpus_number, memory_MB, steps_memory,
+                               history=self.runtime_history)
+
+    def _set_jobs_memory_admission(self, jobs, cpus_number):
+        memory_admission = self._memory_admission(cpus_number)
+        if memory_admission is not None:
+            memory_admission.apply(
+                jobs, lambda job: job.user_storage or job.name)
+
+    @profiled('runner.create_workflow')
+    def _create_workflow(self, subject_ids, priority=None):
         study_config = self._study
         workflow = Workflow(
             name='Morphologist UI - %s' % study_config.study_name,
@@ -238,12 +550,14 @@ class  SomaWorkflowRunner(Runner):
         workflow.root_group = []
         initial_vol_format = study_config.volumes_format
 
-        priority = (len(subject_ids) - 1) * 100
+        if priority is None:
+            priority = (len(subject_ids) - 1) * 100
         for subject_id in subject_ids:
             analysis = self._study.analyses[subject_id]
             subject = self._study.subjects[subject_id]
 
-            analysis.set_parameters(subject)
+            with profiler.phase('runner.set_parameters'):
+                analysis.set_parameters(subject)
             #analysis.propagate_parameters()
             pipeline = analysis.pipeline
             pipeline.enable_all_pipeline_steps()
@@ -251,18 +565,23 @@ class  SomaWorkflowRunner(Runner):
             # FIXME: specific knowledge of Morphologist should not be used here.
             pipeline.Normalization_select_Normalization_pipeline \
                   = 'NormalizeSPM'
-            pipeline_tools.disable_runtime_steps_with_existing_outputs(
-                pipeline)
+            with profiler.phase(
+                    'runner.disable_runtime_steps_with_existing_outputs'):
+                pipeline_tools.disable_runtime_steps_with_existing_outputs(
+                    pipeline)
 
-            missing = pipeline_tools.nodes_with_missing_inputs(pipeline)
+            with profiler.phase('runner.nodes_with_missing_inputs'):
+                missing = pipeline_tools.nodes_with_missing_inputs(pipeline)
             if missing:
                 self.check_missing_models(pipeline, missing)
                 print('MISSING INPUTS IN NODES:', missing)
                 raise MissingInputFileError("subject: %s" % subject_id)
 
-            wf = pipeline_workflow.workflow_from_pipeline(
-                pipeline, study_config=study_config,
-                jobs_priority=priority)
+            with profiler.phase('runner.workflow_from_pipeline'):
+                wf = pipeline_workflow.workflow_from_pipeline(
+                    pipeline, study_config=study_config,
+                    jobs_priority=priority)
+            profiler.count('runner.subjects_built')
             njobs = len([j for j in wf.jobs if isinstance(j, Job)])
             if njobs != 0:
                 priority -= 100
@@ -285,14 +604,16 @@ class  SomaWorkflowRunner(Runner):
                 raise MissingModelsError(
                     "SPAM recognition models are not installed.")
 
-    def _build_jobid_to_step(self):
-        self._jobid_to_step = {}
-        workflow = self._workflow_controller.workflow(self._workflow_id)
+    @profiled('runner.get_workflow_job_steps')
+    def _get_workflow_job_steps(self, workflow_id, subject_ids):
+        ''' Returns a list of (subjectid, job_id, step_id) for the jobs of
+        the given subjects in a submitted workflow
+        '''
+        job_steps = []
+        workflow = self._workflow_controller.workflow(workflow_id)
         for group in workflow.groups:
             subjectid = group.user_storage
-            if subjectid:
-                self._jobid_to_step[subjectid] = BidiMap(
-                    'job_id', 'step_id')
+            if subjectid and subjectid in subject_ids:
                 job_list = list(group.elements)
                 while job_list:
                     job = job_list.pop(0)
@@ -301,12 +622,24 @@ class  SomaWorkflowRunner(Runner):
                     else:
                         job_att = workflow.job_mapping.get(job)
                         if job_att:
-                            job_id = job_att.job_id
                             step_id = job.user_storage or job.name
-                            self._jobid_to_step[subjectid][job_id] = step_id
+                            job_steps.append(
+                                (subjectid, job_att.job_id, step_id))
                         else:
                             print('job without mapping, subject: %s, job: %s'
                                   % (subjectid, job.name))
+        return job_steps
+
+    def _build_jobid_to_step(self, job_steps):
+        for subjectid, job_id, step_id in job_steps:
+            if job_id in self._detached_job_ids:
+                # job of a previous run of the subject
+                continue
+            if subjectid not in self._jobid_to_step:
+                self._jobid_to_step[subjectid] = BidiMap(
+                    'job_id', 'step_id')
+            self._jobid_to_step[subjectid][job_id] = step_id
+            self._jobid_to_subject[job_id] = subjectid
 
     def _define_workflow_name(self):
         return self._study.name + " " + self.WORKFLOW_NAME_SUFFIX
@@ -324,18 +657,21 @@ class  SomaWorkflowRunner(Runner):
 
     def wait(self, subject_id=None, step_id=None):
         if subject_id is None and step_id is None:
-            Helper.wait_workflow(
-                self._workflow_id, self._workflow_controller)
+            for workflow_id in self._workflow_ids:
+                Helper.wait_workflow(workflow_id, self._workflow_controller)
         elif subject_id is not None:
             if step_id is None:
-                raise NotImplementedError
+                self._workflow_controller.wait_job(
+                    list(self._get_subject_jobs(subject_id)))
             else:
                 self._step_wait(subject_id, step_id)
         else:
-            raise NotImplementedError
+            self._workflow_controller.wait_job(
+                self._select_job_ids(subject_id, step_id))
         # transfer back files, if any
-        Helper.transfer_output_files(self._workflow_id,
-                                     self._workflow_controller)
+        for workflow_id in self._workflow_ids:
+            Helper.transfer_output_files(workflow_id,
+                                         self._workflow_controller)
 
     def _step_wait(self, subject_id, step_id):
         job_id = self._jobid_to_step[subject_id][step_id, 'step_id']
@@ -352,28 +688,139 @@ class  SomaWorkflowRunner(Runner):
             subject_id, Runner.FAILED)
         return failed_step_ids
 
+    @profiled('runner.stop', operation=True)
     def stop(self, subject_id=None, step_id=None):
         if not self.is_running():
             raise RuntimeError("Runner is not running.")
         if subject_id is None and step_id is None:
             self._workflow_stop()
-        elif subject_id is not None:
-            if step_id is None:
-                raise NotImplementedError
-            else:
-                raise NotImplementedError
         else:
-            raise NotImplementedError
+            self._jobs_stop(subject_id, step_id)
 
     def _workflow_stop(self):
-        self._workflow_controller.stop_workflow(self._workflow_id)
+        for workflow_id in self._workflow_ids:
+            if workflow_id not in self._done_workflow_ids:
+                self._workflow_controller.stop_workflow(workflow_id)
 
         # transfer back files, if any
-        Helper.transfer_output_files(self._workflow_id,
-                                     self._workflow_controller)
-
-        interrupted_step_ids = self._get_interrupted_step_ids()
-        for subject_id, step_ids in six.iteritems(interrupted_step_ids):
+        for workflow_id in self._workflow_ids:
+            Helper.transfer_output_files(workflow_id,
+                                         self._workflow_controller)
+
+        self._clear_interrupted_results(list(self._jobid_to_step.keys()))
+
+    def _jobs_stop(self, subject_id=None, step_id=None):
+        ''' Kill the unfinished jobs of a subject, of a step (for all
+        subjects if subject_id is None) or of a step of a subject. Jobs
+        depending on them are aborted; the other subjects keep running.
+        '''
+        self._update_jobs_status()
+        job_ids = self._select_job_ids(
+            subject_id, step_id,
+            lambda status: not (status & self._FINISHED_STATUS))
+        workflow_job_ids = {} # workflow_id -> job ids
+        for job_id in job_ids:
+            workflow_id = self._subject_to_workflow[
+                self._jobid_to_subject[job_id]]
+            workflow_job_ids.setdefault(workflow_id, []).append(job_id)
+        for workflow_id, workflow_jobs in six.iteritems(workflow_job_ids):
+            self._workflow_controller.stop_jobs(workflow_id, workflow_jobs)
+        self._clear_interrupted_results(
+            self._affected_subject_ids(subject_id, step_id))
+
+    @profiled('runner.restart', operation=True)
+    def restart(self, subject_id=None, step_id=None):
+        ''' Restart, in the current workflow, the failed, stopped or aborted
+        jobs of the whole workflow, of a subject, or of a step. Aborted jobs
+        of the concerned subjects are restarted too since they depend on the
+        restarted ones.
+        '''
+        if self._workflow_id is None:
+            raise RuntimeError("Runner has no workflow to restart.")
+        self._update_jobs_status()
+        subject_ids = self._affected_subject_ids(subject_id, step_id)
+        unsubmitted_subject_ids = [
+            affected_subject_id for affected_subject_id in subject_ids
+            if affected_subject_id in self._submission_failed_subject_ids]
+        if unsubmitted_subject_ids:
+            self._run(unsubmitted_subject_ids, add_to_run=True)
+        job_ids = self._select_job_ids(
+            subject_id, step_id,
+            lambda status: status & Runner.INTERRUPTED)
+        for affected_subject_id in subject_ids:
+            job_ids += self._select_job_ids(
+                affected_subject_id, None,
+                lambda status: status & Runner.ABORTED_NOTRUN)
+        if not job_ids:
+            return
+        subject_ids = sorted(set([self._jobid_to_subject[job_id]
+                                  for job_id in job_ids]))
+        self._clear_interrupted_results(subject_ids, update_status=False)
+        if not hasattr(self._workflow_controller, 'restart_jobs'):
+            # older soma-workflow: run the subjects again
+            self._run(subject_ids, add_to_run=True)
+            return
+        workflow_job_ids = {} # workflow_id -> job ids
+        for job_id in job_ids:
+            subject_id = self._jobid_to_subject[job_id]
+            workflow_id = self._subject_to_workflow[subject_id]
+            workflow_job_ids.setdefault(workflow_id, []).append(job_id)
+            self._progress.jobs_restarted(subject_id, [job_id])
+        rerun_subject_ids = set()
+        for workflow_id, workflow_jobs in six.iteritems(workflow_job_ids):
+            self._workflow_controller.restart_jobs(workflow_id,
+                                                   workflow_jobs)
+            if self._workflow_controller.workflow_status(workflow_id) \
+                    != sw.constants.WORKFLOW_IN_PROGRESS:
+                # the workflow was over: soma-workflow does not restart the
+                # jobs of a finished workflow, run the subjects again
+                rerun_subject_ids.update(
+                    [self._jobid_to_subject[job_id]
+                     for job_id in workflow_jobs])
+                continue
+            self._done_workflow_ids.discard(workflow_id)
+        self._finished_job_ids.difference_update(job_ids)
+        if rerun_subject_ids:
+            self._run(sorted(rerun_subject_ids), add_to_run=True)
+
+    def _select_job_ids(self, subject_id=None, step_id=None,
+                        status_filter=None):
+        ''' Job ids of the current workflow, filtered by subject, step and
+        status (status_filter: Runner status -> bool)
+        '''
+        if status_filter is not None:
+            jobs_status = self._get_jobs_status(update_status=False)
+        if subject_id is None:
+            subject_ids = list(self._jobid_to_step.keys())
+        else:
+            subject_ids = [subject_id]
+        job_ids = []
+        for subject_id in subject_ids:
+            for job_id, job_step_id \
+                    in six.iteritems(self._get_subject_jobs(subject_id)):
+                if step_id is not None and job_step_id != step_id:
+                    continue
+                if status_filter is not None and not status_filter(
+                        jobs_status.get(job_id, Runner.UNKNOWN)):
+                    continue
+                job_ids.append(job_id)
+        return job_ids
+
+    def _affected_subject_ids(self, subject_id, step_id):
+        if subject_id is not None:
+            return [subject_id]
+        subject_ids = [subject_id for subject_id, subject_jobs
+                       in six.iteritems(self._jobid_to_step)
+                       if step_id is None
+                       or step_id in list(subject_jobs.values())]
+        if step_id is None:
+            subject_ids += sorted(self._submission_failed_subject_ids)
+        return subject_ids
+
+    def _clear_interrupted_results(self, subject_ids, update_status=True):
+        interrupted_step_ids = self._get_interrupted_step_ids(update_status)
+        for subject_id in subject_ids:
+            step_ids = interrupted_step_ids.get(subject_id)
             if step_ids:
                 analysis = self._study.analyses[subject_id]
                 analysis.clear_results(step_ids)
@@ -395,7 +842,7 @@ class  SomaWorkflowRunner(Runner):
             for job_id, step in six.iteritems(subject_jobs):
                 if step in interrupted_step_ids:
                     continue # this one is already in the list
-                job_status = jobs_status[job_id]
+                job_status = jobs_status.get(job_id, Runner.NOT_STARTED)
                 if job_status & Runner.INTERRUPTED:
                     interrupted_step_ids.add(step)
                 else:
@@ -427,7 +874,7 @@ class  SomaWorkflowRunner(Runner):
         subject_jobs = self._get_subject_jobs(subject_id)
         jobs_status = self._get_jobs_status(update_status=False)
         for job_id in subject_jobs:
-            job_status = jobs_status[job_id]
+            job_status = jobs_status.get(job_id, Runner.NOT_STARTED)
             if job_status & status:
                 step_ids.add(subject_jobs[job_id])
         return list(step_ids)
@@ -445,17 +892,37 @@ class  SomaWorkflowRunner(Runner):
             status = self._get_step_status(subject_id, step_id, update_status)
         return status
 
+    def get_throughput(self):
+        if self._workflow_id is None:
+            return 0.
+        return self._progress.throughput()
+
+    def get_eta(self, subject_id=None):
+        if self._workflow_id is None:
+            return None
+        return self._progress.eta(subject_id)
+
     def _get_workflow_status(self):
-        sw_status \
-            = self._workflow_controller.workflow_status(self._workflow_id)
-        if (sw_status in [sw.constants.WORKFLOW_IN_PROGRESS,
-                          sw.constants.WORKFLOW_NOT_STARTED]):
+        running = False
+        for workflow_id in self._workflow_ids:
+            if workflow_id in self._done_workflow_ids:
+                continue
+            sw_status = self._workflow_controller.workflow_status(workflow_id)
+            if (sw_status in [sw.constants.WORKFLOW_IN_PROGRESS,
+                              sw.constants.WORKFLOW_NOT_STARTED]):
+                running = True
+                break
+        if running:
             status = Runner.RUNNING
         else:
-            has_failed = (len(Helper.list_failed_jobs(
-                self._workflow_id, self._workflow_controller,
-                include_aborted_jobs=True,
-                include_user_killed_jobs=True)) != 0)
+            # jobs of replaced subject groups are not taken into account
+            jobs_status = self._get_jobs_status(update_status=False)
+            has_failed = bool(self._submission_failed_subject_ids)
+            for job_id in self._jobid_to_subject:
+                if jobs_status.get(job_id, Runner.NOT_STARTED) \
+                        & (Runner.INTERRUPTED | Runner.ABORTED_NOTRUN):
+                    has_failed = True
+                    break
             if has_failed:
                 status = Runner.FAILED
             else:
@@ -463,13 +930,15 @@ class  SomaWorkflowRunner(Runner):
         return status
 
     def _get_subject_status(self, subject_id, update_status=True):
+        if subject_id in self._submission_failed_subject_ids:
+            return Runner.FAILED
         status = Runner.NOT_STARTED
         subject_jobs = self._get_subject_jobs(subject_id)
         if subject_jobs:
             jobs_status=self._get_jobs_status(update_status)
             status = Runner.SUCCESS
             for job_id in subject_jobs:
-                job_status = jobs_status[job_id]
+                job_status = jobs_status.get(job_id, Runner.NOT_STARTED)
                 # XXX hypothesis: the workflow is linear for a subject (no branch)
                 if job_status & (Runner.RUNNING | Runner.INTERRUPTED):
                     status = job_status
@@ -485,7 +954,7 @@ class  SomaWorkflowRunner(Runner):
             # WARNING: assumes only 1 job per step. FIXME.
             job_id = subject_jobs[step_id, "step_id"]
             jobs_status = self._get_jobs_status(update_status)
-            status = jobs_status[job_id]
+            status = jobs_status.get(job_id, Runner.NOT_STARTED)
         return status
 
     def _get_subject_jobs(self, subject_id):
@@ -496,10 +965,33 @@ class  SomaWorkflowRunner(Runner):
             self._update_jobs_status()
         return self._cached_jobs_status
 
+    @profiled('runner.update_jobs_status')
     def _update_jobs_status(self):
-        jobs_status = {} # job_id -> status
-        job_info_seq = self._workflow_controller.workflow_elements_status(
-            self._workflow_id)[0]
+        if self._cached_jobs_status is None:
+            self._cached_jobs_status = {} # job_id -> status
+        jobs_status = self._cached_jobs_status
+        job_records = []
+        for workflow_id in self._workflow_ids:
+            if workflow_id in self._done_workflow_ids:
+                # finished shards do not change until restarted
+                continue
+            start_time = time.time()
+            elements_status \
+                = self._workflow_controller.workflow_elements_status(
+                    workflow_id)
+            self._metrics.observe_poll(time.time() - start_time)
+            profiler.count('runner.workflow_elements_status')
+            self._update_shard_jobs_status(elements_status[0], jobs_status,
+                                           job_records)
+            if elements_status[2] == sw.constants.WORKFLOW_DONE:
+                self._done_workflow_ids.add(workflow_id)
+        if job_records and self.runtime_history is not None:
+            self.runtime_history.record_many(job_records)
+        if self._metrics_enabled():
+            self.update_metrics()
+
+    def _update_shard_jobs_status(self, job_info_seq, jobs_status,
+                                  job_records):
         for job_info in job_info_seq:
             job_id = job_info[0]
             sw_status = job_info[1]
@@ -508,7 +1000,51 @@ class  SomaWorkflowRunner(Runner):
             status = self._sw_status_to_runner_status(sw_status, exit_status,
                                                       exit_value)
             jobs_status[job_id] = status
-        self._cached_jobs_status = jobs_status
+            if status & self._FINISHED_STATUS \
+                    and job_id not in self._finished_job_ids \
+                    and job_id in self._jobid_to_subject:
+                self._finished_job_ids.add(job_id)
+                job_record = self._job_record(job_info, status)
+                aborted = not (status & self._RECORDED_STATUS)
+                self._progress.job_finished(
+                    job_record.subject_id, job_id,
+                    timestamp=job_record.end_time,
+                    duration=job_record.wall_time, aborted=aborted)
+                if not aborted:
+                    job_records.append(job_record)
+                    self._metrics.observe_job(job_record.step_id,
+                                              job_record.status,
+                                              job_record.wall_time)
+
+    # only jobs which have actually run have a meaningful runtime
+    _RECORDED_STATUS = Runner.SUCCESS | Runner.FAILED | Runner.STOPPED_BY_USER
+    _FINISHED_STATUS = _RECORDED_STATUS | Runner.ABORTED_NOTRUN
+    _status_to_record_status = {
+        Runner.SUCCESS: JobRecord.SUCCESS,
+        Runner.FAILED: JobRecord.FAILED,
+        Runner.STOPPED_BY_USER: JobRecord.STOPPED_BY_USER,
+        Runner.ABORTED_NOTRUN: JobRecord.ABORTED_NOTRUN,
+    }
+
+    def _job_record(self, job_info, status):
+        job_id = job_info[0]
+        exit_value = job_info[3][1]
+        resource_usage = job_info[3][3]
+        wall_time, cpu_time, peak_rss = parse_resource_usage(resource_usage)
+        submission_time = start_time = end_time = None
+        if len(job_info) > 4 and job_info[4]:
+            dates = [datetime_to_timestamp(date) for date in job_info[4][:3]]
+            submission_time, start_time, end_time = \
+                dates + [None] * (3 - len(dates))
+        subject_id = self._jobid_to_subject[job_id]
+        step_id = self._jobid_to_step[subject_id][job_id]
+        return JobRecord(
+            self._study.study_name, subject_id, step_id, job_id=job_id,
+            resource=self.resource_id(),
+            status=self._status_to_record_status[status],
+            exit_value=exit_value, submission_time=submission_time,
+            start_time=start_time, end_time=end_time, wall_time=wall_time,
+            cpu_time=cpu_time, peak_rss=peak_rss)
 
     def _sw_status_to_runner_status(self, sw_status, exit_status, exit_value):
         if sw_status in [sw.constants.FAILED,
@@ -0,0 +1,269 @@
+from __future__ import absolute_import
+import os
+import time
+import threading
+import six
+from six.moves import BaseHTTPServer, socketserver
+
+
+# state label of the jobs gauge -> Runner status, see
+# SomaWorkflowRunner.update_metrics
+JOB_STATES = ['not_started', 'running', 'success', 'failed',
+              'stopped_by_user', 'aborted_notrun', 'unknown']
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape_label_value(value):
+    return six.text_type(value).replace('\\', '\\\\') \
+        .replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_value(value):
+    if value is None:
+        return 'NaN'
+    if isinstance(value, float):
+        if value != value:
+            return 'NaN'
+        if value in (float('inf'), float('-inf')):
+            return '+Inf' if value > 0 else '-Inf'
+        return repr(value)
+    return str(value)
+
+
+def format_metrics(families):
+    ''' Prometheus text exposition (format 0.0.4) of metric families.
+
+    Parameters
+    ----------
+    families: list
+        (name, type, help, samples) items, samples being a list of
+        (suffix, labels dict, value)
+    '''
+    lines = []
+    for name, metric_type, help_text, samples in families:
+        lines.append('# HELP %s %s' % (name, help_text))
+        lines.append('# TYPE %s %s' % (name, metric_type))
+        for suffix, labels, value in samples:
+            if labels:
+                labels_text = '{%s}' % ','.join(
+                    '%s="%s"' % (label, _escape_label_value(label_value))
+                    for label, label_value in sorted(six.iteritems(labels)))
+            else:
+                labels_text = ''
+            lines.append('%s%s%s %s' % (name, suffix, labels_text,
+                                        _format_value(value)))
+    return '\n'.join(lines) + '\n'
+
+
+class _Summary(object):
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+
+
+class RunnerMetrics(object):
+    ''' Health metrics of a runner, for monitoring long runs.
+
+    The runner feeds it from its own thread (status polls, submissions,
+    finished jobs, jobs state counts); the exposition can be read from any
+    thread (HTTP endpoint, textfile collector).
+    '''
+    prefix = 'morphologist_runner_'
+
+    def __init__(self, study_name=''):
+        self.study_name = study_name
+        self._lock = threading.Lock()
+        self._jobs_states = dict((state, 0) for state in JOB_STATES)
+        self._failed_subjects = 0
+        self._subjects = 0
+        self._workflows = 0
+        self._last_update = None
+        self._poll = _Summary()
+        self._last_poll_duration = None
+        self._submission = _Summary()
+        self._last_submission_duration = None
+        self._steps = {}  # (step_id, status) -> _Summary
+
+    def observe_poll(self, duration):
+        ''' Latency of a status request of the workflow controller '''
+        with self._lock:
+            self._poll.observe(duration)
+            self._last_poll_duration = duration
+
+    def observe_submission(self, duration):
+        ''' Duration of the submission of a workflow (shard) '''
+        with self._lock:
+            self._submission.observe(duration)
+            self._last_submission_duration = duration
+
+    def observe_job(self, step_id, status, duration):
+        ''' Wall time of a finished job, status being a JobRecord status '''
+        if duration is None:
+            return
+        with self._lock:
+            key = (step_id, status)
+            summary = self._steps.get(key)
+            if summary is None:
+                summary = self._steps[key] = _Summary()
+            summary.observe(duration)
+
+    def set_state(self, jobs_states, failed_subjects, subjects, workflows):
+        '''
+        Parameters
+        ----------
+        jobs_states: dict
+            state of JOB_STATES -> number of jobs of the current run
+        failed_subjects: int
+            subjects with failed, stopped or unsubmitted jobs
+        subjects: int
+            subjects of the current run
+        workflows: int
+            workflows (shards) of the current run
+        '''
+        with self._lock:
+            self._jobs_states = dict((state, jobs_states.get(state, 0))
+                                     for state in JOB_STATES)
+            self._failed_subjects = failed_subjects
+            self._subjects = subjects
+            self._workflows = workflows
+            self._last_update = time.time()
+
+    def families(self):
+        study = {'study': self.study_name}
+        prefix = self.prefix
+        with self._lock:
+            families = [
+                (prefix + 'jobs', 'gauge',
+                 'Jobs of the current run by state.',
+                 [('', dict(study, state=state), count)
+                  for state, count in sorted(
+                      six.iteritems(self._jobs_states))]),
+                (prefix + 'subjects', 'gauge',
+                 'Subjects of the current run.',
+                 [('', study, self._subjects)]),
+                (prefix + 'failed_subjects', 'gauge',
+                 'Subjects of the current run with failed, stopped or '
+                 'unsubmitted jobs.',
+                 [('', study, self._failed_subjects)]),
+                (prefix + 'workflows', 'gauge',
+                 'Workflows (shards) of the current run.',
+                 [('', study, self._workflows)]),
+                (prefix + 'step_duration_seconds', 'summary',
+                 'Wall time of the finished jobs by step and status.',
+                 [sample
+                  for (step_id, status), summary
+                  in sorted(six.iteritems(self._steps))
+                  for sample in [
+                      ('_count', dict(study, step=step_id, status=status),
+                       summary.count),
+                      ('_sum', dict(study, step=step_id, status=status),
+                       summary.sum)]]),
+                (prefix + 'status_poll_duration_seconds', 'summary',
+                 'Latency of the status requests of the workflow '
+                 'controller.',
+                 [('_count', study, self._poll.count),
+                  ('_sum', study, self._poll.sum)]),
+                (prefix + 'last_status_poll_duration_seconds', 'gauge',
+                 'Latency of the last status request.',
+                 [('', study, self._last_poll_duration)]),
+                (prefix + 'submission_duration_seconds', 'summary',
+                 'Submission time of the workflows.',
+                 [('_count', study, self._submission.count),
+                  ('_sum', study, self._submission.sum)]),
+                (prefix + 'last_submission_duration_seconds', 'gauge',
+                 'Submission time of the last workflow.',
+                 [('', study, self._last_submission_duration)]),
+                (prefix + 'last_update_timestamp_seconds', 'gauge',
+                 'Time of the last update of the jobs status.',
+                 [('', study, self._last_update)]),
+            ]
+        return families
+
+    def exposition(self):
+        ''' Metrics in the Prometheus text format '''
+        return format_metrics(self.families())
+
+    def write_textfile(self, filename):
+        ''' Write the metrics for the textfile collector of the node
+        exporter. The file is replaced atomically, so that it is never read
+        half written.
+        '''
+        directory = os.path.dirname(filename)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        tmp_filename = '%s.%d.tmp' % (filename, os.getpid())
+        with open(tmp_filename, 'w') as f:
+            f.write(self.exposition())
+        if os.path.exists(filename) and os.name == 'nt':
+            os.remove(filename)
+        os.rename(tmp_filename, filename)
+
+
+class _MetricsRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split('?')[0] not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+        content = self.server.metrics.exposition().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        # scrapes are periodic: do not flood the console
+        pass
+
+
+class _MetricsHTTPServer(socketserver.ThreadingMixIn,
+                         BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+class MetricsServer(object):
+    ''' HTTP endpoint serving the metrics on /metrics, in a daemon thread '''
+
+    def __init__(self, metrics, port=0, host='127.0.0.1'):
+        '''
+        Parameters
+        ----------
+        metrics: RunnerMetrics
+        port: int
+            0 picks a free port, see the port attribute
+        host: str
+            interface listened to (default: local connections only)
+        '''
+        self.metrics = metrics
+        self._server = _MetricsHTTPServer((host, port),
+                                          _MetricsRequestHandler)
+        self._server.metrics = metrics
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    @property
+    def url(self):
+        return 'http://%s:%d/metrics' % self._server.server_address[:2]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='morphologist-metrics')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._server.shutdown()
+            self._thread.join()
+            self._thread = None
+        self._server.server_close()
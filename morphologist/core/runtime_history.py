@@ -0,0 +1,288 @@
+from __future__ import absolute_import
+import os
+import re
+import time
+import sqlite3
+import threading
+import six
+
+
+class JobRecord(object):
+    ''' Runtime and resource usage of one finished job (one step of one
+    subject).
+
+    Times are seconds since the epoch, durations are in seconds and peak_rss
+    is in bytes. Unknown values are None.
+    '''
+    SUCCESS = 'success'
+    FAILED = 'failed'
+    STOPPED_BY_USER = 'stopped_by_user'
+    ABORTED_NOTRUN = 'aborted_notrun'
+    _fields = ['study', 'subject_id', 'step_id', 'job_id', 'resource',
+               'status', 'exit_value', 'submission_time', 'start_time',
+               'end_time', 'wall_time', 'cpu_time', 'peak_rss']
+
+    def __init__(self, study, subject_id, step_id, job_id=None,
+                 resource=None, status=SUCCESS, exit_value=None,
+                 submission_time=None, start_time=None, end_time=None,
+                 wall_time=None, cpu_time=None, peak_rss=None):
+        self.study = study
+        self.subject_id = subject_id
+        self.step_id = step_id
+        self.job_id = job_id
+        self.resource = resource
+        self.status = status
+        self.exit_value = exit_value
+        self.submission_time = submission_time
+        self.start_time = start_time
+        self.end_time = end_time
+        if wall_time is None and start_time is not None \
+                and end_time is not None:
+            wall_time = end_time - start_time
+        self.wall_time = wall_time
+        self.cpu_time = cpu_time
+        self.peak_rss = peak_rss
+
+    def as_tuple(self):
+        return tuple([getattr(self, field) for field in self._fields])
+
+    @classmethod
+    def from_tuple(cls, values):
+        return cls(**dict(zip(cls._fields, values)))
+
+    def __repr__(self):
+        return '<JobRecord %s/%s/%s: %s, wall=%s, cpu=%s, rss=%s>' \
+            % (self.study, self.subject_id, self.step_id, self.status,
+               self.wall_time, self.cpu_time, self.peak_rss)
+
+
+class StepStatistics(object):
+    ''' Aggregated runtime statistics of a step over its recorded jobs '''
+
+    def __init__(self, step_id, count, mean_wall_time, max_wall_time,
+                 mean_cpu_time, max_peak_rss):
+        self.step_id = step_id
+        self.count = count
+        self.mean_wall_time = mean_wall_time
+        self.max_wall_time = max_wall_time
+        self.mean_cpu_time = mean_cpu_time
+        self.max_peak_rss = max_peak_rss
+
+    def __repr__(self):
+        return '<StepStatistics %s: n=%d, mean wall=%s, max rss=%s>' \
+            % (self.step_id, self.count, self.mean_wall_time,
+               self.max_peak_rss)
+
+
+class RuntimeHistory(object):
+    ''' Local store of the runtime of the jobs run by a Runner, keyed by
+    study, subject id and step id.
+
+    The store is a sqlite database, shared by all the studies of the user.
+    Use filepath=':memory:' for a volatile store.
+    '''
+    default_filepath = os.path.join(os.path.expanduser('~'),
+                                    '.morphologist-ui-history.sqlite')
+    _columns = '''study TEXT, subject_id TEXT, step_id TEXT, job_id INTEGER,
+                  resource TEXT, status TEXT, exit_value INTEGER,
+                  submission_time REAL, start_time REAL, end_time REAL,
+                  wall_time REAL, cpu_time REAL, peak_rss INTEGER'''
+
+    def __init__(self, filepath=None):
+        if filepath is None:
+            filepath = self.default_filepath
+        self.filepath = filepath
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(filepath,
+                                           check_same_thread=False)
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._lock:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS job_runs (%s)' % self._columns)
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS job_runs_subject_step '
+                'ON job_runs (study, subject_id, step_id)')
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS job_runs_step '
+                'ON job_runs (step_id)')
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def record(self, job_record):
+        self.record_many([job_record])
+
+    def record_many(self, job_records):
+        rows = [job_record.as_tuple() for job_record in job_records]
+        if not rows:
+            return
+        placeholders = ', '.join(['?'] * len(JobRecord._fields))
+        with self._lock:
+            self._connection.executemany(
+                'INSERT INTO job_runs (%s) VALUES (%s)'
+                % (', '.join(JobRecord._fields), placeholders), rows)
+            self._connection.commit()
+
+    def records(self, study=None, subject_id=None, step_id=None,
+                status=None, limit=None):
+        ''' Recorded jobs matching the given criteria, most recent first '''
+        where, values = self._where_clause(study=study,
+                                           subject_id=subject_id,
+                                           step_id=step_id, status=status)
+        query = 'SELECT %s FROM job_runs%s ORDER BY end_time DESC, rowid DESC' \
+            % (', '.join(JobRecord._fields), where)
+        if limit is not None:
+            query += ' LIMIT %d' % int(limit)
+        with self._lock:
+            rows = self._connection.execute(query, values).fetchall()
+        return [JobRecord.from_tuple(row) for row in rows]
+
+    def step_statistics(self, step_id=None, study=None,
+                        status=JobRecord.SUCCESS):
+        ''' Per-step aggregated statistics.
+
+        Returns
+        -------
+        statistics: dict
+            step_id -> StepStatistics
+        '''
+        where, values = self._where_clause(study=study, step_id=step_id,
+                                           status=status)
+        query = '''SELECT step_id, COUNT(*), AVG(wall_time), MAX(wall_time),
+                          AVG(cpu_time), MAX(peak_rss)
+                   FROM job_runs%s GROUP BY step_id''' % where
+        with self._lock:
+            rows = self._connection.execute(query, values).fetchall()
+        return dict([(row[0], StepStatistics(*row)) for row in rows])
+
+    def resource_statistics(self, step_id=None, status=JobRecord.SUCCESS):
+        ''' Mean wall time per computing resource, to spot slow nodes.
+
+        Returns
+        -------
+        statistics: dict
+            resource -> (jobs count, mean wall time)
+        '''
+        where, values = self._where_clause(step_id=step_id, status=status)
+        query = '''SELECT resource, COUNT(*), AVG(wall_time)
+                   FROM job_runs%s GROUP BY resource''' % where
+        with self._lock:
+            rows = self._connection.execute(query, values).fetchall()
+        return dict([(row[0], (row[1], row[2])) for row in rows])
+
+    def estimated_duration(self, step_id, study=None, last_n=20):
+        ''' Mean wall time of the last successful runs of a step, or None if
+        this step has never been recorded.
+        '''
+        records = self.records(study=study, step_id=step_id,
+                               status=JobRecord.SUCCESS, limit=last_n)
+        durations = [r.wall_time for r in records if r.wall_time is not None]
+        if not durations and study is not None:
+            return self.estimated_duration(step_id, study=None,
+                                           last_n=last_n)
+        if not durations:
+            return None
+        return sum(durations) / len(durations)
+
+    def clear(self, study=None):
+        where, values = self._where_clause(study=study)
+        with self._lock:
+            self._connection.execute('DELETE FROM job_runs%s' % where,
+                                     values)
+            self._connection.commit()
+
+    @staticmethod
+    def _where_clause(**criteria):
+        conditions = []
+        values = []
+        for name in sorted(criteria):
+            value = criteria[name]
+            if value is not None:
+                conditions.append('%s = ?' % name)
+                values.append(value)
+        if not conditions:
+            return '', values
+        return ' WHERE ' + ' AND '.join(conditions), values
+
+
+_size_re = re.compile(r'^([0-9.eE+-]+)\s*([kKmMgGtT]?)[bB]?$')
+_size_units = {'': 1, 'k': 1024, 'm': 1024 ** 2, 'g': 1024 ** 3,
+               't': 1024 ** 4}
+# durations in seconds, or [[HH:]MM:]SS as reported by PBS/Torque
+_duration_re = re.compile(
+    r'^(?:(?:([0-9]+):)?([0-9]+):)?([0-9]*\.?[0-9]+(?:[eE][+-]?[0-9]+)?)$')
+
+
+def parse_resource_usage(resource_usage):
+    ''' Extract (wall_time, cpu_time, peak_rss) from the resource usage
+    reported by soma-workflow in the job exit info.
+
+    Depending on the scheduler, resource usage is either None, a dict, or a
+    string of "key=value" items. Durations are in seconds or, as with
+    PBS/Torque, [[HH:]MM:]SS. Unknown values are returned as None, as is
+    peak_rss when only the virtual memory size is reported.
+    '''
+    if not resource_usage:
+        return None, None, None
+    if isinstance(resource_usage, six.string_types):
+        items = {}
+        for item in re.split(r'[\s,;]+', resource_usage.strip()):
+            if '=' in item:
+                key, value = item.split('=', 1)
+                items[key.strip()] = value.strip()
+        resource_usage = items
+    usage = dict([(str(key).lower(), value)
+                  for key, value in six.iteritems(resource_usage)])
+
+    def _number(keys, unit_scale=1):
+        for key in keys:
+            value = usage.get(key)
+            if value is None:
+                continue
+            match = _size_re.match(str(value))
+            if match is None:
+                continue
+            number, unit = match.groups()
+            scale = _size_units[unit.lower()] if unit else unit_scale
+            return float(number) * scale
+        return None
+
+    def _duration(keys):
+        for key in keys:
+            value = usage.get(key)
+            if value is None:
+                continue
+            match = _duration_re.match(str(value).strip())
+            if match is None:
+                continue
+            hours, minutes, seconds = match.groups()
+            return int(hours or 0) * 3600. + int(minutes or 0) * 60. \
+                + float(seconds)
+        return None
+
+    wall_time = _duration(['walltime', 'wall_time', 'ru_wallclock'])
+    cpu_time = _duration(['cpu_time', 'cputime', 'cput', 'cpu'])
+    if cpu_time is None:
+        utime = _duration(['ru_utime'])
+        stime = _duration(['ru_stime'])
+        if utime is not None or stime is not None:
+            cpu_time = (utime or 0.) + (stime or 0.)
+    # rusage maxrss is expressed in kilobytes. Virtual sizes (SGE maxvmem,
+    # PBS vmem) are not resident memory: they would inflate the memory
+    # reserved for the next runs, see resources.MemoryAdmission
+    peak_rss = _number(['maxrss', 'ru_maxrss'], unit_scale=1024)
+    if peak_rss is None:
+        peak_rss = _number(['peak_rss'])
+    if peak_rss is not None:
+        peak_rss = int(peak_rss)
+    return wall_time, cpu_time, peak_rss
+
+
+def datetime_to_timestamp(date):
+    if date is None:
+        return None
+    return time.mktime(date.timetuple()) + date.microsecond * 1e-6
@@ -0,0 +1,182 @@
+from __future__ import absolute_import
+from __future__ import division
+import os
+import csv
+from collections import OrderedDict
+import numpy as np
+import six
+
+from morphologist.core.batch import SubjectsBatch
+from morphologist.core.nifti import is_nifti_filename, NiftiError
+from morphologist.core.volume_access import open_volume
+
+
+# labels of the split brain volume
+RIGHT_HEMISPHERE_LABEL = 1
+LEFT_HEMISPHERE_LABEL = 2
+CEREBELLUM_LABEL = 3
+# labels of the grey/white classification volumes
+GREY_LABEL = 100
+WHITE_LABEL = 200
+
+# roles of the volumes, see
+# Analysis.get_segmentation_statistics_parameter_names
+ROLES = ['brain_mask', 'split_brain', 'left_grey_white', 'right_grey_white']
+# columns of the statistics table, volumes are in mm3
+COLUMNS = ['brain_volume',
+           'left_hemisphere_volume', 'right_hemisphere_volume',
+           'cerebellum_volume',
+           'left_grey_voxels', 'left_white_voxels',
+           'right_grey_voxels', 'right_white_voxels']
+
+# number of voxels read at once from a volume
+CHUNK_VOXELS = 2 ** 22
+
+
+def label_voxel_counts(data, chunk_voxels=CHUNK_VOXELS):
+    ''' Number of voxels of each label of a label volume.
+
+    The volume is reduced by slabs of axial slices, so that a memory mapped
+    volume is read sequentially and never entirely loaded.
+
+    Parameters
+    ----------
+    data: numpy array
+        integer volume indexed (x, y, z[, t]), only the first time point is
+        used
+
+    Returns
+    -------
+    counts: dict
+        label -> number of voxels, label 0 included
+    '''
+    if data.ndim > 3:
+        data = data[..., 0]
+    if data.ndim < 3:
+        data = data.reshape(data.shape + (1,) * (3 - data.ndim))
+    slice_voxels = max(data.shape[0] * data.shape[1], 1)
+    slab_size = max(chunk_voxels // slice_voxels, 1)
+    counts = np.zeros(0, dtype=np.int64)
+    negative_counts = {}
+    for z in six.moves.range(0, data.shape[2], slab_size):
+        slab = np.asarray(data[:, :, z:z + slab_size]).ravel()
+        if slab.dtype.kind == 'f':
+            slab = np.round(slab).astype(np.int64)
+        if slab.size and slab.min() < 0:
+            labels, label_counts = np.unique(slab[slab < 0],
+                                             return_counts=True)
+            for label, count in zip(labels, label_counts):
+                negative_counts[int(label)] = \
+                    negative_counts.get(int(label), 0) + int(count)
+            slab = slab[slab >= 0]
+        slab_counts = np.bincount(slab.astype(np.intp))
+        if len(slab_counts) > len(counts):
+            slab_counts[:len(counts)] += counts
+            counts = slab_counts
+        else:
+            counts[:len(slab_counts)] += slab_counts
+    result = dict((label, int(count)) for label, count in enumerate(counts)
+                  if count)
+    result.update(negative_counts)
+    return result
+
+
+def _voxel_volume(header):
+    return float(np.prod([abs(v) for v in header['voxel_size'][:3]]))
+
+
+def subject_statistics(files):
+    ''' Segmentation statistics of a subject.
+
+    Parameters
+    ----------
+    files: dict
+        role -> NIfTI filename, see
+        Analysis.get_segmentation_statistics_parameter_names
+
+    Returns
+    -------
+    statistics: dict
+        column of COLUMNS -> value, None when the volume is missing or
+        cannot be read
+    '''
+    statistics = dict((column, None) for column in COLUMNS)
+    counts = {}
+    voxel_volumes = {}
+    for role, filename in six.iteritems(files):
+        if not is_nifti_filename(filename):
+            continue
+        try:
+            header, data = open_volume(filename)
+            counts[role] = label_voxel_counts(data)
+        except (IOError, OSError, ValueError, NiftiError):
+            continue
+        voxel_volumes[role] = _voxel_volume(header)
+    if 'brain_mask' in counts:
+        brain_voxels = sum(count for label, count
+                           in six.iteritems(counts['brain_mask']) if label)
+        statistics['brain_volume'] = brain_voxels \
+            * voxel_volumes['brain_mask']
+    if 'split_brain' in counts:
+        split_counts = counts['split_brain']
+        voxel_volume = voxel_volumes['split_brain']
+        for column, label in [('left_hemisphere_volume',
+                               LEFT_HEMISPHERE_LABEL),
+                              ('right_hemisphere_volume',
+                               RIGHT_HEMISPHERE_LABEL),
+                              ('cerebellum_volume', CEREBELLUM_LABEL)]:
+            statistics[column] = split_counts.get(label, 0) * voxel_volume
+    for side in ('left', 'right'):
+        role = '%s_grey_white' % side
+        if role in counts:
+            statistics['%s_grey_voxels' % side] = \
+                counts[role].get(GREY_LABEL, 0)
+            statistics['%s_white_voxels' % side] = \
+                counts[role].get(WHITE_LABEL, 0)
+    return statistics
+
+
+class SegmentationStatistics(SubjectsBatch):
+    ''' Segmentation statistics of the subjects of a study.
+
+    The volumes are reduced in a process pool and the results are cached
+    per subject: a subject is only processed again when one of its files
+    has changed.
+    '''
+    table_filename = 'segmentation_statistics.csv'
+    cache_filename = 'segmentation_statistics_cache.json'
+    study_subdirectory = 'statistics'
+    subject_function = staticmethod(subject_statistics)
+
+    @classmethod
+    def from_study(cls, study):
+        ''' Segmentation statistics stored in the "statistics" directory of
+        the output directory of study
+        '''
+        return cls(os.path.join(study.output_directory,
+                                cls.study_subdirectory))
+
+    def write_table(self, filename):
+        ''' Export the table as CSV, missing values are empty '''
+        with open(filename, 'w') as f:
+            writer = csv.writer(f)
+            writer.writerow(['subject'] + COLUMNS)
+            for subject_id, statistics in six.iteritems(self.table):
+                writer.writerow(
+                    [subject_id] + ['' if statistics[column] is None
+                                    else statistics[column]
+                                    for column in COLUMNS])
+
+
+def study_segmentation_statistics(study, processes=None):
+    ''' Update the segmentation statistics of a study, see
+    SegmentationStatistics.from_study
+    '''
+    subjects_files = OrderedDict()
+    for subject_id in study.subjects:
+        analysis = study.analyses[subject_id]
+        subjects_files[subject_id] = \
+            analysis.get_segmentation_statistics_files()
+    statistics = SegmentationStatistics.from_study(study)
+    statistics.update(subjects_files, processes=processes)
+    return statistics
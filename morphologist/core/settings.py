@@ -11,6 +11,8 @@ import multiprocessing
 from configobj import ConfigObj, flatten_errors, get_extra_values
 from validate import Validator
 
+from morphologist.core.resources import total_memory_MB
+
 
 AUTO = 'auto'
 
@@ -42,7 +44,9 @@ class Settings(object):
         self.commandline = CommandLineSettings(self._memory_configobj)
         self.study_editor = StudyEditorSettings(self._memory_configobj)
         self.backends = BackendSettings(self._memory_configobj)
+        self.viewport = ViewportSettings(self._memory_configobj)
         self.tests = TestsSettings(self._memory_configobj)
+        self.profiling = ProfilingSettings(self._memory_configobj)
 
     def are_valid(self):
         return self._cfg_handler.check_settings(self._memory_configobj)
@@ -72,6 +76,9 @@ class ConfigobjSettingsHandler(object):
         else:
             user_settings = ConfigObj(cls.filepath, configspec=cls._configspec)
             settings.merge(user_settings)
+            # convert the values read as strings: wrong values are left
+            # unchanged and reported by check_settings
+            settings.validate(MorphologistConfigValidator())
         return settings
 
     @staticmethod
@@ -191,7 +198,15 @@ class CommandLineSettings(SettingsFacade):
 
 class RunnerSettings(SettingsFacade):
     _settings_map = {
-        'selected_processing_units_n' : ('application', 'CPUs')
+        'selected_processing_units_n' : ('application', 'CPUs'),
+        'runtime_history' : ('application', 'runtime_history'),
+        'max_subjects_per_workflow' : ('application',
+                                       'max_subjects_per_workflow'),
+        'memory_admission' : ('application', 'memory_admission'),
+        'selected_memory_MB' : ('application', 'memory_MB'),
+        'steps_memory_MB' : ('application', 'steps_memory_MB'),
+        'metrics_port' : ('application', 'metrics_port'),
+        'metrics_textfile' : ('application', 'metrics_textfile'),
     }
 
     @property
@@ -208,6 +223,23 @@ class RunnerSettings(SettingsFacade):
         total_processing_units_n = multiprocessing.cpu_count()
         return max(1, total_processing_units_n - 1)
 
+    @property
+    def selected_memory_MB(self):
+        attr = 'selected_memory_MB'
+        value = super(RunnerSettings, self).__getattr__(attr)
+        if value == AUTO:
+            value = self._auto_selected_memory_MB()
+            return AutoOrInt(value, auto=True)
+        else:
+            return AutoOrInt(value, auto=False)
+
+    def _auto_selected_memory_MB(self):
+        # keep 1 GB for the system and the GUI; 0 means unknown
+        total_memory = total_memory_MB()
+        if total_memory is None:
+            return 0
+        return max(total_memory // 2, total_memory - 1024)
+
 
 class AutoOrInt(int):
 
@@ -236,6 +268,16 @@ class BackendSettings(SettingsFacade):
      }
 
 
+class ViewportSettings(SettingsFacade):
+    _settings_map = {
+        "cache_MB" : ('application', 'viewport_cache_MB'),
+        "prefetch_subjects" : ('application', 'viewport_prefetch_subjects'),
+        "progressive_loading" : ('application',
+                                 'viewport_progressive_loading'),
+        "mesh_lod_vertices" : ('application', 'viewport_mesh_lod_vertices'),
+     }
+
+
 class TestsSettings(SettingsFacade):
     _settings_map = {
         "start_qt_event_loop" : ('debug', 'start_qt_event_loop_for_tests'),
@@ -243,5 +285,13 @@ class TestsSettings(SettingsFacade):
      }
 
 
+class ProfilingSettings(SettingsFacade):
+    _settings_map = {
+        "enabled" : ('debug', 'profiling'),
+        "capture" : ('debug', 'profiling_capture'),
+        "directory" : ('debug', 'profiling_directory'),
+     }
+
+
 settings = Settings()
 settings.load()
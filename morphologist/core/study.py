@@ -13,6 +13,7 @@ from morphologist.core.analysis \
     import AnalysisFactory, ImportationError
 from morphologist.core.constants import ALL_SUBJECTS
 from morphologist.core.subject import Subject
+from morphologist.core.profiling import profiled
 
 # Axon config
 argv = sys.argv
@@ -98,6 +99,7 @@ class Study(StudyConfig):
         return os.path.dirname(backup_filepath)
 
     @classmethod
+    @profiled('study.load', operation=True)
     def from_file(cls, backup_filepath):
         output_directory = \
             cls._get_output_directory_from_backup_filepath(backup_filepath)
@@ -116,6 +118,7 @@ class Study(StudyConfig):
         return study
 
     @classmethod
+    @profiled('study.unserialize')
     def unserialize(cls, serialized, output_directory):
         try:
             version = serialized['study_format_version']
@@ -160,6 +163,7 @@ class Study(StudyConfig):
         return cls.from_file(backup_filepath)
 
     @classmethod
+    @profiled('study.import', operation=True)
     def from_organized_directory(cls, analysis_type, organized_directory,
                                  progress_callback=None):
         if progress_callback:
@@ -190,6 +194,7 @@ class Study(StudyConfig):
                          + (.3 + 0.7 * (n + 1) / nsubjects) * scl_progess)
         return new_study
 
+    @profiled('study.save', operation=True)
     def save_to_backup_file(self):
         serialized_study = self.serialize()
         try:
@@ -198,6 +203,7 @@ class Study(StudyConfig):
         except Exception as e:
             raise StudySerializationError("%s" %(e))
 
+    @profiled('study.serialize')
     def serialize(self):
         if self.input_directory != self.output_directory:
             print('** WARNING: input_directory != output_directory')
@@ -219,6 +225,7 @@ class Study(StudyConfig):
                                         self.output_directory)
         return serialized
 
+    @profiled('study.add_subject')
     def add_subject(self, subject, import_data=True):
         subject_id = subject.id()
         if subject_id in self.subjects:
@@ -253,6 +260,7 @@ class Study(StudyConfig):
     def has_subjects(self):
         return len(self.subjects) != 0
 
+    @profiled('study.has_some_results')
     def has_some_results(self, subject_ids=ALL_SUBJECTS):
         if subject_ids == ALL_SUBJECTS:
             subject_ids = self.subjects
@@ -262,6 +270,7 @@ class Study(StudyConfig):
                 return True
         return False
 
+    @profiled('study.has_all_results')
     def has_all_results(self, subject_ids=ALL_SUBJECTS):
         if subject_ids == ALL_SUBJECTS:
             subject_ids = self.subjects
@@ -299,6 +308,7 @@ class Study(StudyConfig):
         s += 'subjects: ' + repr(self.subjects) + '\n'
         return s
 
+    @profiled('study.get_subjects_from_pattern')
     def get_subjects_from_pattern(self, exact_match=False,
                                   progress_callback=None):
         if progress_callback is not None:
@@ -0,0 +1,366 @@
+from __future__ import absolute_import
+import time
+import heapq
+import random
+import datetime
+import threading
+import six
+
+from soma_workflow import constants
+from soma_workflow.client import Job
+
+
+class VirtualClock(object):
+    ''' Clock of a MockWorkflowController which only moves when asked to,
+    so that simulated runs do not take real time.
+    '''
+
+    def __init__(self, start_time=None):
+        if start_time is None:
+            start_time = time.time()
+        self.current_time = start_time
+
+    def __call__(self):
+        return self.current_time
+
+    def advance(self, seconds):
+        self.current_time += seconds
+
+
+class MockSchedulerConfig(object):
+
+    def __init__(self, proc_nb):
+        self.proc_nb = proc_nb
+
+    def set_proc_nb(self, proc_nb):
+        self.proc_nb = proc_nb
+
+
+class MockEngineJob(object):
+
+    def __init__(self, job_id, job, workflow_id, duration, fails):
+        self.job_id = job_id
+        self.job = job
+        self.workflow_id = workflow_id
+        self.duration = duration
+        self.fails = fails
+        self.priority = getattr(job, 'priority', 0) or 0
+        self.status = constants.NOT_SUBMITTED
+        self.exit_status = None
+        self.exit_value = None
+        self.submission_time = None
+        self.start_time = None
+        self.end_time = None
+        self.waiting_dependencies = 0
+        self.dependencies = []
+        self.dependents = []
+
+    def job_info(self):
+        ''' item of workflow_elements_status()[0], as soma-workflow '''
+        if self.start_time is not None and self.end_time is not None \
+                and self.status in (constants.DONE, constants.FAILED) \
+                and self.exit_status != constants.EXIT_NOTRUN:
+            resource_usage = 'walltime=%f cputime=%f maxrss=100000' \
+                % (self.end_time - self.start_time,
+                   self.end_time - self.start_time)
+        else:
+            resource_usage = None
+        return (self.job_id, self.status, None,
+                (self.exit_status, self.exit_value, None, resource_usage),
+                (_date(self.submission_time), _date(self.start_time),
+                 _date(self.end_time), None))
+
+
+def _date(timestamp):
+    if timestamp is None:
+        return None
+    return datetime.datetime.fromtimestamp(timestamp)
+
+
+class MockWorkflowController(object):
+    ''' In-process fake of the soma-workflow WorkflowController used by
+    SomaWorkflowRunner, to test and benchmark the runner without any
+    soma-workflow daemon or database.
+
+    Submitted jobs are simulated: they run on proc_nb slots, by priority,
+    once their dependencies are done. Each job lasts job_duration seconds
+    of the clock and fails with probability failure_rate: its dependent
+    jobs are then not run. Status requests sleep status_latency (real)
+    seconds and are counted.
+    '''
+
+    def __init__(self, job_duration=1., failure_rate=0., status_latency=0.,
+                 proc_nb=4, clock=None, seed=0, local=True):
+        '''
+        Parameters
+        ----------
+        job_duration: float or callable
+            duration of the jobs, or job -> duration
+        failure_rate: float
+            probability that a job fails
+        status_latency: float
+            real time (in seconds) spent in each status request
+        proc_nb: int
+            number of jobs running simultaneously
+        clock: callable
+            time of the simulation (default: time.time). A VirtualClock
+            runs the simulation as fast as the runner polls.
+        seed: int
+            seed of the failures draw
+        local: bool
+            if False, the controller behaves as a remote resource (no
+            scheduler_config)
+        '''
+        self._resource_id = 'mock'
+        self.job_duration = job_duration
+        self.failure_rate = failure_rate
+        self.status_latency = status_latency
+        self.clock = clock if clock is not None else time.time
+        self.scheduler_config = MockSchedulerConfig(proc_nb) if local \
+            else None
+        self._proc_nb = proc_nb
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._workflows = {}      # workflow_id -> (workflow, name, date)
+        self._jobs = {}           # job_id -> MockEngineJob
+        self._workflow_jobs = {}  # workflow_id -> [job_id]
+        self._ready = []          # heap of (-priority, job_id)
+        self._running = []        # heap of (end_time, job_id)
+        self._last_workflow_id = 0
+        self._last_job_id = 0
+        self.submissions_count = 0
+        self.status_calls_count = 0
+
+    @property
+    def proc_nb(self):
+        if self.scheduler_config is not None:
+            return self.scheduler_config.proc_nb
+        return self._proc_nb
+
+    # workflows
+
+    def submit_workflow(self, workflow, expiration_date=None, name=None,
+                        queue=None):
+        with self._lock:
+            self._last_workflow_id += 1
+            workflow_id = self._last_workflow_id
+            self._workflows[workflow_id] = (
+                workflow, name or workflow.name, datetime.datetime.now())
+            self._workflow_jobs[workflow_id] = []
+            workflow.job_mapping = {}
+            self._add_jobs(workflow_id, workflow, workflow)
+            self.submissions_count += 1
+            return workflow_id
+
+    def add_to_submitted_workflow(self, workflow_id, workflow):
+        with self._lock:
+            submitted_workflow = self._workflows[workflow_id][0]
+            submitted_workflow.jobs += workflow.jobs
+            submitted_workflow.dependencies += workflow.dependencies
+            submitted_workflow.root_group += workflow.root_group
+            submitted_workflow.groups += workflow.groups
+            self._add_jobs(workflow_id, workflow, submitted_workflow)
+            self.submissions_count += 1
+
+    def _add_jobs(self, workflow_id, workflow, submitted_workflow):
+        now = self.clock()
+        new_jobs = {}
+        for job in workflow.jobs:
+            if not isinstance(job, Job):
+                continue
+            self._last_job_id += 1
+            if callable(self.job_duration):
+                duration = self.job_duration(job)
+            else:
+                duration = self.job_duration
+            engine_job = MockEngineJob(
+                self._last_job_id, job, workflow_id, duration,
+                self._random.random() < self.failure_rate)
+            engine_job.status = constants.QUEUED_ACTIVE
+            engine_job.submission_time = now
+            self._jobs[engine_job.job_id] = engine_job
+            self._workflow_jobs[workflow_id].append(engine_job.job_id)
+            submitted_workflow.job_mapping[job] = engine_job
+            new_jobs[job] = engine_job
+        for dependency in workflow.dependencies:
+            first, second = dependency[:2]
+            if first in new_jobs and second in new_jobs:
+                new_jobs[second].waiting_dependencies += 1
+                new_jobs[second].dependencies.append(new_jobs[first])
+                new_jobs[first].dependents.append(new_jobs[second])
+        for engine_job in six.itervalues(new_jobs):
+            if engine_job.waiting_dependencies == 0:
+                heapq.heappush(self._ready,
+                               (-engine_job.priority, engine_job.job_id))
+        self._schedule(now)
+
+    def workflow(self, workflow_id):
+        with self._lock:
+            return self._workflows[workflow_id][0]
+
+    def workflows(self, workflow_ids=None):
+        with self._lock:
+            return dict((workflow_id, (name, date))
+                        for workflow_id, (_, name, date)
+                        in six.iteritems(self._workflows)
+                        if workflow_ids is None
+                        or workflow_id in workflow_ids)
+
+    def delete_workflow(self, workflow_id, force=True):
+        with self._lock:
+            self.stop_workflow(workflow_id)
+            for job_id in self._workflow_jobs.pop(workflow_id, []):
+                del self._jobs[job_id]
+            self._workflows.pop(workflow_id, None)
+            return True
+
+    def stop_workflow(self, workflow_id):
+        self.stop_jobs(workflow_id, self._workflow_jobs.get(workflow_id, []))
+        return True
+
+    def stop_jobs(self, workflow_id, job_ids):
+        with self._lock:
+            self._update()
+            for job_id in job_ids:
+                engine_job = self._jobs.get(job_id)
+                if engine_job is not None and engine_job.status in (
+                        constants.QUEUED_ACTIVE, constants.RUNNING):
+                    self._finish(engine_job, constants.FAILED,
+                                 constants.USER_KILLED, None, self.clock())
+            self._running = [item for item in self._running
+                             if self._jobs.get(item[1]) is not None
+                             and self._jobs[item[1]].status
+                             == constants.RUNNING]
+            heapq.heapify(self._running)
+            self._schedule(self.clock())
+            return True
+
+    def restart_jobs(self, workflow_id, job_ids):
+        with self._lock:
+            now = self.clock()
+            engine_jobs = [self._jobs[job_id] for job_id in job_ids]
+            for engine_job in engine_jobs:
+                engine_job.status = constants.QUEUED_ACTIVE
+                engine_job.exit_status = engine_job.exit_value = None
+                engine_job.start_time = engine_job.end_time = None
+                engine_job.submission_time = now
+                engine_job.fails = False
+            for engine_job in engine_jobs:
+                engine_job.waiting_dependencies = len(
+                    [dependency for dependency in engine_job.dependencies
+                     if dependency.status != constants.DONE])
+                if engine_job.waiting_dependencies == 0:
+                    heapq.heappush(self._ready,
+                                   (-engine_job.priority, engine_job.job_id))
+            self._schedule(now)
+            return True
+
+    def transfer_files(self, transfer_ids, buffer_size=512 ** 2):
+        # the simulated jobs do not read nor write any file
+        pass
+
+    # status
+
+    def workflow_status(self, workflow_id):
+        self._status_request()
+        with self._lock:
+            self._update()
+            return self._workflow_status(workflow_id)
+
+    def workflow_elements_status(self, workflow_id, with_drms_id=False):
+        self._status_request()
+        with self._lock:
+            self._update()
+            jobs_info = [self._jobs[job_id].job_info()
+                         for job_id in self._workflow_jobs[workflow_id]]
+            return (jobs_info, [], self._workflow_status(workflow_id),
+                    None, [])
+
+    def _workflow_status(self, workflow_id):
+        if workflow_id not in self._workflows:
+            return None
+        for job_id in self._workflow_jobs[workflow_id]:
+            if self._jobs[job_id].status in (constants.QUEUED_ACTIVE,
+                                             constants.RUNNING):
+                return constants.WORKFLOW_IN_PROGRESS
+        return constants.WORKFLOW_DONE
+
+    def _status_request(self):
+        self.status_calls_count += 1
+        if self.status_latency:
+            time.sleep(self.status_latency)
+
+    def wait_job(self, job_ids, timeout=-1):
+        ''' Wait for the end of the jobs. With a VirtualClock, the clock is
+        moved to the end of the jobs.
+        '''
+        start_time = time.time()
+        while True:
+            with self._lock:
+                self._update()
+                if all(self._jobs[job_id].status
+                       not in (constants.QUEUED_ACTIVE, constants.RUNNING)
+                       for job_id in job_ids if job_id in self._jobs):
+                    return
+                if isinstance(self.clock, VirtualClock):
+                    if not self._running:
+                        return
+                    self.clock.current_time = max(self.clock.current_time,
+                                                  self._running[0][0])
+                    continue
+            if 0 <= timeout < time.time() - start_time:
+                return
+            time.sleep(0.01)
+
+    def wait_workflow(self, workflow_id, timeout=-1):
+        self.wait_job(self._workflow_jobs.get(workflow_id, []), timeout)
+
+    # simulation
+
+    def _update(self):
+        ''' Run the simulation until the current time of the clock '''
+        now = self.clock()
+        while self._running and self._running[0][0] <= now:
+            end_time, job_id = heapq.heappop(self._running)
+            engine_job = self._jobs.get(job_id)
+            if engine_job is None or engine_job.status != constants.RUNNING:
+                continue
+            if engine_job.fails:
+                self._finish(engine_job, constants.FAILED,
+                             constants.FINISHED_REGULARLY, 1, end_time)
+            else:
+                self._finish(engine_job, constants.DONE,
+                             constants.FINISHED_REGULARLY, 0, end_time)
+            self._schedule(end_time)
+
+    def _schedule(self, current_time):
+        while self._ready and len(self._running) < self.proc_nb:
+            _, job_id = heapq.heappop(self._ready)
+            engine_job = self._jobs.get(job_id)
+            if engine_job is None \
+                    or engine_job.status != constants.QUEUED_ACTIVE:
+                continue
+            engine_job.status = constants.RUNNING
+            engine_job.start_time = current_time
+            heapq.heappush(self._running,
+                           (current_time + engine_job.duration, job_id))
+
+    def _finish(self, engine_job, status, exit_status, exit_value,
+                end_time):
+        engine_job.status = status
+        engine_job.exit_status = exit_status
+        engine_job.exit_value = exit_value
+        engine_job.end_time = end_time
+        if status == constants.DONE:
+            for dependent in engine_job.dependents:
+                dependent.waiting_dependencies -= 1
+                if dependent.waiting_dependencies == 0 \
+                        and dependent.status == constants.QUEUED_ACTIVE:
+                    heapq.heappush(self._ready,
+                                   (-dependent.priority, dependent.job_id))
+        else:
+            # the jobs depending on a failed job are not run
+            for dependent in engine_job.dependents:
+                if dependent.status == constants.QUEUED_ACTIVE:
+                    self._finish(dependent, constants.FAILED,
+                                 constants.EXIT_NOTRUN, None, end_time)
@@ -0,0 +1,84 @@
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+import unittest
+
+from morphologist.core.cache import LoadedObjectsCache, file_stamp, \
+    estimate_loaded_size
+
+
+class TestLoadedObjectsCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='morphologist_cache_')
+        self.filenames = []
+        for name in ['a.nii', 'b.nii', 'c.nii']:
+            filename = os.path.join(self.directory, name)
+            self._write(filename, 100)
+            self.filenames.append(filename)
+        # room for 2 files
+        self.cache = LoadedObjectsCache(250)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, filename, size):
+        with open(filename, 'wb') as f:
+            f.write(b'x' * size)
+
+    def test_get(self):
+        a, b, c = self.filenames
+        self.assertEqual(self.cache.get(a), None)
+        self.cache.put(a, 'object_a')
+        self.assertEqual(self.cache.get(a), 'object_a')
+        self.assert_(a in self.cache)
+        self.assert_(b not in self.cache)
+        statistics = self.cache.statistics()
+        self.assertEqual((statistics['hits'], statistics['misses']), (1, 1))
+        self.assertEqual(statistics['bytes'], 100)
+
+    def test_lru_eviction(self):
+        a, b, c = self.filenames
+        self.cache.put(a, 'object_a')
+        self.cache.put(b, 'object_b')
+        # a becomes the most recently used
+        self.cache.get(a)
+        self.cache.put(c, 'object_c')
+        self.assertEqual(self.cache.get(b), None)
+        self.assertEqual(self.cache.get(a), 'object_a')
+        self.assertEqual(self.cache.get(c), 'object_c')
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertEqual(self.cache.current_bytes, 200)
+
+    def test_modified_file(self):
+        a = self.filenames[0]
+        self.cache.put(a, 'object_a')
+        self._write(a, 120)
+        self.assertEqual(self.cache.get(a), None)
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(self.cache.current_bytes, 0)
+
+        os.remove(a)
+        self.cache.put(a, 'object_a')
+        self.assertEqual(len(self.cache), 0)
+
+    def test_stale_stamp(self):
+        # the file changed while the object was loaded
+        a = self.filenames[0]
+        stamp = file_stamp(a)
+        self._write(a, 120)
+        self.cache.put(a, 'object_a', stamp)
+        self.assertEqual(self.cache.get(a), None)
+
+    def test_budget(self):
+        a = self.filenames[0]
+        self.cache.set_max_bytes(50)
+        self.cache.put(a, 'object_a')
+        self.assertEqual(len(self.cache), 0)
+        self.assertEqual(estimate_loaded_size('a.nii.gz', (0, 10)), 40)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestLoadedObjectsCache)
+    unittest.TextTestRunner(verbosity=2).run(suite)
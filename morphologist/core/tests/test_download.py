@@ -0,0 +1,203 @@
+from __future__ import absolute_import
+import os
+import io
+import re
+import shutil
+import zipfile
+import tempfile
+import threading
+import unittest
+import six
+from six.moves import BaseHTTPServer
+
+from morphologist.core.download import ZipDownloader, ZipStreamExtractor, \
+    DownloadError, DownloadCancelled, ZipStreamError, \
+    brainomics_t1_destination
+
+
+class _NonSeekableStream(io.RawIOBase):
+    ''' Write-only stream: zipfile then writes data descriptors, as a web
+    server streaming an archive would do.
+    '''
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.data += data
+        return len(data)
+
+
+def make_archive(members, streamed=True):
+    if streamed and six.PY3:
+        stream = _NonSeekableStream()
+    else:
+        stream = io.BytesIO()
+    with zipfile.ZipFile(stream, 'w') as archive:
+        for name, data, compression in members:
+            info = zipfile.ZipInfo(name)
+            info.compress_type = compression
+            archive.writestr(info, data)
+    if isinstance(stream, io.BytesIO):
+        return stream.getvalue()
+    return bytes(stream.data)
+
+
+class _ArchiveRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(self.headers.get('Range'))
+        data = server.archive
+        start = 0
+        range_header = self.headers.get('Range')
+        if range_header and server.accept_ranges:
+            start = int(re.match(r'bytes=(\d+)-', range_header).group(1))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d'
+                             % (start, len(data) - 1, len(data)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data) - start))
+        self.send_header('ETag', '"archive"')
+        self.end_headers()
+        end = len(data)
+        if server.truncate_at is not None:
+            end = server.truncate_at
+            server.truncate_at = None
+        self.wfile.write(data[start:end])
+
+    def log_message(self, *args):
+        pass
+
+
+class TestZipDownloader(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='morphologist_download_')
+        big = os.urandom(100000)
+        self.members = [
+            ('brainomics_data/', b'', zipfile.ZIP_STORED),
+            ('brainomics_data/s1/raw_T1_raw_anat.nii.gz', big,
+             zipfile.ZIP_STORED),
+            ('brainomics_data/s1/other.txt', b'x' * 1000,
+             zipfile.ZIP_DEFLATED),
+            ('brainomics_data/s2/raw_T1_raw_anat.nii.gz', b'y' * 200000,
+             zipfile.ZIP_DEFLATED),
+            ('brainomics_data/s3/raw_T1_raw_anat.nii.gz', big[:5000],
+             zipfile.ZIP_DEFLATED)]
+        self.server = BaseHTTPServer.HTTPServer(('127.0.0.1', 0),
+                                                _ArchiveRequestHandler)
+        self.server.archive = make_archive(self.members)
+        self.server.requests = []
+        self.server.accept_ranges = True
+        self.server.truncate_at = None
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/view?vid=data-zip' \
+            % self.server.server_address[1]
+        self.state_filepath = os.path.join(self.directory, 'state.json')
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.directory)
+
+    def _downloader(self):
+        return ZipDownloader(self.url,
+                             brainomics_t1_destination(self.directory),
+                             state_filepath=self.state_filepath,
+                             chunk_size=4096)
+
+    def _assert_subjects_extracted(self, filenames):
+        self.assertEqual([os.path.basename(f) for f in filenames],
+                         ['s1.nii.gz', 's2.nii.gz', 's3.nii.gz'])
+        expected = [data for name, data, _ in self.members
+                    if name.endswith('raw_T1_raw_anat.nii.gz')]
+        for filename, data in zip(filenames, expected):
+            with open(filename, 'rb') as f:
+                self.assertEqual(f.read(), data)
+        self.assert_(not os.path.exists(self.state_filepath))
+
+    def test_download(self):
+        downloader = self._downloader()
+        filenames = downloader.run()
+
+        self._assert_subjects_extracted(filenames)
+        self.assertEqual(downloader.downloaded_bytes,
+                         len(self.server.archive))
+        self.assertEqual(self.server.requests, [None])
+
+    def test_resume(self):
+        # connection lost in the middle of s3
+        self.server.truncate_at = len(self.server.archive) - 3000
+        downloader = self._downloader()
+        self.assertRaises(DownloadError, downloader.run)
+        self.assertEqual([name for name, _ in downloader.extracted],
+                         ['brainomics_data/s1/raw_T1_raw_anat.nii.gz',
+                          'brainomics_data/s2/raw_T1_raw_anat.nii.gz'])
+        self.assert_(os.path.exists(self.state_filepath))
+
+        filenames = downloader.run()
+        self._assert_subjects_extracted(filenames)
+        self.assert_(downloader.resumed_from > 100000)
+        self.assertEqual(self.server.requests[1],
+                         'bytes=%d-' % downloader.resumed_from)
+        self.assertEqual(downloader.downloaded_bytes,
+                         len(self.server.archive) - downloader.resumed_from)
+
+    def test_resume_without_range_support(self):
+        self.server.truncate_at = len(self.server.archive) - 3000
+        self.server.accept_ranges = False
+        downloader = self._downloader()
+        self.assertRaises(DownloadError, downloader.run)
+
+        filenames = downloader.run()
+        self._assert_subjects_extracted(filenames)
+        self.assertEqual(downloader.resumed_from, 0)
+
+    def test_cancel_before_run(self):
+        # cancelled from the GUI before the download thread starts it
+        downloader = self._downloader()
+        downloader.cancel()
+        self.assertRaises(DownloadCancelled, downloader.run)
+        self.assertEqual(self.server.requests, [])
+
+    def test_bad_archive(self):
+        self.server.archive = b'<html>no result</html>'
+        self.assertRaises(ZipStreamError, self._downloader().run)
+
+
+class TestZipStreamExtractor(unittest.TestCase):
+
+    def test_byte_per_byte(self):
+        members = [('a.txt', b'a' * 100, zipfile.ZIP_DEFLATED),
+                   ('empty.txt', b'', zipfile.ZIP_STORED),
+                   ('b.txt', b'b' * 10, zipfile.ZIP_STORED)]
+        extracted = {}
+        for streamed in (True, False):
+            archive = make_archive(members, streamed=streamed)
+            directory = tempfile.mkdtemp(prefix='morphologist_download_')
+            try:
+                extractor = ZipStreamExtractor(
+                    lambda name: os.path.join(directory, name),
+                    member_extracted=extracted.__setitem__)
+                for i in range(len(archive)):
+                    extractor.feed(archive[i:i + 1])
+                self.assert_(extractor.finished)
+                for name, data, _ in members:
+                    with open(extracted[name], 'rb') as f:
+                        self.assertEqual(f.read(), data)
+            finally:
+                shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestZipDownloader)
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(
+        TestZipStreamExtractor))
+    unittest.TextTestRunner(verbosity=2).run(suite)
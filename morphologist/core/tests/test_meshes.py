@@ -0,0 +1,48 @@
+from __future__ import absolute_import
+import unittest
+import numpy as np
+
+from morphologist.core.meshes import decimate_mesh, triangles_area
+
+
+def grid_mesh(n):
+    ''' flat n x n vertices square of side 1 '''
+    x, y = np.meshgrid(np.linspace(0, 1, n), np.linspace(0, 1, n),
+                       indexing='ij')
+    vertices = np.column_stack([x.ravel(), y.ravel(), np.zeros(n * n)])
+    index = np.arange(n * n).reshape((n, n))
+    a, b = index[:-1, :-1].ravel(), index[1:, :-1].ravel()
+    c, d = index[1:, 1:].ravel(), index[:-1, 1:].ravel()
+    polygons = np.concatenate([np.column_stack([a, b, c]),
+                               np.column_stack([a, c, d])])
+    return vertices, polygons
+
+
+class TestDecimateMesh(unittest.TestCase):
+
+    def test_small_mesh(self):
+        vertices, polygons = grid_mesh(5)
+        new_vertices, new_polygons = decimate_mesh(vertices, polygons, 100)
+        self.assertEqual(len(new_vertices), 25)
+        self.assertEqual(len(new_polygons), len(polygons))
+
+    def test_decimate(self):
+        vertices, polygons = grid_mesh(100)
+        new_vertices, new_polygons = decimate_mesh(vertices, polygons, 1000)
+        self.assert_(100 < len(new_vertices) <= 1000)
+        self.assert_(new_polygons.max() < len(new_vertices))
+        # no degenerated nor duplicated triangles
+        self.assert_((new_polygons[:, 0] != new_polygons[:, 1]).all())
+        self.assert_((new_polygons[:, 1] != new_polygons[:, 2]).all())
+        self.assert_((new_polygons[:, 0] != new_polygons[:, 2]).all())
+        self.assertEqual(len(set(tuple(sorted(p)) for p in new_polygons)),
+                         len(new_polygons))
+        # the shape is preserved
+        self.assertAlmostEqual(triangles_area(vertices, polygons), 1.)
+        self.assert_(abs(triangles_area(new_vertices, new_polygons) - 1.)
+                     < 0.1)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestDecimateMesh)
+    unittest.TextTestRunner(verbosity=2).run(suite)
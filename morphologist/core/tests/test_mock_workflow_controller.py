@@ -0,0 +1,88 @@
+from __future__ import absolute_import
+import unittest
+
+from soma_workflow import constants
+from soma_workflow.client import Workflow, Job
+
+from morphologist.core.tests.mocks.workflow_controller import \
+    MockWorkflowController, VirtualClock
+
+
+def create_workflow(subjects_number, steps_number=3):
+    jobs = []
+    dependencies = []
+    for subject in range(subjects_number):
+        subject_jobs = [Job(command=['true'], name='step%d' % step)
+                        for step in range(steps_number)]
+        jobs += subject_jobs
+        dependencies += list(zip(subject_jobs[:-1], subject_jobs[1:]))
+    return Workflow(jobs=jobs, dependencies=dependencies)
+
+
+class TestMockWorkflowController(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = VirtualClock(start_time=1000.)
+
+    def _jobs_status(self, controller, workflow_id):
+        jobs_info = controller.workflow_elements_status(workflow_id)[0]
+        return [job_info[1] for job_info in jobs_info]
+
+    def test_simulation(self):
+        controller = MockWorkflowController(job_duration=10., proc_nb=2,
+                                            clock=self.clock)
+        workflow = create_workflow(2)
+        workflow_id = controller.submit_workflow(workflow, name='test')
+        self.assertEqual(controller.workflow_status(workflow_id),
+                         constants.WORKFLOW_IN_PROGRESS)
+        self.assertEqual(self._jobs_status(controller, workflow_id),
+                         [constants.RUNNING, constants.QUEUED_ACTIVE,
+                          constants.QUEUED_ACTIVE, constants.RUNNING,
+                          constants.QUEUED_ACTIVE, constants.QUEUED_ACTIVE])
+        self.clock.advance(15.)
+        self.assertEqual(self._jobs_status(controller, workflow_id)[:2],
+                         [constants.DONE, constants.RUNNING])
+        self.clock.advance(20.)
+        self.assertEqual(controller.workflow_status(workflow_id),
+                         constants.WORKFLOW_DONE)
+        job_info = controller.workflow_elements_status(workflow_id)[0][2]
+        self.assertEqual(job_info[3][:2], (constants.FINISHED_REGULARLY, 0))
+        self.assert_(job_info[4][2] is not None)
+        engine_job = workflow.job_mapping[workflow.jobs[0]]
+        self.assertEqual(engine_job.job_id, job_info[0] - 2)
+        self.assertEqual(controller.status_calls_count, 5)
+
+    def test_failures(self):
+        controller = MockWorkflowController(job_duration=10., proc_nb=4,
+                                            failure_rate=1.,
+                                            clock=self.clock)
+        workflow_id = controller.submit_workflow(create_workflow(1))
+        controller.wait_job([job_id for job_id in controller._jobs])
+        jobs_info = controller.workflow_elements_status(workflow_id)[0]
+        self.assertEqual([job_info[1] for job_info in jobs_info],
+                         [constants.FAILED] * 3)
+        self.assertEqual(jobs_info[0][3][:2],
+                         (constants.FINISHED_REGULARLY, 1))
+        self.assertEqual(jobs_info[1][3][0], constants.EXIT_NOTRUN)
+        controller.restart_jobs(workflow_id,
+                                [job_info[0] for job_info in jobs_info])
+        self.clock.advance(100.)
+        self.assertEqual(self._jobs_status(controller, workflow_id),
+                         [constants.DONE] * 3)
+
+    def test_stop(self):
+        controller = MockWorkflowController(clock=self.clock)
+        workflow_id = controller.submit_workflow(create_workflow(1))
+        controller.stop_workflow(workflow_id)
+        jobs_info = controller.workflow_elements_status(workflow_id)[0]
+        self.assertEqual(jobs_info[0][3][0], constants.USER_KILLED)
+        self.assertEqual(controller.workflow_status(workflow_id),
+                         constants.WORKFLOW_DONE)
+        controller.delete_workflow(workflow_id)
+        self.assertEqual(controller.workflows(), {})
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(
+        TestMockWorkflowController)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,141 @@
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+import numpy as np
+
+from morphologist.core.morphometry import aggregate_morphometry, \
+    read_morphometry_table, MorphometrySchemaError, MorphometryStore
+
+
+class TestMorphometry(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='morphologist_morphometry_')
+        self.inputs = []
+        for subject in ['s1', 's2', 's3']:
+            filename = os.path.join(self.directory, '%s.csv' % subject)
+            with open(filename, 'w') as f:
+                f.write('label;side;surface;depth\n')
+                f.write('S.C._left;left;1200.5;21.3\n')
+                f.write('F.C.M._left;left;800;\n')
+            self.inputs.append((OrderedDict([('subject', subject)]),
+                                filename))
+        self.output = os.path.join(self.directory, 'group.csv')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_aggregate(self):
+        report = aggregate_morphometry(self.inputs, self.output, readers=2)
+        self.assertEqual(report.rows_count, 6)
+        header, rows, delimiter = read_morphometry_table(self.output)
+        self.assertEqual(delimiter, ';')
+        self.assertEqual(header, ['subject', 'label', 'side', 'surface',
+                                  'depth'])
+        self.assertEqual([row[0] for row in rows],
+                         ['s1', 's1', 's2', 's2', 's3', 's3'])
+        self.assertEqual(rows[1], ['s1', 'F.C.M._left', 'left', '800', ''])
+
+    def test_schema_validation(self):
+        with open(self.inputs[1][1], 'w') as f:
+            f.write('label;side;depth;length\n')
+            f.write('S.C._left;left;20;30\n')
+        missing_filename = os.path.join(self.directory, 'missing.csv')
+        inputs = self.inputs + [(OrderedDict([('subject', 's4')]),
+                                 missing_filename)]
+        report = aggregate_morphometry(inputs, self.output)
+        self.assertEqual(report.written, [self.inputs[0][1],
+                                          self.inputs[1][1],
+                                          self.inputs[2][1]])
+        self.assertEqual(report.mismatched,
+                         [(self.inputs[1][1], ['surface'], ['length'])])
+        self.assertEqual([item[0] for item in report.unreadable],
+                         [missing_filename])
+        _, rows, _ = read_morphometry_table(self.output)
+        self.assertEqual(rows[2], ['s2', 'S.C._left', 'left', '', '20'])
+        self.assertRaises(MorphometrySchemaError, aggregate_morphometry,
+                          self.inputs, self.output, strict=True)
+
+    def test_columnar(self):
+        output = os.path.join(self.directory, 'group.npz')
+        aggregate_morphometry(self.inputs, output, columnar=True)
+        columns = np.load(output)
+        self.assertEqual(list(columns['subject']),
+                         ['s1', 's1', 's2', 's2', 's3', 's3'])
+        self.assertEqual(columns['surface'][0], 1200.5)
+        self.assert_(np.isnan(columns['depth'][1]))
+
+    def test_space_delimited(self):
+        filename = os.path.join(self.directory, 'left.dat')
+        with open(filename, 'w') as f:
+            f.write('label   surface  depth\n')
+            f.write('S.C._left  1200.5   21.3\n')
+        header, rows, delimiter = read_morphometry_table(filename)
+        self.assertEqual(header, ['label', 'surface', 'depth'])
+        self.assertEqual(rows, [['S.C._left', '1200.5', '21.3']])
+
+
+class TestMorphometryStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='morphologist_morphometry_')
+        self.subjects_files = OrderedDict()
+        for i, subject in enumerate(['s1', 's2']):
+            filename = os.path.join(self.directory, '%s.csv' % subject)
+            self._write_table(filename, [('S.C._left', 1000. + i, 20.),
+                                         ('F.C.M._left', 800., 15. + i)])
+            self.subjects_files[subject] = filename
+        self.store_filename = os.path.join(self.directory, 'store.npz')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write_table(self, filename, rows, measures=('surface', 'depth')):
+        with open(filename, 'w') as f:
+            f.write('subject;label;side;%s\n' % ';'.join(measures))
+            for row in rows:
+                f.write('x;%s;left;%s\n' % (row[0], ';'.join(
+                    [str(value) for value in row[1:]])))
+
+    def test_update(self):
+        store = MorphometryStore(self.store_filename)
+        self.assertEqual(store.update(self.subjects_files), ['s1', 's2'])
+        self.assertEqual(store.data.shape, (2, 2, 2))
+        self.assertEqual(store.measures, ['surface', 'depth'])
+        self.assertEqual(list(store.measure('surface')[:, 0]),
+                         [1000., 1001.])
+        store = MorphometryStore(self.store_filename)
+        self.assertEqual(store.update(self.subjects_files), [])
+        self.assertEqual(store.subject_measures('s2')[1, 1], 16.)
+        # a changed table adds a label and a measure
+        filename = self.subjects_files['s2']
+        self._write_table(filename, [('S.C._left', 1001., 20., 3.),
+                                     ('S.Call._left', 500., 10., 2.)],
+                          measures=('surface', 'depth', 'length'))
+        mtime = os.stat(filename).st_mtime
+        os.utime(filename, (mtime + 10, mtime + 10))
+        self.subjects_files['s3'] = os.path.join(self.directory, 'no.csv')
+        self.assertEqual(store.update(self.subjects_files), ['s2'])
+        store = MorphometryStore(self.store_filename)
+        store.load()
+        self.assertEqual(store.subjects, ['s1', 's2', 's3'])
+        self.assertEqual(store.labels,
+                         ['S.C._left', 'F.C.M._left', 'S.Call._left'])
+        self.assertEqual(store.measures, ['surface', 'depth', 'length'])
+        self.assertEqual(store.subject_measures('s1')[1, 1], 15.)
+        self.assert_(np.isnan(store.subject_measures('s1')[0, 2]))
+        self.assert_(np.isnan(store.subject_measures('s2')[1, 0]))
+        self.assertEqual(store.measure('length')[1, 2], 2.)
+        self.assert_(np.all(np.isnan(store.subject_measures('s3'))))
+        # a subject without table is not read again
+        self.assertEqual(store.update(self.subjects_files), [])
+
+
+if __name__ == '__main__':
+    suite = unittest.TestSuite([
+        unittest.TestLoader().loadTestsFromTestCase(TestMorphometry),
+        unittest.TestLoader().loadTestsFromTestCase(TestMorphometryStore)])
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -4,7 +4,7 @@ import getpass
 import os.path
 import tempfile
 
-from morphologist.core.gui.object3d import Object3D
+from morphologist.core.gui.object3d import Object3D, read_apc_coordinates
 from morphologist.core.backends.mixins import LoadObjectError
  
 
@@ -63,6 +63,20 @@ class TestObject3D(unittest.TestCase):
                           Object3D.from_filename,
                           truncated_filename)
 
+    def test_read_apc_coordinates(self):
+        fd, filename = tempfile.mkstemp(suffix='.APC', prefix='morpho')
+        os.close(fd)
+        try:
+            with open(filename, 'w') as f:
+                f.write('AC: 123 116 81\nACmm: 128.1 135.3 104.9\n'
+                        'PCmm: 128.2 161.4 111.5\nIHmm: 127.5 114.6 61.1\n')
+            coordinates = read_apc_coordinates(filename)
+        finally:
+            os.unlink(filename)
+        self.assertEqual(coordinates, {'AC': [128.1, 135.3, 104.9],
+                                       'PC': [128.2, 161.4, 111.5],
+                                       'IH': [127.5, 114.6, 61.1]})
+
     def _create_truncated_file(self, filename, truncated_filename):
         ext = filename.split('.')[-1]
         tmp_file = None
@@ -0,0 +1,79 @@
+from __future__ import absolute_import
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from morphologist.core.outputs_snapshot import OutputsSnapshot, \
+    outputs_stamps, stale_subjects, SOME_RESULTS, ALL_RESULTS
+
+
+class TestOutputsSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='morphologist_snapshot_')
+        self.filenames = [os.path.join(self.directory, 'group', name)
+                          for name in ('s1_mask.nii', 's1_mesh.gii')]
+        os.makedirs(os.path.join(self.directory, 'group'))
+        open(self.filenames[0], 'w').write('mask')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_save_and_load(self):
+        snapshot = OutputsSnapshot(self.directory)
+        self.assert_(snapshot.get_status('s1') is None)
+        stamps = outputs_stamps(self.filenames)
+        self.assert_(stamps[self.filenames[1]] is None)
+        snapshot.put('s1', SOME_RESULTS, stamps)
+        snapshot.put('s2', ALL_RESULTS, {})
+        self.assert_(snapshot.modified)
+        snapshot.save()
+        self.assert_(not snapshot.modified)
+        with open(snapshot.filepath) as f:
+            content = json.load(f)
+        self.assertEqual(sorted(content['subjects']['s1']['files']),
+                         [os.path.join('group', 's1_mask.nii'),
+                          os.path.join('group', 's1_mesh.gii')])
+
+        # a moved study keeps its snapshot
+        moved_directory = self.directory + '_moved'
+        os.rename(self.directory, moved_directory)
+        self.directory = moved_directory
+        snapshot = OutputsSnapshot(moved_directory)
+        self.assertEqual(snapshot.get_status('s1'), SOME_RESULTS)
+        moved_stamps = snapshot.get_stamps('s1')
+        self.assertEqual(
+            sorted(moved_stamps),
+            [os.path.join(moved_directory, 'group', name)
+             for name in ('s1_mask.nii', 's1_mesh.gii')])
+        snapshot.put('s2', ALL_RESULTS, {})
+        self.assert_(not snapshot.modified)
+        snapshot.keep_only(['s1'])
+        self.assert_(snapshot.modified)
+        self.assert_(snapshot.get_status('s2') is None)
+
+    def test_unknown_format(self):
+        with open(os.path.join(self.directory,
+                               OutputsSnapshot.filename), 'w') as f:
+            json.dump({'snapshot_format_version': '0.1',
+                       'subjects': {'s1': {}}}, f)
+        self.assert_(OutputsSnapshot(self.directory).get_status('s1')
+                     is None)
+
+    def test_stale_subjects(self):
+        stamps = outputs_stamps(self.filenames)
+        batch = [('s1', self.filenames, stamps),
+                 ('s2', self.filenames, None)]
+        self.assertEqual(stale_subjects(batch), [('s2', stamps)])
+        open(self.filenames[1], 'w').write('mesh')
+        stale = stale_subjects(batch)
+        self.assertEqual([subject_id for subject_id, _ in stale],
+                         ['s1', 's2'])
+        self.assert_(stale[0][1][self.filenames[1]] is not None)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestOutputsSnapshot)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,101 @@
+from __future__ import absolute_import
+import os
+import glob
+import shutil
+import tempfile
+import threading
+import unittest
+
+from morphologist.core import profiling
+from morphologist.core.profiling import Profiler, profiled, \
+    CPROFILE_CAPTURE, NO_CAPTURE
+
+
+class TestProfiler(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='morphologist_profiling_')
+        self.profiler = Profiler(enabled=True, directory=self.directory)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_disabled(self):
+        profiler = Profiler(enabled=False)
+        with profiler.operation('operation'):
+            with profiler.phase('phase'):
+                profiler.count('counter')
+        self.assert_(profiler.last_operation is None)
+        self.assertEqual(profiler.session.phases, {})
+        self.assertEqual(profiler.session.counters, {})
+
+    def test_operation(self):
+        with self.profiler.operation('run'):
+            for i in range(3):
+                with self.profiler.phase('build'):
+                    self.profiler.count('subjects')
+            # phases of other threads count as well
+            thread = threading.Thread(target=self._submit)
+            thread.start()
+            thread.join()
+            with self.profiler.operation('nested'):
+                pass
+        operation = self.profiler.last_operation
+        self.assertEqual(operation.name, 'run')
+        self.assertEqual(sorted(operation.phases),
+                         ['build', 'nested', 'submit'])
+        self.assertEqual(operation.phases['build'].count, 3)
+        self.assertEqual(operation.counters, {'subjects': 3})
+        self.assert_(operation.duration >= operation.phases['build'].total)
+        breakdown = operation.breakdown()
+        self.assert_(breakdown.startswith('run: '))
+        self.assert_('subjects: 3' in breakdown)
+        reports = glob.glob(os.path.join(self.directory, '*_run.txt'))
+        self.assertEqual(len(reports), 1)
+        with open(reports[0]) as f:
+            self.assertEqual(f.read(), breakdown + '\n')
+        # phases out of operations are only in the session statistics
+        with self.profiler.phase('poll'):
+            pass
+        self.assert_(self.profiler.last_operation is operation)
+        self.assertEqual(self.profiler.session.phases['poll'].count, 1)
+        self.assertEqual(self.profiler.session.phases['run'].count, 1)
+
+    def _submit(self):
+        with self.profiler.phase('submit'):
+            pass
+
+    def test_cprofile_capture(self):
+        self.profiler.configure(True, CPROFILE_CAPTURE, self.directory)
+        with self.profiler.operation('load'):
+            sorted(range(1000))
+        self.assertEqual(
+            len(glob.glob(os.path.join(self.directory, '*_load.prof'))), 1)
+
+    def test_decorator(self):
+        global_profiler = profiling.profiler
+        profiling.profiler = self.profiler
+        try:
+            @profiled('square')
+            def square(x):
+                return x * x
+
+            @profiled('load', operation=True)
+            def load():
+                return [square(x) for x in range(4)]
+
+            self.assertEqual(load(), [0, 1, 4, 9])
+            operation = self.profiler.last_operation
+            self.assertEqual(operation.name, 'load')
+            self.assertEqual(operation.phases['square'].count, 4)
+            self.profiler.configure(False, NO_CAPTURE)
+            self.profiler.reset()
+            self.assertEqual(square(3), 9)
+            self.assertEqual(self.profiler.session.phases, {})
+        finally:
+            profiling.profiler = global_profiler
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestProfiler)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,85 @@
+from __future__ import absolute_import
+import unittest
+
+from morphologist.core.progress import ProgressEstimator, format_duration
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.
+
+    def __call__(self):
+        return self.now
+
+
+class TestProgressEstimator(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.step_durations = {'step_a': 10., 'step_b': 20.}
+        self.progress = ProgressEstimator(
+            step_duration=self.step_durations.get, parallel_jobs=2,
+            clock=self.clock)
+        self.progress.start({'s1': {1: 'step_a', 2: 'step_b'},
+                             's2': {3: 'step_a', 4: 'step_b'},
+                             's3': {5: 'step_a', 6: 'step_b'}})
+
+    def test_eta_from_step_durations(self):
+        self.assertEqual(self.progress.throughput(), 0.)
+        self.assertEqual(self.progress.eta('s1'), 30.)
+        # 3 subjects * 30 s on 2 parallel jobs
+        self.assertEqual(self.progress.eta(), 45.)
+        self.assertEqual(self.progress.eta('unknown'), None)
+
+    def test_unknown_step_duration(self):
+        del self.step_durations['step_b']
+        self.assertEqual(self.progress.eta(), None)
+        self.clock.now += 15.
+        self.progress.job_finished('s1', 1, duration=15.)
+        # jobs rate is now available
+        self.assertAlmostEqual(self.progress.eta(), 5 * 15.)
+
+    def test_observed_durations(self):
+        self.clock.now += 30.
+        self.progress.job_finished('s1', 1, duration=30.)
+        self.assertEqual(self.progress.eta('s2'), 30. + 20.)
+        self.assertEqual(self.progress.eta('s1'), 20.)
+
+    def test_throughput(self):
+        self.clock.now += 1800.
+        self.progress.job_finished('s1', 1)
+        self.progress.job_finished('s1', 2)
+        self.assertTrue(self.progress.is_subject_finished('s1'))
+        self.assertEqual(self.progress.finished_subjects_count(), 1)
+        self.assertAlmostEqual(self.progress.throughput(), 2.)
+        self.assertAlmostEqual(self.progress.eta(), 2 * 1800.)
+        self.assertEqual(self.progress.eta('s1'), 0.)
+
+    def test_aborted_jobs(self):
+        self.clock.now += 60.
+        self.progress.job_finished('s1', 1, aborted=True)
+        self.progress.job_finished('s1', 2, aborted=True)
+        self.progress.job_finished('s1', 2, aborted=True)
+        self.assertEqual(self.progress.jobs_throughput(), 0.)
+        self.assertTrue(self.progress.is_subject_finished('s1'))
+
+    def test_rolling_window(self):
+        self.progress.window = 100.
+        self.clock.now += 50.
+        self.progress.job_finished('s1', 1)
+        self.progress.job_finished('s1', 2)
+        self.assertAlmostEqual(self.progress.throughput(), 3600. / 50.)
+        self.clock.now += 200.
+        self.assertEqual(self.progress.throughput(), 0.)
+
+    def test_format_duration(self):
+        self.assertEqual(format_duration(None), '')
+        self.assertEqual(format_duration(45.2), '45 s')
+        self.assertEqual(format_duration(12 * 60 + 5), '12 min')
+        self.assertEqual(format_duration(2 * 3600 + 5 * 60), '2h05')
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestProgressEstimator)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,80 @@
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from morphologist.core.pyramid import downsampling_factor, downsample, \
+    strided_downsample, preview_filenames
+from morphologist.core.cache import is_derived_file_up_to_date
+
+
+class TestPyramid(unittest.TestCase):
+
+    def test_downsampling_factor(self):
+        self.assertEqual(downsampling_factor((128, 128, 128)), 1)
+        self.assertEqual(downsampling_factor((256, 256, 160)), 2)
+        self.assertEqual(downsampling_factor((320, 320, 256, 1)), 3)
+        self.assertEqual(downsampling_factor((10, 10, 10), max_voxels=8), 5)
+
+    def test_mean(self):
+        array = np.arange(4 * 4 * 2, dtype=np.float32).reshape((4, 4, 2, 1))
+        result = downsample(array, 2)
+        self.assertEqual(result.shape, (2, 2, 1, 1))
+        self.assertEqual(result.dtype, np.float32)
+        self.assertEqual(result[0, 0, 0, 0], array[:2, :2, :2, 0].mean())
+        self.assertEqual(result[1, 1, 0, 0], array[2:, 2:, :2, 0].mean())
+
+    def test_padding(self):
+        array = np.ones((5, 3, 3), dtype=np.int16) * 7
+        array[4] = 1
+        result = downsample(array, 2)
+        self.assertEqual(result.shape, (3, 2, 2))
+        self.assertEqual(result.dtype, np.int16)
+        self.assert_((result[:2] == 7).all())
+        # the last slice is replicated to fill its block
+        self.assert_((result[2] == 1).all())
+
+    def test_nearest(self):
+        labels = np.zeros((6, 6, 6), dtype=np.uint8)
+        labels[3:, :, :] = 2
+        result = downsample(labels, 3, method='nearest')
+        self.assertEqual(result.shape, (2, 2, 2))
+        self.assertEqual(set(np.unique(result)), set([0, 2]))
+        self.assertRaises(ValueError, downsample, labels, 3, 'median')
+
+    def test_strided(self):
+        array = np.arange(5 * 4 * 5, dtype=np.int16).reshape((5, 4, 5))
+        result = strided_downsample(array, 2)
+        self.assertEqual(result.shape, (3, 2, 3))
+        self.assertEqual(result.dtype, np.int16)
+        # only the slices 0, 2 and 4 are read
+        self.assertEqual(result[0, 0, 1],
+                         np.round(array[:2, :2, 2].mean()))
+        self.assertEqual(result[2, 1, 2], np.round(array[4, 2:, 4].mean()))
+        result = strided_downsample(array, 2, method='nearest')
+        self.assert_((result == array[::2, ::2, ::2]).all())
+        self.assertRaises(ValueError, strided_downsample, array, 2, 'median')
+
+    def test_preview_cache(self):
+        directory = tempfile.mkdtemp(prefix='morphologist_pyramid_')
+        try:
+            filename = os.path.join(directory, 'sujet01.nii.gz')
+            open(filename, 'w').close()
+            preview = preview_filenames(filename, 2)[0]
+            self.assertEqual(os.path.dirname(preview), directory)
+            self.assert_(not is_derived_file_up_to_date(preview, filename))
+            open(preview, 'w').close()
+            self.assert_(is_derived_file_up_to_date(preview, filename))
+            # the volume is modified after its preview
+            mtime = os.stat(preview).st_mtime
+            os.utime(filename, (mtime + 10, mtime + 10))
+            self.assert_(not is_derived_file_up_to_date(preview, filename))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestPyramid)
+    unittest.TextTestRunner(verbosity=2).run(suite)
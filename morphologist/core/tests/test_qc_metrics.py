@@ -0,0 +1,111 @@
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+import numpy as np
+
+from morphologist.core.qc_metrics import QCMetrics, read_histo_analysis, \
+    gifti_vertex_count, graph_nodes_count, robust_z_scores, find_outliers
+from morphologist.core.tests.test_thumbnails import write_nifti
+
+
+GIFTI_TEMPLATE = '''<?xml version="1.0" encoding="UTF-8"?>
+<GIFTI Version="1.0" NumberOfDataArrays="2">
+<DataArray Intent="NIFTI_INTENT_POINTSET" DataType="NIFTI_TYPE_FLOAT32"
+ ArrayIndexingOrder="RowMajorOrder" Dimensionality="2" Dim0="%d" Dim1="3"
+ Encoding="ASCII">
+<Data>%s</Data>
+</DataArray>
+</GIFTI>
+'''
+
+ARG_CONTENT = '''# graph 1.0
+
+*BEGIN GRAPH CorticalFoldArg
+
+*BEGIN NODE fold 1
+*END
+
+*BEGIN NODE fold 2
+*END
+
+*BEGIN RELATION junction 1 2
+*END
+
+*END
+'''
+
+
+class TestQCMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='morphologist_qc_')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def _write(self, name, content):
+        filename = os.path.join(self.directory, name)
+        with open(filename, 'w') as f:
+            f.write(content)
+        return filename
+
+    def test_readers(self):
+        han = self._write('nobias.han',
+                          'gray: mean: 520 sigma: 45\n'
+                          'white: mean: 700 sigma: 30\n')
+        self.assertEqual(read_histo_analysis(han),
+                         {'grey_mean': 520., 'grey_sigma': 45.,
+                          'white_mean': 700., 'white_sigma': 30.})
+        gii = self._write('white.gii', GIFTI_TEMPLATE
+                          % (4, '0 0 0 1 0 0 0 1 0 0 0 1'))
+        self.assertEqual(gifti_vertex_count(gii), 4)
+        self.assertEqual(gifti_vertex_count(gii, block_size=16), 4)
+        arg = self._write('sulci.arg', ARG_CONTENT)
+        self.assertEqual(graph_nodes_count(arg), 2)
+
+    def test_robust_z_scores(self):
+        scores = robust_z_scores([10., 11., 9., 10., None, 50.])
+        self.assert_(np.isnan(scores[4]))
+        self.assertEqual(scores[0], 0.)
+        self.assert_(scores[5] > 10.)
+        self.assert_(np.all(np.isnan(robust_z_scores([1., 2.]))))
+        table = OrderedDict(('s%d' % i, {'brain_volume': value})
+                            for i, value in enumerate([10., 11., 9., 50.]))
+        self.assertEqual(list(find_outliers(table)), ['s3'])
+
+    def test_update(self):
+        subjects_files = OrderedDict()
+        for i, size in enumerate([8, 7, 9, 8, 2]):
+            mask = np.zeros((12, 12, 12), dtype=np.int16)
+            mask[:size, :8, :8] = 255
+            brain_mask = os.path.join(self.directory, 'mask%d.nii' % i)
+            write_nifti(brain_mask, mask)
+            han = self._write('nobias%d.han' % i,
+                              'gray: mean: 520 sigma: 45\n'
+                              'white: mean: 700 sigma: 30\n')
+            subjects_files['s%d' % i] = {'brain_mask': brain_mask,
+                                         'histo_analysis': han}
+        qc_metrics = QCMetrics(self.directory)
+        self.assertEqual(len(qc_metrics.update(subjects_files, processes=1)),
+                         5)
+        self.assertEqual(list(qc_metrics.outliers), ['s4'])
+        self.assertEqual(list(qc_metrics.outliers['s4']), ['brain_volume'])
+        self.assertEqual(qc_metrics.table['s0']['white_mean'], 700.)
+        self.assert_(os.path.exists(qc_metrics.table_filepath))
+        # the brain volume is the one of the segmentation statistics
+        self.assertEqual(
+            qc_metrics.table['s4']['brain_volume'],
+            qc_metrics.segmentation_statistics.table['s4']['brain_volume'])
+        self.assert_(os.path.exists(
+            qc_metrics.segmentation_statistics.table_filepath))
+        qc_metrics = QCMetrics(self.directory)
+        self.assertEqual(qc_metrics.update(subjects_files), [])
+        self.assertEqual(list(qc_metrics.outliers), ['s4'])
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestQCMetrics)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,71 @@
+from __future__ import absolute_import
+import unittest
+
+from morphologist.core.resources import MemoryAdmission, parse_steps_memory
+from morphologist.core.runtime_history import RuntimeHistory, JobRecord
+
+
+class FakeJob(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.parallel_job_info = None
+
+
+class TestMemoryAdmission(unittest.TestCase):
+
+    def setUp(self):
+        self.history = RuntimeHistory(':memory:')
+        self.history.record_many([
+            JobRecord('study', 's1', 'sulci_labelling_left',
+                      peak_rss=3000 * 1024 * 1024),
+            JobRecord('study', 's2', 'sulci_labelling_left',
+                      peak_rss=5000 * 1024 * 1024),
+            JobRecord('study', 's1', 'bias_correction',
+                      peak_rss=500 * 1024 * 1024)])
+        steps_memory = parse_steps_memory(['*normalization*:9000',
+                                           'bias_correction:2500'])
+        # 4 CPUs, 2000 MB per CPU
+        self.admission = MemoryAdmission(4, 8000, steps_memory,
+                                         history=self.history)
+
+    def tearDown(self):
+        self.history.close()
+
+    def test_parse_steps_memory(self):
+        self.assertEqual(parse_steps_memory(['a:10', ' b* : 20']),
+                         [('a', 10), ('b*', 20)])
+        self.assertRaises(ValueError, parse_steps_memory, ['a'])
+        self.assertRaises(ValueError, parse_steps_memory, ['a:b'])
+
+    def test_step_memory(self):
+        # settings have priority over history
+        self.assertEqual(self.admission.step_memory_MB('bias_correction'),
+                         2500)
+        self.assertEqual(
+            self.admission.step_memory_MB('sulci_labelling_left'), 5000)
+        self.assertEqual(self.admission.step_memory_MB('spm_normalization'),
+                         9000)
+        self.assertEqual(self.admission.step_memory_MB('morphometry'), None)
+
+    def test_cpus_for_step(self):
+        self.assertEqual(self.admission.cpus_for_step('morphometry'), 1)
+        self.assertEqual(self.admission.cpus_for_step('bias_correction'), 2)
+        self.assertEqual(
+            self.admission.cpus_for_step('sulci_labelling_left'), 3)
+        # more than the whole budget: runs alone
+        self.assertEqual(
+            self.admission.cpus_for_step('spm_normalization'), 4)
+
+    def test_apply(self):
+        jobs = [FakeJob('morphometry'), FakeJob('sulci_labelling_left')]
+        self.admission.apply(jobs, lambda job: job.name)
+        self.assertEqual(jobs[0].parallel_job_info, None)
+        self.assertEqual(jobs[1].parallel_job_info,
+                         {'config_name': 'native', 'nodes_number': 1,
+                          'cpu_per_node': 3})
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestMemoryAdmission)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -1,12 +1,16 @@
 from __future__ import absolute_import
 import sys
 import time
+import socket
 import unittest
 import optparse
 
 from morphologist.core.runner import MissingInputFileError, \
     Runner, SomaWorkflowRunner
+from morphologist.core.settings import settings
 from morphologist.core.tests.study import MockStudyTestCase
+from morphologist.core.tests.mocks.workflow_controller import \
+    MockWorkflowController, VirtualClock
 
 
 class TestRunner(unittest.TestCase):
@@ -71,6 +75,50 @@ class TestRunnerOnSuccessStudy(TestRunner):
 
         self.assert_(not self.runner.is_running(update_status=False))
 
+    def test_stop_subject(self):
+        self.runner.run()
+        subject_id = self.test_case.get_a_subject_id()
+        self.runner.stop(subject_id)
+
+        self.assert_(not self.runner.is_running(subject_id))
+        # the other subjects keep running
+        self.runner.wait()
+        self.assert_(not self.runner.is_running())
+        self.assert_output_files_exist_only_for_succeed_steps_after_stop()
+
+    def test_restart_subject(self):
+        self.runner.run()
+        subject_id = self.test_case.get_a_subject_id()
+        self.runner.stop(subject_id)
+        self.runner.restart(subject_id)
+        self.runner.wait()
+
+        self.assert_(not self.runner.has_failed(subject_id))
+        self.assertTrue(self.study.has_all_results([subject_id]))
+
+    def test_run_subject_while_running(self):
+        subject_ids = list(self.study.subjects)
+        self.runner.run(subject_ids=subject_ids[1:])
+        self.runner.run(subject_ids=subject_ids[:1])
+
+        self.assert_(self.runner.is_running(subject_ids[0])
+                     or self.study.has_all_results(subject_ids[:1]))
+        self.runner.wait()
+        self.assert_output_files_exist()
+
+    def test_run_in_several_workflows(self):
+        max_subjects = settings.runner.max_subjects_per_workflow
+        settings.runner.max_subjects_per_workflow = 1
+        try:
+            self.runner.run()
+        finally:
+            settings.runner.max_subjects_per_workflow = max_subjects
+        self.runner.wait()
+
+        self.assert_(not self.runner.is_running(update_status=False))
+        self.assert_(not self.runner.has_failed(update_status=False))
+        self.assert_output_files_exist()
+
     def test_clear_state_after_immediate_interruption(self):
         self.runner.run()
         self.runner.stop()
@@ -139,6 +187,81 @@ class TestSomaWorkflowRunner(TestRunnerOnSuccessStudy):
         return SomaWorkflowRunner(study)
 
 
+class FailingSubmissionController(MockWorkflowController):
+    ''' Mock controller which cannot submit its first workflows '''
+
+    def __init__(self, failed_submissions=1, **kwargs):
+        super(FailingSubmissionController, self).__init__(**kwargs)
+        self.failed_submissions = failed_submissions
+
+    def submit_workflow(self, workflow, expiration_date=None, name=None,
+                        queue=None):
+        if self.failed_submissions:
+            self.failed_submissions -= 1
+            raise RuntimeError('submission failed')
+        return super(FailingSubmissionController, self).submit_workflow(
+            workflow, expiration_date, name, queue)
+
+
+class TestRunnerSubmissionFailure(TestRunner):
+
+    def create_runner(self, study):
+        self.clock = VirtualClock()
+        self.controller = FailingSubmissionController(
+            job_duration=10., failure_rate=1., clock=self.clock)
+        return SomaWorkflowRunner(study, workflow_controller=self.controller)
+
+    def test_restart_after_failed_submission(self):
+        subject_ids = list(self.study.subjects)
+        max_subjects = settings.runner.max_subjects_per_workflow
+        settings.runner.max_subjects_per_workflow = 1
+        try:
+            self.runner.run()
+            self.clock.advance(1000.)
+            self.assert_(self.runner.has_failed())
+            self.assertEqual(self.runner.get_status(subject_ids[0]),
+                             Runner.FAILED)
+            # the subject of the first shard is submitted again, with the
+            # failed jobs of the other ones
+            self.controller.failure_rate = 0.
+            self.runner.restart()
+        finally:
+            settings.runner.max_subjects_per_workflow = max_subjects
+        for subject_id in subject_ids:
+            self.assertEqual(self.runner.get_status(subject_id),
+                             Runner.RUNNING)
+        self.clock.advance(1000.)
+        self.assert_(not self.runner.is_running())
+        self.assert_(not self.runner.has_failed(update_status=False))
+
+
+class TestRunnerMetricsEndpoint(TestRunner):
+
+    def create_runner(self, study):
+        self.clock = VirtualClock()
+        controller = MockWorkflowController(job_duration=10.,
+                                            clock=self.clock)
+        return SomaWorkflowRunner(study, workflow_controller=controller)
+
+    def test_port_in_use(self):
+        # port of the endpoint of another instance
+        other_socket = socket.socket()
+        other_socket.bind(('127.0.0.1', 0))
+        other_socket.listen(1)
+        port = other_socket.getsockname()[1]
+        metrics_port = settings.runner.metrics_port
+        settings.runner.metrics_port = port
+        try:
+            self.runner.run()
+        finally:
+            settings.runner.metrics_port = metrics_port
+            other_socket.close()
+        self.assert_(self.runner.is_running())
+        self.clock.advance(1000.)
+        self.assert_(not self.runner.is_running())
+        self.assert_(not self.runner.has_failed(update_status=False))
+
+
 if __name__=='__main__':
     parser = optparse.OptionParser()
     parser.add_option('-t', '--test',
@@ -146,8 +269,12 @@ if __name__=='__main__':
                       help="Execute only this test function.")
     options, _ = parser.parse_args(sys.argv)
     if options.test is None:
-        suite = unittest.TestLoader().loadTestsFromTestCase(
-            TestSomaWorkflowRunner)
+        loader = unittest.TestLoader()
+        suite = unittest.TestSuite([
+            loader.loadTestsFromTestCase(test_case)
+            for test_case in (TestSomaWorkflowRunner,
+                              TestRunnerSubmissionFailure,
+                              TestRunnerMetricsEndpoint)])
         unittest.TextTestRunner(verbosity=2).run(suite)
     else:
         test_suite = unittest.TestSuite([TestSomaWorkflowRunner(options.test)])
@@ -0,0 +1,108 @@
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+import unittest
+from six.moves.urllib.request import urlopen
+from six.moves.urllib.error import HTTPError
+
+from morphologist.core.runner_metrics import RunnerMetrics, MetricsServer, \
+    format_metrics
+
+
+class TestRunnerMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.metrics = RunnerMetrics('my "study"')
+        self.metrics.set_state({'running': 3, 'success': 10, 'failed': 1},
+                               failed_subjects=1, subjects=4, workflows=1)
+        self.metrics.observe_poll(0.5)
+        self.metrics.observe_poll(0.25)
+        self.metrics.observe_submission(2.)
+        self.metrics.observe_job('BiasCorrection', 'success', 30.)
+        self.metrics.observe_job('BiasCorrection', 'success', 50.)
+        self.metrics.observe_job('SulciRecognition', 'failed', 5.)
+        self.metrics.observe_job('SulciRecognition', 'failed', None)
+
+    def _samples(self, text):
+        samples = {}
+        for line in text.splitlines():
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = value
+        return samples
+
+    def test_format(self):
+        text = format_metrics([
+            ('m', 'gauge', 'A metric.',
+             [('', {'b': 'x\n', 'a': 'y\\'}, 1.5), ('', {}, None)])])
+        self.assertEqual(text, '# HELP m A metric.\n# TYPE m gauge\n'
+                         'm{a="y\\\\",b="x\\n"} 1.5\nm NaN\n')
+
+    def test_exposition(self):
+        samples = self._samples(self.metrics.exposition())
+        study = 'study="my \\"study\\""'
+        prefix = 'morphologist_runner_'
+        self.assertEqual(samples['%sjobs{state="running",%s}'
+                                 % (prefix, study)], '3')
+        self.assertEqual(samples['%sjobs{state="aborted_notrun",%s}'
+                                 % (prefix, study)], '0')
+        self.assertEqual(samples['%sfailed_subjects{%s}' % (prefix, study)],
+                         '1')
+        self.assertEqual(
+            samples['%sstep_duration_seconds_sum{status="success",'
+                    'step="BiasCorrection",%s}' % (prefix, study)], '80.0')
+        self.assertEqual(
+            samples['%sstep_duration_seconds_count{status="failed",'
+                    'step="SulciRecognition",%s}' % (prefix, study)], '1')
+        self.assertEqual(samples['%sstatus_poll_duration_seconds_count{%s}'
+                                 % (prefix, study)], '2')
+        self.assertEqual(samples['%sstatus_poll_duration_seconds_sum{%s}'
+                                 % (prefix, study)], '0.75')
+        self.assertEqual(
+            samples['%slast_submission_duration_seconds{%s}'
+                    % (prefix, study)], '2.0')
+
+    def test_server(self):
+        server = MetricsServer(self.metrics, port=0)
+        server.start()
+        try:
+            response = urlopen(server.url, timeout=10)
+            self.assertEqual(response.getcode(), 200)
+            self.assert_(response.info()['Content-Type'].startswith(
+                'text/plain; version=0.0.4'))
+            self.assertEqual(response.read().decode('utf-8'),
+                             self.metrics.exposition())
+            self.metrics.observe_poll(1.)
+            text = urlopen(server.url, timeout=10).read().decode('utf-8')
+            self.assert_(
+                'morphologist_runner_last_status_poll_duration_seconds'
+                '{study="my \\"study\\""} 1.0' in text)
+            try:
+                urlopen(server.url.replace('/metrics', '/other'),
+                        timeout=10)
+            except HTTPError as e:
+                self.assertEqual(e.code, 404)
+            else:
+                self.fail('no error on an unknown path')
+        finally:
+            server.stop()
+
+    def test_textfile(self):
+        directory = tempfile.mkdtemp(prefix='morphologist_metrics_')
+        try:
+            filename = os.path.join(directory, 'collector',
+                                    'morphologist.prom')
+            self.metrics.write_textfile(filename)
+            self.metrics.write_textfile(filename)
+            with open(filename) as f:
+                self.assertEqual(f.read(), self.metrics.exposition())
+            self.assertEqual(os.listdir(os.path.dirname(filename)),
+                             ['morphologist.prom'])
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestRunnerMetrics)
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,128 @@
+from __future__ import absolute_import
+import unittest
+
+from morphologist.core.runtime_history import RuntimeHistory, JobRecord, \
+    parse_resource_usage
+
+
+class TestRuntimeHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.history = RuntimeHistory(':memory:')
+        records = []
+        for i, subject_id in enumerate(['grp-s1', 'grp-s2', 'grp-s3']):
+            records.append(JobRecord(
+                'study_a', subject_id, 'bias_correction', job_id=i,
+                resource='localhost', start_time=100. * i,
+                end_time=100. * i + 10. + i, cpu_time=9., peak_rss=1000 * i))
+        records.append(JobRecord(
+            'study_a', 'grp-s1', 'brain_extraction', job_id=10,
+            resource='cluster', start_time=0., end_time=50.))
+        records.append(JobRecord(
+            'study_b', 'grp-s1', 'bias_correction', job_id=11,
+            resource='cluster', status=JobRecord.FAILED, exit_value=1,
+            start_time=0., end_time=1.))
+        self.history.record_many(records)
+
+    def tearDown(self):
+        self.history.close()
+
+    def test_records_query(self):
+        records = self.history.records(study='study_a',
+                                       step_id='bias_correction')
+        self.assertEqual(len(records), 3)
+        # most recent first
+        self.assertEqual(records[0].subject_id, 'grp-s3')
+        self.assertEqual(records[0].wall_time, 12.)
+
+        records = self.history.records(subject_id='grp-s1')
+        self.assertEqual(len(records), 3)
+        records = self.history.records(status=JobRecord.FAILED)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].exit_value, 1)
+
+    def test_step_statistics(self):
+        statistics = self.history.step_statistics()
+        self.assertEqual(sorted(statistics.keys()),
+                         ['bias_correction', 'brain_extraction'])
+        bias_correction = statistics['bias_correction']
+        self.assertEqual(bias_correction.count, 3)
+        self.assertAlmostEqual(bias_correction.mean_wall_time, 11.)
+        self.assertEqual(bias_correction.max_wall_time, 12.)
+        self.assertEqual(bias_correction.max_peak_rss, 2000)
+
+    def test_resource_statistics(self):
+        statistics = self.history.resource_statistics()
+        self.assertEqual(statistics['localhost'], (3, 11.))
+        self.assertEqual(statistics['cluster'], (1, 50.))
+
+    def test_estimated_duration(self):
+        self.assertAlmostEqual(
+            self.history.estimated_duration('bias_correction'), 11.)
+        # unknown in this study: falls back to all studies
+        self.assertAlmostEqual(
+            self.history.estimated_duration('brain_extraction',
+                                            study='study_b'), 50.)
+        self.assertEqual(self.history.estimated_duration('morphometry'),
+                         None)
+
+    def test_clear(self):
+        self.history.clear(study='study_b')
+        self.assertEqual(len(self.history.records()), 4)
+        self.history.clear()
+        self.assertEqual(len(self.history.records()), 0)
+
+
+class TestParseResourceUsage(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual(parse_resource_usage(None), (None, None, None))
+        self.assertEqual(parse_resource_usage(''), (None, None, None))
+
+    def test_string(self):
+        wall_time, cpu_time, peak_rss = parse_resource_usage(
+            'ru_wallclock=12.5 ru_utime=3.0 ru_stime=1.0 ru_maxrss=2048')
+        self.assertEqual(wall_time, 12.5)
+        self.assertEqual(cpu_time, 4.0)
+        self.assertEqual(peak_rss, 2048 * 1024)
+
+    def test_dict_with_units(self):
+        wall_time, cpu_time, peak_rss = parse_resource_usage(
+            {'cpu': '30', 'peak_rss': '1.5G', 'walltime': '40'})
+        self.assertEqual(wall_time, 40.)
+        self.assertEqual(cpu_time, 30.)
+        self.assertEqual(peak_rss, int(1.5 * 1024 ** 3))
+
+    def test_virtual_memory(self):
+        # virtual sizes are not taken as the resident peak
+        _, _, peak_rss = parse_resource_usage(
+            {'cpu': '30', 'maxvmem': '1.5G', 'walltime': '40'})
+        self.assert_(peak_rss is None)
+        _, _, peak_rss = parse_resource_usage(
+            'walltime=40 vmem=3000000kb maxrss=2048')
+        self.assertEqual(peak_rss, 2048 * 1024)
+
+    def test_pbs_durations(self):
+        wall_time, cpu_time, _ = parse_resource_usage(
+            'walltime=01:02:03 cput=00:10:00')
+        self.assertEqual(wall_time, 3723.)
+        self.assertEqual(cpu_time, 600.)
+        wall_time, cpu_time, _ = parse_resource_usage(
+            {'walltime': '02:30.5', 'cput': '45'})
+        self.assertEqual(wall_time, 150.5)
+        self.assertEqual(cpu_time, 45.)
+
+    def test_cputime(self):
+        # as reported by the mock workflow controller
+        wall_time, cpu_time, peak_rss = parse_resource_usage(
+            'walltime=10.000000 cputime=8.500000 maxrss=100000')
+        self.assertEqual(wall_time, 10.)
+        self.assertEqual(cpu_time, 8.5)
+        self.assertEqual(peak_rss, 100000 * 1024)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestRuntimeHistory)
+    suite.addTest(unittest.TestLoader().loadTestsFromTestCase(
+        TestParseResourceUsage))
+    unittest.TextTestRunner(verbosity=2).run(suite)
@@ -0,0 +1,85 @@
+from __future__ import absolute_import
+import os
+import csv
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+import numpy as np
+
+from morphologist.core.segmentation_statistics import \
+    SegmentationStatistics, label_voxel_counts, subject_statistics, \
+    LEFT_HEMISPHERE_LABEL, RIGHT_HEMISPHERE_LABEL, GREY_LABEL, WHITE_LABEL
+from morphologist.core.tests.test_thumbnails import write_nifti
+
+
+class TestSegmentationStatistics(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='morphologist_statistics_')
+        shape = (20, 16, 12)
+        x = np.indices(shape)[0]
+        self.brain_mask = np.zeros(shape, dtype=np.int16)
+        self.brain_mask[2:18, 2:14, 2:10] = 255
+        self.split_brain = np.where(
+            self.brain_mask, np.where(x < 10, RIGHT_HEMISPHERE_LABEL,
+                                      LEFT_HEMISPHERE_LABEL),
+            0).astype(np.int16)
+        self.grey_white = np.zeros(shape, dtype=np.int16)
+        self.grey_white[2:10, 2:14, 2:10] = GREY_LABEL
+        self.grey_white[4:8, 4:12, 4:8] = WHITE_LABEL
+        self.subjects_files = OrderedDict()
+        for subject_id in ['s1', 's2']:
+            files = {}
+            for role, volume in [('brain_mask', self.brain_mask),
+                                 ('split_brain', self.split_brain),
+                                 ('left_grey_white', self.grey_white)]:
+                filename = os.path.join(self.directory,
+                                        '%s_%s.nii' % (role, subject_id))
+                write_nifti(filename, volume, voxel_size=(1., 1., 2.))
+                files[role] = filename
+            self.subjects_files[subject_id] = files
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_label_voxel_counts(self):
+        counts = label_voxel_counts(self.grey_white, chunk_voxels=100)
+        self.assertEqual(counts[WHITE_LABEL], 4 * 8 * 4)
+        self.assertEqual(counts[GREY_LABEL], 8 * 12 * 8 - 4 * 8 * 4)
+        self.assertEqual(sum(counts.values()), self.grey_white.size)
+        counts = label_voxel_counts(np.array([[[-1, 0, 3, 3]]]))
+        self.assertEqual(counts, {-1: 1, 0: 1, 3: 2})
+
+    def test_subject_statistics(self):
+        statistics = subject_statistics(self.subjects_files['s1'])
+        self.assertEqual(statistics['brain_volume'], 16 * 12 * 8 * 2.)
+        self.assertEqual(statistics['left_hemisphere_volume'],
+                         8 * 12 * 8 * 2.)
+        self.assertEqual(statistics['cerebellum_volume'], 0.)
+        self.assertEqual(statistics['left_white_voxels'], 4 * 8 * 4)
+        self.assert_(statistics['right_white_voxels'] is None)
+
+    def test_update(self):
+        statistics = SegmentationStatistics(self.directory)
+        self.assertEqual(statistics.update(self.subjects_files, processes=2),
+                         ['s1', 's2'])
+        with open(statistics.table_filepath) as f:
+            rows = list(csv.reader(f))
+        self.assertEqual(len(rows), 3)
+        self.assertEqual(rows[1][0], 's1')
+        # cached results are reused by a new engine
+        statistics = SegmentationStatistics(self.directory)
+        self.assertEqual(statistics.update(self.subjects_files), [])
+        self.assertEqual(statistics.table['s2']['left_grey_voxels'],
+                         8 * 12 * 8 - 4 * 8 * 4)
+        filename = self.subjects_files['s2']['brain_mask']
+        mtime = os.stat(filename).st_mtime
+        os.utime(filename, (mtime + 10, mtime + 10))
+        self.assertEqual(statistics.update(self.subjects_files), ['s2'])
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(
+        TestSegmentationStatistics)
+    unittest.TextTestRunner(verbosity=2).run(suite)
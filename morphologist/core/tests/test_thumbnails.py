@@ -0,0 +1,131 @@
+from __future__ import absolute_import
+import os
+import struct
+import shutil
+import tempfile
+import zlib
+import unittest
+from collections import OrderedDict
+import numpy as np
+
+from morphologist.core.nifti import read_nifti, read_nifti_header, \
+    NiftiError
+from morphologist.core.thumbnails import ThumbnailsMosaic, \
+    render_thumbnail, write_png, PANELS
+
+
+def write_nifti(filename, data, voxel_size=(1., 1., 1.)):
+    ''' minimal NIfTI-1 writer for tests '''
+    datatypes = {np.dtype(np.uint8): 2, np.dtype(np.int16): 4,
+                 np.dtype(np.float32): 16}
+    header = bytearray(352)
+    struct.pack_into('<i', header, 0, 348)
+    dim = [data.ndim] + list(data.shape) + [1] * (7 - data.ndim)
+    struct.pack_into('<8h', header, 40, *dim)
+    struct.pack_into('<h', header, 70, datatypes[data.dtype])
+    struct.pack_into('<h', header, 72, data.dtype.itemsize * 8)
+    struct.pack_into('<8f', header, 76,
+                     *([1.] + list(voxel_size) + [1.] * (7 - len(voxel_size))))
+    struct.pack_into('<f', header, 108, 352)
+    header[344:348] = b'n+1\x00'
+    with open(filename, 'wb') as f:
+        f.write(bytes(header))
+        f.write(data.astype(data.dtype.newbyteorder('<')).tobytes(order='F'))
+
+
+def make_subject_volumes(shape=(40, 48, 30)):
+    x, y, z = np.indices(shape)
+    center = np.array(shape) / 2.
+    distance = np.sqrt(((x - center[0]) / shape[0]) ** 2
+                       + ((y - center[1]) / shape[1]) ** 2
+                       + ((z - center[2]) / shape[2]) ** 2)
+    mri = (1000 * (1 - distance)).astype(np.int16)
+    brain_mask = np.where(distance < 0.35, 255, 0).astype(np.int16)
+    split_brain = np.where(brain_mask, np.where(x < center[0], 1, 2),
+                           0).astype(np.int16)
+    grey_white = np.where(distance < 0.25, 200,
+                          np.where(distance < 0.35, 100, 0))
+    left_grey_white = np.where(x < center[0], grey_white, 0).astype(np.int16)
+    return OrderedDict([('mri', mri), ('brain_mask', brain_mask),
+                        ('split_brain', split_brain),
+                        ('left_grey_white', left_grey_white)])
+
+
+class TestThumbnails(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='morphologist_thumbnails_')
+        self.subjects_files = OrderedDict()
+        for subject_id in ['s1', 's2', 's3']:
+            files = {}
+            for role, volume in make_subject_volumes().items():
+                filename = os.path.join(self.directory,
+                                        '%s_%s.nii' % (subject_id, role))
+                write_nifti(filename, volume)
+                files[role] = filename
+            self.subjects_files[subject_id] = files
+        # no output yet
+        self.subjects_files['s4'] = {
+            'mri': os.path.join(self.directory, 'missing.nii')}
+        self.mosaic_directory = os.path.join(self.directory, 'qc')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_read_nifti(self):
+        volumes = make_subject_volumes()
+        header, data = read_nifti(self.subjects_files['s1']['mri'])
+        self.assertEqual(header['shape'], (40, 48, 30))
+        self.assert_((data == volumes['mri']).all())
+        bad_filename = os.path.join(self.directory, 'bad.nii')
+        with open(bad_filename, 'wb') as f:
+            f.write(b'\x00' * 400)
+        self.assertRaises(NiftiError, read_nifti_header, bad_filename)
+
+    def test_render_thumbnail(self):
+        thumbnail = render_thumbnail(make_subject_volumes(), (32, 40))
+        self.assertEqual(thumbnail.shape, (32, 40 * len(PANELS), 3))
+        self.assertEqual(thumbnail.dtype, np.uint8)
+        # overlays are colored, the MRI alone is grey
+        panel = thumbnail[:, :40].astype(int)
+        self.assert_((panel[:, :, 1] != panel[:, :, 0]).any())
+
+    def test_png(self):
+        image = np.zeros((3, 2, 3), dtype=np.uint8)
+        image[1, 1] = (255, 0, 0)
+        filename = os.path.join(self.directory, 'image.png')
+        write_png(filename, image)
+        with open(filename, 'rb') as f:
+            data = f.read()
+        self.assertEqual(data[:8], b'\x89PNG\r\n\x1a\n')
+        width, height = struct.unpack('>II', data[16:24])
+        self.assertEqual((width, height), (2, 3))
+        idat_length = struct.unpack('>I', data[33:37])[0]
+        raw = zlib.decompress(data[41:41 + idat_length])
+        self.assertEqual(raw, b'\x00' + b'\x00' * 6
+                         + b'\x00' + b'\x00' * 3 + b'\xff\x00\x00'
+                         + b'\x00' + b'\x00' * 6)
+
+    def test_mosaic(self):
+        mosaic = ThumbnailsMosaic(self.mosaic_directory, tile_size=(20, 20),
+                                  columns=2)
+        rendered = mosaic.update(self.subjects_files, processes=2)
+        self.assertEqual(rendered, ['s1', 's2', 's3', 's4'])
+        self.assert_(os.path.exists(mosaic.mosaic_filepath))
+        self.assertEqual(mosaic.position('s3'), (0, 20, 60, 20))
+        self.assertEqual(mosaic.position('s4'), None)
+
+        # cached: only the modified subject is rendered again
+        mosaic = ThumbnailsMosaic(self.mosaic_directory, tile_size=(20, 20),
+                                  columns=2)
+        self.assertEqual(mosaic.thumbnail('s2').shape, (20, 60, 3))
+        filename = self.subjects_files['s2']['brain_mask']
+        mtime = os.stat(filename).st_mtime
+        os.utime(filename, (mtime + 10, mtime + 10))
+        self.assertEqual(mosaic.update(self.subjects_files, processes=1),
+                         ['s2', 's4'])
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestThumbnails)
+    unittest.TextTestRunner(verbosity=2).run(suite)
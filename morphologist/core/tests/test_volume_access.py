@@ -0,0 +1,58 @@
+from __future__ import absolute_import
+import os
+import gzip
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from morphologist.core.nifti import NiftiError
+from morphologist.core.volume_access import VolumeAccess, is_memory_mapped
+from morphologist.core.tests.test_thumbnails import write_nifti
+
+
+class TestVolumeAccess(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='morphologist_volumes_')
+        self.data = np.arange(6 * 5 * 4, dtype=np.int16).reshape((6, 5, 4))
+        self.filename = os.path.join(self.directory, 'volume.nii')
+        write_nifti(self.filename, self.data)
+        self.volume_access = VolumeAccess(headers_cache_size=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_memory_map(self):
+        header, data = self.volume_access.open(self.filename)
+        self.assert_(is_memory_mapped(data))
+        self.assertEqual(header['shape'], (6, 5, 4))
+        self.assert_(np.all(data == self.data))
+        self.assert_(np.all(data[:, :, 2] == self.data[:, :, 2]))
+        self.assertRaises(ValueError, data.__setitem__, (0, 0, 0), 1)
+
+    def test_gzipped_volume(self):
+        gz_filename = self.filename + '.gz'
+        with open(self.filename, 'rb') as f:
+            content = f.read()
+        with gzip.open(gz_filename, 'wb') as f:
+            f.write(content)
+        _, data = self.volume_access.open(gz_filename)
+        self.assert_(not is_memory_mapped(data))
+        self.assert_(np.all(data == self.data))
+
+    def test_headers_cache(self):
+        header = self.volume_access.header(self.filename)
+        self.assert_(self.volume_access.header(self.filename) is header)
+        # a rewritten file is parsed again
+        os.utime(self.filename, (0, 0))
+        self.assert_(self.volume_access.header(self.filename) is not header)
+        self.assertRaises(IOError, self.volume_access.header,
+                          os.path.join(self.directory, 'missing.nii'))
+        self.assertRaises(NiftiError, self.volume_access.open,
+                          os.path.join(self.directory, 'volume.ima'))
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestVolumeAccess)
+    unittest.TextTestRunner(verbosity=2).run(suite)
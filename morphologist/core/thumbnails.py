@@ -0,0 +1,312 @@
+from __future__ import absolute_import
+from __future__ import division
+import os
+import json
+import struct
+import zlib
+from collections import OrderedDict
+import numpy as np
+import six
+
+from morphologist.core.batch import pool_map, files_stamps, \
+    stamps_from_json, existing_files
+from morphologist.core.nifti import is_nifti_filename, NiftiError
+from morphologist.core.volume_access import open_volume
+
+
+# overlays of a thumbnail, left to right: roles of their label volumes
+PANELS = [('brain_mask',),
+          ('split_brain',),
+          ('left_grey_white', 'right_grey_white')]
+# label value -> RGB color; other labels use LABELS_PALETTE
+LABEL_COLORS = {100: (230, 160, 40),   # grey matter
+                200: (250, 250, 250)}  # white matter
+LABELS_PALETTE = [(40, 200, 60), (230, 60, 60), (60, 120, 240),
+                  (240, 220, 40), (200, 60, 220), (40, 210, 220)]
+OVERLAY_OPACITY = 0.45
+
+
+def _axial_slice(volume, z):
+    if volume.ndim > 3:
+        volume = volume[..., 0]
+    # image rows go downwards, y axis upwards
+    return np.asarray(volume[:, :, z]).T[::-1]
+
+
+def _label_color(label):
+    color = LABEL_COLORS.get(label)
+    if color is None:
+        color = LABELS_PALETTE[int(label) % len(LABELS_PALETTE)]
+    return color
+
+
+def _resize_nearest(image, size):
+    height, width = size
+    rows = (np.arange(height) * image.shape[0] // height)
+    columns = (np.arange(width) * image.shape[1] // width)
+    return image[rows][:, columns]
+
+
+def _grey_levels(mri_slice):
+    values = mri_slice[mri_slice > 0]
+    if values.size == 0:
+        return np.zeros(mri_slice.shape, dtype=np.float32)
+    low, high = np.percentile(values, (1, 99))
+    if high <= low:
+        high = low + 1
+    return np.clip((mri_slice.astype(np.float32) - low) / (high - low),
+                   0., 1.)
+
+
+def render_thumbnail(volumes, tile_size=(96, 96)):
+    ''' QC thumbnail of a subject: the axial slice through the middle of the
+    brain mask, with one panel per overlay of PANELS.
+
+    Parameters
+    ----------
+    volumes: dict
+        role -> volume array indexed (x, y, z[, t]). Missing roles give
+        panels without overlay.
+    tile_size: tuple
+        (height, width) of each panel
+
+    Returns
+    -------
+    thumbnail: numpy array
+        uint8 RGB image of shape (height, width * len(PANELS), 3)
+    '''
+    mri = volumes.get('mri')
+    mask = volumes.get('brain_mask')
+    reference = mri if mri is not None else mask
+    if reference is None:
+        reference = next(iter(volumes.values()), None)
+    if reference is None:
+        raise ValueError('no volume to render')
+    shape = reference.shape[:3]
+    if mask is not None and mask.shape[:3] == shape \
+            and np.any(np.asarray(mask)):
+        # middle of the brain, not of the field of view
+        z_profile = np.asarray(mask).reshape(shape[0] * shape[1], -1)
+        z_profile = (z_profile != 0).sum(axis=0)
+        z = int(round(np.average(np.arange(len(z_profile)),
+                                 weights=z_profile)))
+    else:
+        z = shape[2] // 2
+    if mri is not None:
+        base = _grey_levels(_axial_slice(mri, z))
+    else:
+        base = np.zeros(shape[:2][::-1], dtype=np.float32)
+    base_rgb = np.repeat(base[:, :, np.newaxis] * 255., 3, axis=2)
+    panels = []
+    for roles in PANELS:
+        panel = base_rgb.copy()
+        for role in roles:
+            labels = volumes.get(role)
+            if labels is None or labels.shape[:3] != shape:
+                continue
+            labels = _axial_slice(labels, z)
+            for label in np.unique(labels):
+                if label == 0:
+                    continue
+                where = labels == label
+                panel[where] = (1. - OVERLAY_OPACITY) * panel[where] \
+                    + OVERLAY_OPACITY * np.array(_label_color(label))
+        panels.append(_resize_nearest(panel, tile_size))
+    return np.clip(np.concatenate(panels, axis=1), 0, 255).astype(np.uint8)
+
+
+def write_png(filename, image):
+    ''' Write an uint8 RGB image as a PNG file '''
+    height, width = image.shape[:2]
+    # each row starts with the "no filter" byte
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8),
+                          image.reshape((height, width * 3))], axis=1)
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data \
+            + struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff)
+    with open(filename, 'wb') as f:
+        f.write(b'\x89PNG\r\n\x1a\n')
+        f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height,
+                                           8, 2, 0, 0, 0)))
+        f.write(chunk(b'IDAT', zlib.compress(raw.tobytes(), 6)))
+        f.write(chunk(b'IEND', b''))
+
+
+def _read_volumes(files):
+    volumes = {}
+    for role, filename in six.iteritems(files):
+        if not is_nifti_filename(filename):
+            continue
+        try:
+            _, volumes[role] = open_volume(filename)
+        except (IOError, OSError, NiftiError):
+            continue
+    return volumes
+
+
+def _render_subject(job):
+    # process pool job: must stay a module level function
+    subject_id, files, tile_size = job
+    volumes = _read_volumes(files)
+    if not volumes:
+        return subject_id, None
+    try:
+        return subject_id, render_thumbnail(volumes, tile_size)
+    except ValueError:
+        return subject_id, None
+
+
+class ThumbnailsMosaic(object):
+    ''' QC thumbnails of the subjects of a study, stored as a single mosaic
+    image.
+
+    Thumbnails are rendered offscreen from the NIfTI outputs, in a process
+    pool, and cached in the mosaic directory: a subject thumbnail is only
+    rendered again when one of its files has changed.
+    '''
+    mosaic_filename = 'mosaic.png'
+    tiles_filename = 'tiles.npy'
+    index_filename = 'index.json'
+
+    def __init__(self, directory, tile_size=(96, 96), columns=6):
+        '''
+        Parameters
+        ----------
+        directory: str
+            cache directory
+        tile_size: tuple
+            (height, width) of each panel of a thumbnail
+        columns: int
+            number of thumbnails per row of the mosaic
+        '''
+        self.directory = directory
+        self.tile_size = tuple(tile_size)
+        self.columns = columns
+        self._index = None
+        self._tiles = None
+
+    @property
+    def mosaic_filepath(self):
+        return os.path.join(self.directory, self.mosaic_filename)
+
+    def update(self, subjects_files, processes=None):
+        ''' Render the missing or out of date thumbnails and write the
+        mosaic.
+
+        Parameters
+        ----------
+        subjects_files: OrderedDict
+            subject_id -> {role: filename}, in the mosaic order
+        processes: int
+            size of the process pool (default: number of CPUs)
+
+        Returns
+        -------
+        rendered: list
+            ids of the subjects rendered again
+        '''
+        index, tiles = self._load()
+        stamps = {}
+        jobs = []
+        for subject_id, files in six.iteritems(subjects_files):
+            stamps[subject_id] = files_stamps(files)
+            cached_stamps = index['stamps'].get(subject_id)
+            if subject_id not in tiles or cached_stamps is None \
+                    or stamps_from_json(cached_stamps) != stamps[subject_id]:
+                jobs.append((subject_id,
+                             existing_files(files, stamps[subject_id]),
+                             self.tile_size))
+        for subject_id, thumbnail in pool_map(_render_subject, jobs,
+                                              processes):
+            if thumbnail is None:
+                tiles.pop(subject_id, None)
+            else:
+                tiles[subject_id] = thumbnail
+        subject_ids = [subject_id for subject_id in subjects_files
+                       if subject_id in tiles]
+        self._tiles = dict((subject_id, tiles[subject_id])
+                           for subject_id in subject_ids)
+        self._index = {'tile_size': list(self.tile_size),
+                       'columns': self.columns,
+                       'subjects': subject_ids,
+                       'stamps': dict((subject_id, stamps[subject_id])
+                                      for subject_id in subject_ids)}
+        self._save()
+        return [job[0] for job in jobs]
+
+    def thumbnail(self, subject_id):
+        ''' Cached thumbnail of a subject (uint8 RGB array), or None '''
+        _, tiles = self._load()
+        return tiles.get(subject_id)
+
+    def position(self, subject_id):
+        ''' (x, y, width, height) of the subject thumbnail in the mosaic,
+        or None
+        '''
+        index, _ = self._load()
+        if subject_id not in index['subjects']:
+            return None
+        i = index['subjects'].index(subject_id)
+        height, width = self._thumbnail_shape()
+        return ((i % self.columns) * width, (i // self.columns) * height,
+                width, height)
+
+    def _thumbnail_shape(self):
+        return self.tile_size[0], self.tile_size[1] * len(PANELS)
+
+    def _load(self):
+        if self._index is None:
+            self._index = {'subjects': [], 'stamps': {}}
+            self._tiles = {}
+            try:
+                with open(os.path.join(self.directory,
+                                       self.index_filename)) as f:
+                    index = json.load(f)
+                tiles = np.load(os.path.join(self.directory,
+                                             self.tiles_filename))
+            except (IOError, OSError, ValueError):
+                return self._index, self._tiles
+            if tuple(index.get('tile_size', ())) == self.tile_size \
+                    and len(tiles) == len(index['subjects']):
+                self._index = index
+                self._tiles = dict(zip(index['subjects'], tiles))
+        return self._index, self._tiles
+
+    def _save(self):
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        height, width = self._thumbnail_shape()
+        subject_ids = self._index['subjects']
+        if subject_ids:
+            tiles = np.array([self._tiles[subject_id]
+                              for subject_id in subject_ids])
+        else:
+            tiles = np.zeros((0, height, width, 3), dtype=np.uint8)
+        np.save(os.path.join(self.directory, self.tiles_filename), tiles)
+        rows = max(1, -(-len(subject_ids) // self.columns))
+        mosaic = np.zeros((rows * height, self.columns * width, 3),
+                          dtype=np.uint8)
+        for i, tile in enumerate(tiles):
+            y = (i // self.columns) * height
+            x = (i % self.columns) * width
+            mosaic[y:y + height, x:x + width] = tile
+        write_png(self.mosaic_filepath, mosaic)
+        # the index is written last: it validates the tiles
+        with open(os.path.join(self.directory, self.index_filename),
+                  'w') as f:
+            json.dump(self._index, f)
+
+
+def study_thumbnails_mosaic(study, processes=None):
+    ''' Update the QC thumbnails mosaic of a study, stored in the
+    "qc_thumbnails" directory of its output directory.
+    '''
+    subjects_files = []
+    for subject_id in study.subjects:
+        analysis = study.analyses[subject_id]
+        subjects_files.append((subject_id,
+                               analysis.get_qc_thumbnail_files()))
+    mosaic = ThumbnailsMosaic(os.path.join(study.output_directory,
+                                           'qc_thumbnails'))
+    mosaic.update(OrderedDict(subjects_files), processes=processes)
+    return mosaic
@@ -0,0 +1,92 @@
+from __future__ import absolute_import
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from morphologist.core.cache import file_stamp
+from morphologist.core.nifti import is_nifti_filename, read_nifti, \
+    read_nifti_header, NiftiError
+
+
+# number of parsed headers kept in memory
+HEADERS_CACHE_SIZE = 4096
+
+
+class VolumeAccess(object):
+    ''' Read-only access to the volumes written by Morphologist.
+
+    Uncompressed NIfTI volumes are opened as memory maps: slicing or
+    reducing them only reads the pages which are actually needed. Gzipped
+    volumes cannot be mapped and are read in memory. Parsed headers are
+    cached per (filename, mtime, size).
+    '''
+
+    def __init__(self, headers_cache_size=HEADERS_CACHE_SIZE):
+        self._headers_cache_size = headers_cache_size
+        self._lock = threading.Lock()
+        # (filename, mtime, size) -> header
+        self._headers = OrderedDict()
+
+    def header(self, filename):
+        ''' NIfTI header of filename, see nifti.parse_nifti_header '''
+        stamp = file_stamp(filename)
+        if stamp is None:
+            raise IOError("no such file: '%s'" % filename)
+        key = (filename,) + tuple(stamp)
+        with self._lock:
+            header = self._headers.pop(key, None)
+            if header is not None:
+                self._headers[key] = header
+                return header
+        header = read_nifti_header(filename)
+        with self._lock:
+            self._headers[key] = header
+            while len(self._headers) > self._headers_cache_size:
+                self._headers.popitem(last=False)
+        return header
+
+    def open(self, filename):
+        ''' Open a NIfTI volume.
+
+        Returns
+        -------
+        header: dict
+            see nifti.parse_nifti_header
+        data: numpy array
+            read-only array indexed (x, y, z, ...), without intensity
+            scaling: a memory map for uncompressed files
+        '''
+        if not is_nifti_filename(filename):
+            raise NiftiError("not a NIfTI file: '%s'" % filename)
+        if filename.endswith('.gz'):
+            header, data = read_nifti(filename)
+            return header, data
+        header = self.header(filename)
+        data = np.memmap(filename, dtype=header['dtype'], mode='r',
+                         offset=header['vox_offset'],
+                         shape=header['shape'], order='F')
+        return header, data
+
+    def clear(self):
+        with self._lock:
+            self._headers.clear()
+
+
+_volume_access = None
+
+
+def volume_access():
+    ''' Shared VolumeAccess of the process '''
+    global _volume_access
+    if _volume_access is None:
+        _volume_access = VolumeAccess()
+    return _volume_access
+
+
+def open_volume(filename):
+    ''' Open a volume with the shared VolumeAccess, see VolumeAccess.open '''
+    return volume_access().open(filename)
+
+
+def is_memory_mapped(data):
+    return isinstance(data, np.memmap)
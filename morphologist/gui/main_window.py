@@ -3,6 +3,7 @@ from __future__ import print_function
 from __future__ import absolute_import
 import os
 import types
+from collections import OrderedDict
 import six
 
 from morphologist.core.constants import ALL_SUBJECTS
@@ -11,6 +12,7 @@ from morphologist.core.utils import FuncQThread, QtThreadCall, partial
 from morphologist.core.runner import SomaWorkflowRunner
 from morphologist.core.study import Study, StudySerializationError
 from morphologist.core.analysis import AnalysisFactory
+from morphologist.core.morphometry import aggregate_morphometry
 from morphologist.core.gui.study_model import LazyStudyModel
 from morphologist.core.gui.analysis_model import LazyAnalysisModel
 from morphologist.core.gui.qt_backend import QtCore, QtGui, QtWebKit, loadUi
@@ -378,10 +380,7 @@ class MainWindow(QtGui.QMainWindow):
         if morphometry_filepath == '': return
         if subject_ids is ALL_SUBJECTS:
             subject_ids = six.iterkeys(self.study.subjects)
-        command = ['python', '-m', 'brainvisa.axon.runprocess',
-                   'concatenatefiles']
-        morpho_files = []
-        subjects = []
+        inputs = []
         for subject_id in subject_ids:
             analysis = self.study.analyses[subject_id]
             analysis.propagate_parameters()
@@ -391,14 +390,20 @@ class MainWindow(QtGui.QMainWindow):
             # ignore non-existing files
             if os.path.isfile(csv_filepath):
                 print('exists.')
-                morpho_files.append(csv_filepath)
-                subject_name = analysis.subject.name
-                subjects.append(subject_name)
-        print('morpho_files:', morpho_files)
-        command += ['"' + repr(morpho_files) + '"', '"' + repr(subjects) + '"',
-                    'group_measures=%s' % morphometry_filepath]
-        print('command:', ' '.join(command))
-        os.system(' '.join(command))
+                inputs.append((OrderedDict(
+                    [('subject', analysis.subject.name)]), csv_filepath))
+        report = aggregate_morphometry(inputs, morphometry_filepath)
+        print(report)
+        if report.unreadable or report.mismatched:
+            details = ['cannot read %s: %s' % item
+                       for item in report.unreadable] \
+                + ['%s: missing columns: %s, unexpected columns: %s'
+                   % (filename, ', '.join(missing), ', '.join(extra))
+                   for filename, missing, extra in report.mismatched]
+            QtGui.QMessageBox.warning(
+                self, 'Morphometry export',
+                'Some morphometry files were not exported as is:\n\n%s'
+                % '\n'.join(details))
 
     @QtCore.Slot()
     def on_current_subject_changed(self):
@@ -406,6 +411,11 @@ class MainWindow(QtGui.QMainWindow):
         if subject_id:
             analysis = self.study.analyses[subject_id]
             self.analysis_model.set_analysis(analysis)
+            neighbour_ids = self.study_model.get_neighbour_subject_ids(
+                settings.viewport.prefetch_subjects)
+            self.viewport_model.prefetch(
+                [self.study.analyses[neighbour_id]
+                 for neighbour_id in neighbour_ids])
 
     def set_study(self, study):
         self.study = study
@@ -7,6 +7,7 @@ from morphologist.core.backends.mixins import ColorMap, ViewType
 from morphologist.core.gui.object3d import Object3D, APCObject
 from morphologist.core.gui.vector_graphics import Histogram, VectorExtendedView
 from morphologist.core.backends import Backend
+from morphologist.core.settings import settings
 from morphologist.core.gui.viewport_widget import AnalysisViewportModel, \
                                     Object3DViewportView, VectorViewportView, \
                                     AnalysisViewportWidget, ViewportView
@@ -17,6 +18,22 @@ from brainvisa.morphologist.qt4gui.histo_analysis_editor \
     #import load_histo_analysis
 
 class IntraAnalysisViewportModel(AnalysisViewportModel):
+    # no object load blocks the GUI
+    use_async_load = True
+    # meshes displayed decimated in the small views
+    lod_parameters = (IntraAnalysisParameterNames.LEFT_GREY_SURFACE,
+                      IntraAnalysisParameterNames.RIGHT_GREY_SURFACE,
+                      IntraAnalysisParameterNames.LEFT_WHITE_SURFACE,
+                      IntraAnalysisParameterNames.RIGHT_WHITE_SURFACE)
+    # volumes first displayed downsampled, with their downsampling method
+    progressive_parameters = {
+        IntraAnalysisParameterNames.MRI : 'mean',
+        IntraAnalysisParameterNames.CORRECTED_MRI : 'mean',
+        IntraAnalysisParameterNames.BRAIN_MASK : 'nearest',
+        IntraAnalysisParameterNames.SPLIT_MASK : 'nearest',
+        IntraAnalysisParameterNames.LEFT_GREY_WHITE : 'nearest',
+        IntraAnalysisParameterNames.RIGHT_GREY_WHITE : 'nearest',
+    }
 
     def __init__(self, model):
         super(IntraAnalysisViewportModel, self).__init__(model)
@@ -52,18 +69,20 @@ class IntraAnalysisViewportModel(AnalysisViewportModel):
             obj = Object3D.from_filename(filename) 
         return obj
 
-    @staticmethod
-    def load_object_async(parameter_name, filename, callback):
-        _ = parameter_name
-        obj = None
-        if (parameter_name == IntraAnalysisParameterNames.COMMISSURE_COORDINATES):
-            obj = APCObject(filename)
+    @classmethod
+    def load_object_async(cls, parameter_name, filename, callback,
+                          preview_callback=None):
+        method = cls.progressive_parameters.get(parameter_name)
+        if preview_callback is not None and method is not None \
+                and settings.viewport.progressive_loading:
+            Object3D.from_filename_progressive(filename, callback,
+                                               preview_callback, method)
+        elif (parameter_name == IntraAnalysisParameterNames.COMMISSURE_COORDINATES):
+            APCObject.from_filename_async(filename, callback)
         elif (parameter_name == IntraAnalysisParameterNames.HISTO_ANALYSIS):
-            obj = Histogram.from_filename(filename)
+            Histogram.from_filename_async(filename, callback)
         else:
             Object3D.from_filename_async(filename, callback)
-            return
-        callback(obj)
 
     def _remove_useless_parameters(self, changed_parameters):
         for sulci, labelled_sulci in [(IntraAnalysisParameterNames.LEFT_SULCI,
@@ -258,7 +277,8 @@ class BrainMaskView(Object3DViewportView):
             mask.set_color_map(ColorMap.GREEN_MASK)
             mri = self._viewport_model.observed_objects[IntraAnalysisParameterNames.CORRECTED_MRI]
             if mri is not None:
-                fusion = Object3D.from_fusion(mri, mask, mode='linear', rate=0.7)
+                fusion = self._fusions.get_fusion(mri, mask, mode='linear',
+                                                  rate=0.7)
                 self._temp_object = fusion
                 self._view.add_object(fusion)
             else:
@@ -283,7 +303,8 @@ class SplitMaskView(Object3DViewportView):
             mask.set_color_map(ColorMap.RAINBOW_MASK)
             mri = self._viewport_model.observed_objects[IntraAnalysisParameterNames.CORRECTED_MRI]
             if mri is not None:
-                fusion = Object3D.from_fusion(mri, mask, mode='linear', rate=0.7)
+                fusion = self._fusions.get_fusion(mri, mask, mode='linear',
+                                                  rate=0.7)
                 self._temp_object = fusion
                 self._view.add_object(fusion)
             else:
@@ -312,12 +333,12 @@ class GreyWhiteView(Object3DViewportView):
         if left_mask is not None and right_mask is not None:
             left_mask.set_color_map(ColorMap.RAINBOW_MASK)
             right_mask.set_color_map(ColorMap.RAINBOW_MASK)
-            mask_fusion = Object3D.from_fusion(
+            mask_fusion = self._fusions.get_fusion(
                 left_mask, right_mask, mode='max_channel', rate=0.5)
             mri = self._viewport_model.observed_objects[
                 IntraAnalysisParameterNames.CORRECTED_MRI]
             if mri is not None:
-                fusion = Object3D.from_fusion(
+                fusion = self._fusions.get_fusion(
                     mri, mask_fusion, mode='linear', rate=0.7)
                 self._temp_object = fusion
                 self._view.add_object(fusion)
@@ -344,10 +365,10 @@ class GreySurfaceView(Object3DViewportView):
 
     def update(self):
         self._view.clear()
-        left_mesh = self._viewport_model.observed_objects[
-            IntraAnalysisParameterNames.LEFT_GREY_SURFACE]
-        right_mesh = self._viewport_model.observed_objects[
-            IntraAnalysisParameterNames.RIGHT_GREY_SURFACE]
+        left_mesh = self._observed_mesh(
+            IntraAnalysisParameterNames.LEFT_GREY_SURFACE)
+        right_mesh = self._observed_mesh(
+            IntraAnalysisParameterNames.RIGHT_GREY_SURFACE)
         yellow_color = [0.9, 0.7, 0.0, 1]
         gw_color = [1., 0.7, 0.7, 1.]
         if left_mesh is not None or right_mesh is not None:
@@ -365,31 +386,31 @@ class GreySurfaceView(Object3DViewportView):
         else: # 2D mode
             self._temp_object = []
             if left_mesh is not None:
-                left_fus = Object3D.from_fusion(
-                    left_mesh, method='Fusion2DMeshMethod')
-                left_fus.set_color(yellow_color)
+                left_fus = self._fusions.get_fusion(
+                    left_mesh, method='Fusion2DMeshMethod',
+                    color=yellow_color)
                 self._temp_object = [left_fus]
                 self._view.add_object(left_fus)
             if right_mesh is not None:
-                right_fus = Object3D.from_fusion(
-                    right_mesh, method='Fusion2DMeshMethod')
-                right_fus.set_color(yellow_color)
+                right_fus = self._fusions.get_fusion(
+                    right_mesh, method='Fusion2DMeshMethod',
+                    color=yellow_color)
                 self._temp_object.append(right_fus)
                 self._view.add_object(right_fus)
-            left_gw_mesh = self._viewport_model.observed_objects[
-                IntraAnalysisParameterNames.LEFT_WHITE_SURFACE]
-            right_gw_mesh = self._viewport_model.observed_objects[
-                IntraAnalysisParameterNames.RIGHT_WHITE_SURFACE]
+            left_gw_mesh = self._observed_mesh(
+                IntraAnalysisParameterNames.LEFT_WHITE_SURFACE)
+            right_gw_mesh = self._observed_mesh(
+                IntraAnalysisParameterNames.RIGHT_WHITE_SURFACE)
             if left_gw_mesh is not None:
-                left_gw_fus = Object3D.from_fusion(
-                    left_gw_mesh, method='Fusion2DMeshMethod')
-                left_gw_fus.set_color(gw_color)
+                left_gw_fus = self._fusions.get_fusion(
+                    left_gw_mesh, method='Fusion2DMeshMethod',
+                    color=gw_color)
                 self._temp_object.append(left_gw_fus)
                 self._view.add_object(left_gw_fus)
             if right_gw_mesh is not None:
-                right_gw_fus = Object3D.from_fusion(
-                    right_gw_mesh, method='Fusion2DMeshMethod')
-                right_gw_fus.set_color(gw_color)
+                right_gw_fus = self._fusions.get_fusion(
+                    right_gw_mesh, method='Fusion2DMeshMethod',
+                    color=gw_color)
                 self._temp_object.append(right_gw_fus)
                 self._view.add_object(right_gw_fus)
 
@@ -420,10 +441,10 @@ class SulciView(Object3DViewportView):
 
     def update(self):
         self._view.clear()
-        left_mesh = self._viewport_model.observed_objects[
-            IntraAnalysisParameterNames.LEFT_WHITE_SURFACE]
-        right_mesh = self._viewport_model.observed_objects[
-            IntraAnalysisParameterNames.RIGHT_WHITE_SURFACE]
+        left_mesh = self._observed_mesh(
+            IntraAnalysisParameterNames.LEFT_WHITE_SURFACE)
+        right_mesh = self._observed_mesh(
+            IntraAnalysisParameterNames.RIGHT_WHITE_SURFACE)
         left_sulci = self._viewport_model.observed_objects[
             IntraAnalysisParameterNames.LEFT_SULCI]
         right_sulci = self._viewport_model.observed_objects[
@@ -460,15 +481,13 @@ class SulciView(Object3DViewportView):
         gw_color = [1., 0.7, 0.7, 1.]
         if self.view_type() != ViewType.THREE_D and left_mesh is not None:
             print('add 2d mesh left')
-            left_fus = Object3D.from_fusion(
-                left_mesh, method='Fusion2DMeshMethod')
-            left_fus.set_color(gw_color)
+            left_fus = self._fusions.get_fusion(
+                left_mesh, method='Fusion2DMeshMethod', color=gw_color)
             print('left_fus:', left_fus)
             self._temp_object = [left_fus]
             self._view.add_object(left_fus)
         if self.view_type() != ViewType.THREE_D and right_mesh is not None:
-            right_fus = Object3D.from_fusion(
-                right_mesh, method='Fusion2DMeshMethod')
-            right_fus.set_color(gw_color)
+            right_fus = self._fusions.get_fusion(
+                right_mesh, method='Fusion2DMeshMethod', color=gw_color)
             self._temp_object.append(right_fus)
             self._view.add_object(right_fus)
@@ -139,3 +139,16 @@ class IntraAnalysis(SharedPipelineAnalysis):
         # optional, but still useful in our context)
         return IntraAnalysisParameterNames.get_output_file_parameter_names()
 
+    def get_qc_thumbnail_parameter_names(self):
+        return IntraAnalysisParameterNames.get_qc_thumbnail_parameter_names()
+
+    def get_segmentation_statistics_parameter_names(self):
+        return IntraAnalysisParameterNames.\
+            get_segmentation_statistics_parameter_names()
+
+    def get_qc_metrics_parameter_names(self):
+        return IntraAnalysisParameterNames.get_qc_metrics_parameter_names()
+
+    def get_morphometry_parameter_name(self):
+        return IntraAnalysisParameterNames.MORPHOMETRY_CSV
+
@@ -1,10 +1,22 @@
 #!/usr/bin/env python2
 from __future__ import absolute_import
+from __future__ import print_function
 import os
 import re
+import sys
+from collections import OrderedDict
 
 from optparse import OptionParser
 
+from morphologist.core.morphometry import aggregate_morphometry, \
+    MorphometrySchemaError
+
+
+# XXX: it would be better to pass these information to the script
+# warning: high coupling with specific parameter template choices !
+_FILENAME_REGEXP = re.compile('(left|right)_%s_morphometry_%s.dat' % \
+    ('(?P<normalized>(\w+))', '(?P<subjectname>\w+)'))
+
 
 def main():
     parser = OptionParser(usage='concat csv file inputs\n'
@@ -12,39 +24,50 @@ def main():
     parser.add_option('-o', '--output', dest='output_filepath',
         action='store', default=None,
         help='output filename: concatenation of all inputs')
+    parser.add_option('-j', '--readers', dest='readers', type='int',
+        action='store', default=4,
+        help='number of reading threads')
+    parser.add_option('--strict', dest='strict', action='store_true',
+        default=False,
+        help='fail if the columns of the inputs differ')
+    parser.add_option('--npz', dest='columnar', action='store_true',
+        default=False,
+        help='write a numpy .npz file with one array per column')
     options, args = parser.parse_args()
-    if len(args) == 1:
+    if len(args) == 0:
         parser.error('You must supply at least on csv file.')
     if options.output_filepath is None:
         parser.error('You must supply an output (--output).')
-    concat_csv(options.output_filepath, args)
+    try:
+        report = concat_csv(options.output_filepath, args,
+                            readers=options.readers, strict=options.strict,
+                            columnar=options.columnar)
+    except MorphometrySchemaError as e:
+        sys.exit(str(e))
+    for filename, error in report.unreadable:
+        print('cannot read %s: %s' % (filename, error), file=sys.stderr)
+    for filename, missing, extra in report.mismatched:
+        print('%s: missing columns: %s, unexpected columns: %s'
+              % (filename, ' '.join(missing), ' '.join(extra)),
+              file=sys.stderr)
 
 
-def concat_csv(output_filepath, input_filepaths):
-    first_file = True
-    fd_out = open(output_filepath, 'w')
+def concat_csv(output_filepath, input_filepaths, readers=4, strict=False,
+               columnar=False):
+    inputs = []
     for input_filepath in input_filepaths:
-        # XXX: it would be better to pass these information to the script
-        # warning: high coupling with specific parameter template choices !
         subjectname, is_normalized = \
             subject_and_normalize_status_from_filepath(input_filepath)
-        fd_in = open(input_filepath, 'r')
-        lines = fd_in.readlines()
-        header = lines[0]
-        lines = lines[1:]
-        if first_file:
-            fd_out.write('subject normalized ' + header)
-            first_file=False
-        for line in lines:
-            fd_out.write('%s %d ' % (subjectname, is_normalized))
-            fd_out.write(line)
+        inputs.append((OrderedDict([('subject', subjectname),
+                                    ('normalized', is_normalized)]),
+                       input_filepath))
+    return aggregate_morphometry(inputs, output_filepath, readers=readers,
+                                 strict=strict, columnar=columnar)
 
 
 def subject_and_normalize_status_from_filepath(filepath):
     filename = os.path.basename(filepath)
-    regexp = re.compile('(left|right)_%s_morphometry_%s.dat' % \
-        ('(?P<normalized>(\w+))', '(?P<subjectname>\w+)'))
-    match = regexp.match(filename)
+    match = _FILENAME_REGEXP.match(filename)
     groupdict = match.groupdict()
     subjectname = groupdict['subjectname']
     if groupdict['normalized'] == 'normalized':
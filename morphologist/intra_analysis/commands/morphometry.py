@@ -1,6 +1,13 @@
 from __future__ import absolute_import
+from __future__ import print_function
 import os
+import sys
 import glob
+import time
+import threading
+import subprocess
+import multiprocessing
+from multiprocessing.pool import ThreadPool
 from optparse import OptionParser
 
 from brainvisa.configuration import neuroConfig
@@ -14,14 +21,114 @@ class MorphometryError(Exception):
     pass
 
 
+class MorphometryJobResult(object):
+    ''' Outcome of the morphometry of one labeled sulci graph in a batch '''
+
+    def __init__(self, labeled_sulci, side, csv, error=None, duration=None):
+        self.labeled_sulci = labeled_sulci
+        self.side = side
+        self.csv = csv
+        self.error = error
+        self.duration = duration
+
+    @property
+    def succeeded(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.succeeded:
+            return '<MorphometryJobResult %s: ok (%.1fs)>' \
+                % (self.labeled_sulci, self.duration)
+        return '<MorphometryJobResult %s: %s>' % (self.labeled_sulci,
+                                                  self.error)
+
+
+class MorphometryBatchReport(object):
+    ''' Results of Morphometry.run_batch, in the order of the jobs '''
+
+    def __init__(self, results):
+        self.results = results
+
+    @property
+    def succeeded(self):
+        return [result for result in self.results if result.succeeded]
+
+    @property
+    def failed(self):
+        return [result for result in self.results if not result.succeeded]
+
+    def __repr__(self):
+        return '<MorphometryBatchReport: %d succeeded, %d failed>' \
+            % (len(self.succeeded), len(self.failed))
+
+
 class Morphometry(object):
+    simorpho_command = 'siMorpho'
+    # (side, normalized) -> model filepath
+    _models = {}
+    _models_lock = threading.Lock()
     
     @classmethod
     def run(cls, labeled_sulci, side, normalized, csv):
+        model = cls._find_model(side, normalized)
+        cls._run_command(cls._command(labeled_sulci, model, csv))
+
+    @classmethod
+    def run_batch(cls, jobs, normalized, workers=None):
+        ''' Run the morphometry of many labeled sulci graphs.
+
+        Models are resolved once, siMorpho commands run in a pool of worker
+        threads and the errors of a job do not stop the other jobs.
+
+        Parameters
+        ----------
+        jobs: list
+            (labeled_sulci, side, csv) items
+        normalized: bool
+        workers: int
+            number of simultaneous commands (default: number of CPUs)
+
+        Returns
+        -------
+        report: MorphometryBatchReport
+        '''
+        models = {}
+        for side in set(side for _, side, _ in jobs):
+            try:
+                models[side] = cls._find_model(side, normalized)
+            except (IndexError, OSError) as e:
+                models[side] = MorphometryError(
+                    'no %s model found: %s' % (side, e))
+        def run_job(job):
+            labeled_sulci, side, csv = job
+            model = models[side]
+            if isinstance(model, MorphometryError):
+                return MorphometryJobResult(labeled_sulci, side, csv,
+                                            error=str(model))
+            start_time = time.time()
+            try:
+                cls._run_command(cls._command(labeled_sulci, model, csv))
+            except (MorphometryError, OSError) as e:
+                error = str(e)
+            else:
+                error = None
+            return MorphometryJobResult(labeled_sulci, side, csv, error,
+                                        time.time() - start_time)
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        pool = ThreadPool(max(1, min(workers, len(jobs))))
+        try:
+            results = pool.map(run_job, jobs)
+        finally:
+            pool.close()
+            pool.join()
+        return MorphometryBatchReport(results)
+
+    @classmethod
+    def _command(cls, labeled_sulci, model, csv):
         # XXX: we need to know how the output is named
         prefix = os.path.splitext(csv)[0]
-        model = cls._find_model(side, normalized)
-        command = ['siMorpho',
+        command = [cls.simorpho_command,
                    '-m', model,
                    '-g', labeled_sulci,
                    '-o', prefix,
@@ -30,10 +137,20 @@ class Morphometry(object):
                    '--name-descriptors', '1',
                    '--filter-attributes', 'label',
                    '--one-file', '1']
-        cls._run_command(command)
+        return command
+
+    @classmethod
+    def _find_model(cls, side, normalized):
+        key = (side, normalized)
+        with cls._models_lock:
+            model_filepath = cls._models.get(key)
+            if model_filepath is None:
+                model_filepath = cls._glob_model(side, normalized)
+                cls._models[key] = model_filepath
+        return model_filepath
 
     @staticmethod
-    def _find_model(side, normalized):
+    def _glob_model(side, normalized):
         brainvisa_share_dir = neuroConfig.dataPath[0].directory
         models_relpath = 'models/models_2008/discriminative_models/3.1/'
         if side == LEFT:
@@ -51,21 +168,56 @@ class Morphometry(object):
 
     @staticmethod
     def _run_command(command):
-        str_command = ""
-        for command_element in command:
-            str_command = str_command + " '%s'" % command_element
-        return_value = os.system(str_command)
-        if return_value != 0:
-            msg = "The following command failed : %s" % str_command
+        process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        _, stderr = process.communicate()
+        if process.returncode != 0:
+            if not isinstance(stderr, str):
+                stderr = stderr.decode('utf-8', 'replace')
+            msg = "The following command failed (%d): %s\n%s" \
+                % (process.returncode, ' '.join(command), stderr.strip())
             raise MorphometryError(msg)
 
 
+def read_batch_file(filepath):
+    ''' (labeled_sulci, side, csv) jobs of a batch file: one job per line,
+    blank separated
+    '''
+    jobs = []
+    with open(filepath) as f:
+        for line in f:
+            items = line.split()
+            if not items or items[0].startswith('#'):
+                continue
+            if len(items) != 3:
+                raise MorphometryError('invalid batch line: %s'
+                                       % line.strip())
+            jobs.append(tuple(items))
+    return jobs
+
+
 if __name__ == '__main__':
-    parser = OptionParser(usage='%prog [--normalized] sulci_labelling side csv')
+    parser = OptionParser(usage='%prog [--normalized] sulci_labelling side csv\n'
+                          '%prog [--normalized] [-j workers] --batch jobs_file')
     parser.add_option('--normalized', dest='normalized',
         action='store_true', default=False,
         help='descriptors are standardized in a normalized space')
+    parser.add_option('--batch', dest='batch', action='store', default=None,
+        help='file of "sulci_labelling side csv" lines, run in parallel')
+    parser.add_option('-j', '--workers', dest='workers', type='int',
+        action='store', default=None,
+        help='number of simultaneous batch jobs (default: number of CPUs)')
     options, args = parser.parse_args()
+    if options.batch is not None:
+        if args:
+            parser.error('Invalid arguments: no argument with --batch.')
+        report = Morphometry.run_batch(read_batch_file(options.batch),
+                                       options.normalized, options.workers)
+        for result in report.failed:
+            print('%s: %s' % (result.labeled_sulci, result.error),
+                  file=sys.stderr)
+        print(report)
+        sys.exit(1 if report.failed else 0)
     if len(args) != 3:
         parser.error('Invalid arguments: all arguments are mandatory.')
     morphometry_step = Morphometry()
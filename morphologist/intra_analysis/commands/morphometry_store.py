@@ -0,0 +1,27 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from optparse import OptionParser
+
+from morphologist.core.study import Study
+from morphologist.core.morphometry import study_morphometry_store
+
+
+def main():
+    parser = OptionParser(usage='update the subjects x labels x measures '
+                          'morphometry array of a study\n'
+                          '%prog [-j readers] study_directory')
+    parser.add_option('-j', '--readers', dest='readers', type='int',
+        action='store', default=4,
+        help='number of reading threads')
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('You must supply a study directory.')
+    study = Study.from_study_directory(args[0])
+    store = study_morphometry_store(study, readers=options.readers)
+    print('%s: %d subjects, %d labels, %d measures'
+          % (store.filename, len(store.subjects), len(store.labels),
+             len(store.measures)))
+
+
+if __name__ == '__main__':
+    main()
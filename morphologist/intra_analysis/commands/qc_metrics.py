@@ -0,0 +1,32 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from optparse import OptionParser
+import six
+
+from morphologist.core.study import Study
+from morphologist.core.qc_metrics import study_qc_metrics
+
+
+def main():
+    parser = OptionParser(usage='compute the QC metrics of a study and '
+                          'print the outlier subjects\n'
+                          '%prog [-j processes] study_directory')
+    parser.add_option('-j', '--processes', dest='processes', type='int',
+        action='store', default=None,
+        help='number of processes (default: number of CPUs)')
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('You must supply a study directory.')
+    study = Study.from_study_directory(args[0])
+    qc_metrics = study_qc_metrics(study, processes=options.processes)
+    for subject_id in qc_metrics.table:
+        outliers = qc_metrics.outliers.get(subject_id)
+        if outliers:
+            print('%s: %s' % (subject_id, ', '.join(
+                '%s (%.1f)' % (metric, score)
+                for metric, score in six.iteritems(outliers))))
+    print(qc_metrics.table_filepath)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from optparse import OptionParser
+
+from morphologist.core.study import Study
+from morphologist.core.thumbnails import study_thumbnails_mosaic
+
+
+def main():
+    parser = OptionParser(usage='render the QC thumbnails mosaic of a study\n'
+                          '%prog [-j processes] study_directory')
+    parser.add_option('-j', '--processes', dest='processes', type='int',
+        action='store', default=None,
+        help='number of rendering processes (default: number of CPUs)')
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('You must supply a study directory.')
+    study = Study.from_study_directory(args[0])
+    mosaic = study_thumbnails_mosaic(study, processes=options.processes)
+    print(mosaic.mosaic_filepath)
+
+
+if __name__ == '__main__':
+    main()
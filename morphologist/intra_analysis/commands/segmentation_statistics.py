@@ -0,0 +1,35 @@
+from __future__ import absolute_import
+from __future__ import print_function
+from optparse import OptionParser
+
+from morphologist.core.study import Study
+from morphologist.core.segmentation_statistics import \
+    study_segmentation_statistics
+
+
+def main():
+    parser = OptionParser(usage='compute the segmentation statistics of a '
+                          'study\n%prog [-j processes] [-o table.csv] '
+                          'study_directory')
+    parser.add_option('-j', '--processes', dest='processes', type='int',
+        action='store', default=None,
+        help='number of processes (default: number of CPUs)')
+    parser.add_option('-o', '--output', dest='output', action='store',
+        default=None,
+        help='export the table to this CSV file (default: '
+             'statistics/segmentation_statistics.csv in the study)')
+    options, args = parser.parse_args()
+    if len(args) != 1:
+        parser.error('You must supply a study directory.')
+    study = Study.from_study_directory(args[0])
+    statistics = study_segmentation_statistics(
+        study, processes=options.processes)
+    if options.output is not None:
+        statistics.write_table(options.output)
+        print(options.output)
+    else:
+        print(statistics.table_filepath)
+
+
+if __name__ == '__main__':
+    main()
@@ -40,6 +40,31 @@ class IntraAnalysisParameterNames(object):
     def get_input_file_parameter_names(cls):
         return [cls.MRI, cls.MRI_REFERENTIAL]
 
+    @classmethod
+    def get_qc_thumbnail_parameter_names(cls):
+        return {'mri': cls.CORRECTED_MRI,
+                'brain_mask': cls.BRAIN_MASK,
+                'split_brain': cls.SPLIT_MASK,
+                'left_grey_white': cls.LEFT_GREY_WHITE,
+                'right_grey_white': cls.RIGHT_GREY_WHITE}
+
+    @classmethod
+    def get_segmentation_statistics_parameter_names(cls):
+        return {'brain_mask': cls.BRAIN_MASK,
+                'split_brain': cls.SPLIT_MASK,
+                'left_grey_white': cls.LEFT_GREY_WHITE,
+                'right_grey_white': cls.RIGHT_GREY_WHITE}
+
+    @classmethod
+    def get_qc_metrics_parameter_names(cls):
+        return {'histo_analysis': cls.HISTO_ANALYSIS,
+                'left_white_mesh': cls.LEFT_WHITE_SURFACE,
+                'right_white_mesh': cls.RIGHT_WHITE_SURFACE,
+                'left_pial_mesh': cls.LEFT_GREY_SURFACE,
+                'right_pial_mesh': cls.RIGHT_GREY_SURFACE,
+                'left_sulci': cls.LEFT_SULCI,
+                'right_sulci': cls.RIGHT_SULCI}
+
     @classmethod
     def get_input_other_parameter_names(cls):
         return [cls.EROSION_SIZE, cls.BARY_FACTOR]
@@ -0,0 +1,144 @@
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+import sys
+import json
+import time
+import platform
+from collections import OrderedDict
+import six
+
+
+# default regression tolerance: 20% slower than the baseline
+DEFAULT_TOLERANCE = 0.2
+
+
+class BenchmarkResults(object):
+    ''' Durations of benchmarked operations by study size, saved as JSON:
+
+        {"benchmark": name, "environment": {...},
+         "results": {operation: {subjects_number: {"min": .., "mean": ..,
+                                                   "repeat": ..}}}}
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.results = OrderedDict()
+
+    def add(self, operation, subjects_number, durations):
+        self.results.setdefault(operation, OrderedDict())[
+            str(subjects_number)] = {
+                'min': min(durations),
+                'mean': sum(durations) / len(durations),
+                'repeat': len(durations)}
+        print('%-32s %6d subjects: %.4fs' % (operation, subjects_number,
+                                             min(durations)))
+
+    def measure(self, operation, subjects_number, function, repeat=1):
+        ''' Time function() and record its durations. Returns the result of
+        the last call.
+        '''
+        durations = []
+        result = None
+        for _ in range(repeat):
+            start_time = time.time()
+            result = function()
+            durations.append(time.time() - start_time)
+        self.add(operation, subjects_number, durations)
+        return result
+
+    def to_dict(self):
+        return {'benchmark': self.name,
+                'environment': {'python': platform.python_version(),
+                                'platform': platform.platform(),
+                                'cpus': _cpu_count(),
+                                'date': time.strftime('%Y-%m-%d %H:%M:%S')},
+                'results': self.results}
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=4)
+
+
+def _cpu_count():
+    try:
+        import multiprocessing
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return None
+
+
+def compare_results(results, baseline, tolerance=DEFAULT_TOLERANCE):
+    ''' Regressions of results compared to a baseline.
+
+    Parameters
+    ----------
+    results, baseline: dict
+        BenchmarkResults.to_dict() contents
+    tolerance: float
+        relative slowdown accepted on the min durations
+
+    Returns
+    -------
+    regressions: list
+        (operation, subjects_number, baseline_duration, duration) items
+    '''
+    regressions = []
+    for operation, sizes in six.iteritems(results['results']):
+        baseline_sizes = baseline['results'].get(operation, {})
+        for subjects_number, durations in six.iteritems(sizes):
+            baseline_durations = baseline_sizes.get(subjects_number)
+            if baseline_durations is None:
+                continue
+            if durations['min'] > baseline_durations['min'] \
+                    * (1. + tolerance):
+                regressions.append((operation, int(subjects_number),
+                                    baseline_durations['min'],
+                                    durations['min']))
+    return regressions
+
+
+def add_benchmark_options(parser, default_sizes):
+    ''' Options shared by the benchmark scripts '''
+    parser.add_option('-s', '--sizes', dest='sizes', action='store',
+        default=','.join([str(size) for size in default_sizes]),
+        help='comma separated numbers of subjects (default: %default)')
+    parser.add_option('-r', '--repeat', dest='repeat', type='int',
+        action='store', default=3,
+        help='number of measures of each operation, the min is kept '
+             '(default: %default)')
+    parser.add_option('-o', '--output', dest='output', action='store',
+        default=None, help='write the results to this JSON file')
+    parser.add_option('-c', '--compare', dest='baseline', action='store',
+        default=None,
+        help='compare to the results of this JSON file and exit with an '
+             'error status on regressions')
+    parser.add_option('-t', '--tolerance', dest='tolerance', type='float',
+        action='store', default=DEFAULT_TOLERANCE,
+        help='accepted relative slowdown compared to the baseline '
+             '(default: %default)')
+
+
+def parse_sizes(sizes):
+    return [int(size) for size in sizes.split(',') if size.strip()]
+
+
+def finish_benchmark(results, options):
+    ''' Save results and compare them to the baseline, as requested by the
+    options of add_benchmark_options
+    '''
+    if options.output is not None:
+        results.save(options.output)
+        print('results written to', options.output)
+    if options.baseline is not None:
+        with open(options.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_results(results.to_dict(), baseline,
+                                      options.tolerance)
+        for operation, subjects_number, baseline_duration, duration \
+                in regressions:
+            print('REGRESSION %s (%d subjects): %.4fs -> %.4fs'
+                  % (operation, subjects_number, baseline_duration,
+                     duration))
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,101 @@
+''' Benchmark of the SomaWorkflowRunner overhead on synthetic studies of the
+mock analysis, with an in-process mock soma-workflow controller:
+
+    python -m morphologist.tests.benchmarks.runner_throughput \
+        -s 10,100,1000 --status-latency 0.005 -o results.json
+'''
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import time
+import shutil
+import tempfile
+from optparse import OptionParser
+
+from morphologist.core.gui.qt_backend import QtCore
+from morphologist.core.study import Study
+from morphologist.core.runner import SomaWorkflowRunner
+from morphologist.core.gui.study_model import LazyStudyModel
+from morphologist.core.tests.mocks.workflow_controller import \
+    MockWorkflowController, VirtualClock
+from morphologist.tests.benchmarks import BenchmarkResults, \
+    add_benchmark_options, parse_sizes, finish_benchmark
+from morphologist.tests.benchmarks.study_lifecycle import ANALYSIS_TYPE, \
+    create_organized_directory
+
+
+DEFAULT_SIZES = [10, 100, 1000]
+
+
+def create_runner(study, options):
+    clock = VirtualClock()
+    controller = MockWorkflowController(
+        job_duration=options.job_duration,
+        failure_rate=options.failure_rate,
+        status_latency=options.status_latency, clock=clock)
+    return SomaWorkflowRunner(study, workflow_controller=controller), \
+        controller, clock
+
+
+def benchmark_study_size(results, directory, subjects_number, options):
+    create_organized_directory(directory, subjects_number)
+    study = Study.from_organized_directory(ANALYSIS_TYPE, directory)
+    durations = []
+    for _ in range(options.repeat):
+        runner, controller, clock = create_runner(study, options)
+        start_time = time.time()
+        runner.run()
+        durations.append(time.time() - start_time)
+    results.add('run (submission)', subjects_number, durations)
+    # the runner and the model of the last run are polled: half of the jobs
+    # are done, then all of them
+    study_model = LazyStudyModel(study, runner)
+    study_model._timer.stop()
+    jobs_number = len(controller._jobs)
+    clock.advance(options.job_duration * jobs_number
+                  / (2. * controller.proc_nb))
+    for state in ('running', 'finished'):
+        status_calls_count = controller.status_calls_count
+        results.measure('status poll (%s)' % state, subjects_number,
+                        runner._update_jobs_status, options.repeat)
+        results.add('status requests per poll (%s)' % state,
+                    subjects_number,
+                    [float(controller.status_calls_count
+                           - status_calls_count) / options.repeat])
+        results.measure('LazyStudyModel._update_all_status (%s)' % state,
+                        subjects_number, study_model._update_all_status,
+                        options.repeat)
+        clock.advance(options.job_duration * jobs_number)
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]\n\n' + __doc__)
+    add_benchmark_options(parser, DEFAULT_SIZES)
+    parser.add_option('--job-duration', dest='job_duration', type='float',
+        action='store', default=60.,
+        help='simulated duration of the jobs, in seconds (default: '
+             '%default)')
+    parser.add_option('--failure-rate', dest='failure_rate', type='float',
+        action='store', default=0.,
+        help='probability that a simulated job fails (default: %default)')
+    parser.add_option('--status-latency', dest='status_latency',
+        type='float', action='store', default=0.,
+        help='real time spent in each status request of the controller, '
+             'in seconds (default: %default)')
+    options, args = parser.parse_args()
+    application = QtCore.QCoreApplication.instance()
+    if application is None:
+        application = QtCore.QCoreApplication([])
+    results = BenchmarkResults('runner_throughput')
+    for subjects_number in parse_sizes(options.sizes):
+        directory = tempfile.mkdtemp(prefix='morphologist_benchmark_')
+        try:
+            benchmark_study_size(results, os.path.join(directory, 'study'),
+                                 subjects_number, options)
+        finally:
+            shutil.rmtree(directory)
+    finish_benchmark(results, options)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+''' Benchmark of the study lifecycle operations on synthetic studies of the
+mock analysis:
+
+    python -m morphologist.tests.benchmarks.study_lifecycle \
+        -s 10,100,1000,10000 -o results.json [-c baseline.json]
+'''
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+from optparse import OptionParser
+
+from morphologist.core.gui.qt_backend import QtCore
+from morphologist.core.study import Study
+from morphologist.core.runner import SomaWorkflowRunner
+from morphologist.core.gui.study_model import LazyStudyModel
+# registers MockAnalysis in the AnalysisFactory
+import morphologist.core.tests.mocks.analysis
+from morphologist.tests.benchmarks import BenchmarkResults, \
+    add_benchmark_options, parse_sizes, finish_benchmark
+
+
+ANALYSIS_TYPE = 'MockAnalysis'
+DEFAULT_SIZES = [10, 100, 1000]
+
+
+def create_organized_directory(directory, subjects_number, groups_number=4):
+    ''' Write the input files of a synthetic study, as expected by
+    Study.from_organized_directory
+    '''
+    for i in range(subjects_number):
+        groupname = 'group%d' % (i % groups_number)
+        subjectname = 'subject%05d' % i
+        acquisition_directory = os.path.join(
+            directory, groupname, subjectname, 't1mri', 'default_acquisition')
+        os.makedirs(acquisition_directory)
+        open(os.path.join(acquisition_directory, subjectname + '.nii'),
+             'w').close()
+
+
+def create_some_output_files(study, ratio=0.5):
+    ''' Write the outputs of a part of the subjects, so that results sweeps
+    see both cases
+    '''
+    subject_ids = list(study.subjects)
+    for subject_id in subject_ids[:int(len(subject_ids) * ratio)]:
+        analysis = study.analyses[subject_id]
+        analysis.propagate_parameters()
+        for parameter_name in analysis.get_output_file_parameter_names():
+            filename = getattr(analysis.pipeline, parameter_name)
+            dirname = os.path.dirname(filename)
+            if not os.path.isdir(dirname):
+                os.makedirs(dirname)
+            open(filename, 'w').close()
+
+
+def benchmark_study_size(results, directory, subjects_number, repeat):
+    create_organized_directory(directory, subjects_number)
+    study = results.measure(
+        'from_organized_directory', subjects_number,
+        lambda: Study.from_organized_directory(ANALYSIS_TYPE, directory),
+        repeat)
+    create_some_output_files(study)
+    results.measure('save_to_backup_file', subjects_number,
+                    study.save_to_backup_file, repeat)
+    study = results.measure(
+        'from_file', subjects_number,
+        lambda: Study.from_file(study.backup_filepath), repeat)
+    results.measure(
+        'has_all_results_sweep', subjects_number,
+        lambda: [analysis.has_all_results()
+                 for analysis in study.analyses.values()], repeat)
+    results.measure(
+        'has_some_results_sweep', subjects_number,
+        lambda: [analysis.has_some_results()
+                 for analysis in study.analyses.values()], repeat)
+    runner = SomaWorkflowRunner(study)
+    results.measure('_create_workflow', subjects_number,
+                    lambda: runner._create_workflow(list(study.subjects)),
+                    repeat)
+    study_model = LazyStudyModel(study, runner)
+    results.measure('LazyStudyModel._update_all_status', subjects_number,
+                    study_model._update_all_status, repeat)
+    study_model._timer.stop()
+
+
+def main():
+    parser = OptionParser(usage='%prog [options]\n\n' + __doc__)
+    add_benchmark_options(parser, DEFAULT_SIZES)
+    options, args = parser.parse_args()
+    # QObjects of the GUI models need an application
+    application = QtCore.QCoreApplication.instance()
+    if application is None:
+        application = QtCore.QCoreApplication([])
+    results = BenchmarkResults('study_lifecycle')
+    for subjects_number in parse_sizes(options.sizes):
+        directory = tempfile.mkdtemp(prefix='morphologist_benchmark_')
+        try:
+            benchmark_study_size(results, os.path.join(directory, 'study'),
+                                 subjects_number, options.repeat)
+        finally:
+            shutil.rmtree(directory)
+    finish_benchmark(results, options)
+
+
+if __name__ == '__main__':
+    main()
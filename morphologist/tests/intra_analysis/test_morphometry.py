@@ -0,0 +1,73 @@
+from __future__ import absolute_import
+import os
+import sys
+import stat
+import shutil
+import tempfile
+import unittest
+
+from morphologist.intra_analysis.commands.morphometry import Morphometry, \
+    MorphometryError, LEFT, RIGHT
+
+
+FAKE_SIMORPHO = '''#!%s
+import sys
+arguments = sys.argv[1:]
+graph = arguments[arguments.index('-g') + 1]
+prefix = arguments[arguments.index('-o') + 1]
+if 'bad' in graph:
+    sys.stderr.write('cannot read graph %%s' %% graph)
+    sys.exit(1)
+with open(prefix + '.csv', 'w') as f:
+    f.write('label;surface\\n')
+'''
+
+
+class FakeModelsMorphometry(Morphometry):
+    _models = {}
+    globs_count = 0
+
+    @classmethod
+    def _glob_model(cls, side, normalized):
+        cls.globs_count += 1
+        return '%s_model.arg' % side
+
+
+class TestMorphometry(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='morphologist_morphometry_')
+        simorpho = os.path.join(self.directory, 'siMorpho')
+        with open(simorpho, 'w') as f:
+            f.write(FAKE_SIMORPHO % sys.executable)
+        os.chmod(simorpho, os.stat(simorpho).st_mode | stat.S_IXUSR)
+        FakeModelsMorphometry.simorpho_command = simorpho
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_run_batch(self):
+        jobs = []
+        for subject in ['s1', 's2', 'bad_s3']:
+            for side in [LEFT, RIGHT]:
+                jobs.append(('%s_%s.arg' % (side, subject), side,
+                             os.path.join(self.directory,
+                                          '%s_%s.csv' % (side, subject))))
+        report = FakeModelsMorphometry.run_batch(jobs, normalized=False,
+                                                 workers=3)
+        self.assertEqual(len(report.succeeded), 4)
+        self.assertEqual([result.labeled_sulci for result in report.failed],
+                         ['left_bad_s3.arg', 'right_bad_s3.arg'])
+        self.assert_('cannot read graph' in report.failed[0].error)
+        self.assert_(os.path.exists(jobs[0][2]))
+        # models are resolved once per side
+        self.assertEqual(FakeModelsMorphometry.globs_count, 2)
+        self.assertRaises(MorphometryError, FakeModelsMorphometry.run,
+                          'bad.arg', LEFT, False,
+                          os.path.join(self.directory, 'bad.csv'))
+        self.assertEqual(FakeModelsMorphometry.globs_count, 2)
+
+
+if __name__ == '__main__':
+    suite = unittest.TestLoader().loadTestsFromTestCase(TestMorphometry)
+    unittest.TextTestRunner(verbosity=2).run(suite)